@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import Job
 
-# Register your models here.
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "processed", "total", "attempts", "created_at", "finished_at")
+    search_fields = ("id", "kind")
+    list_filter = ("kind", "status")
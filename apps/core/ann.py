@@ -0,0 +1,331 @@
+"""Приближённый поиск ближайших соседей (IVF-flat) по эмбеддингам точек, отдельный индекс на город.
+
+Основная часть индекса — вектора, отсортированные по спискам (кластерам), так что каждый список
+лежит непрерывным куском и ищется одним матричным умножением. Точечные обновления копятся
+в небольшой дельте (ищется перебором) с «надгробиями» в основной части; когда дельта
+разрастается, раскладка пересобирается без переобучения центроидов.
+
+Основная часть хранится в компактном виде по settings.EMBEDDING_COMPACT_MODE (см. quantization.py).
+"""
+import fcntl
+import logging
+import os
+import tempfile
+import threading
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from . import embedding_store
+from .quantization import Codec, get_codec, normalize
+
+logger = logging.getLogger(__name__)
+
+# Сколько списков просматривает поиск: на 20–100 тыс. точек recall@10 около 0.95 (bench_ann)
+DEFAULT_NPROBE = 16
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLE = 30000
+# Когда дельта больше max(MIN, доля от основной части) — пересобираем раскладку
+DELTA_COMPACT_MIN = 1000
+DELTA_COMPACT_RATIO = 0.02
+
+
+def n_lists_for(size: int) -> int:
+    return int(min(max(1, 4 * np.sqrt(size)), 4096))
+
+
+def train_centroids(vectors: np.ndarray, n_lists: int, seed: int = 0) -> np.ndarray:
+    """Сферический k-means на подвыборке."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > KMEANS_SAMPLE:
+        vectors = vectors[rng.choice(len(vectors), KMEANS_SAMPLE, replace=False)]
+    n_lists = min(n_lists, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = np.bincount(assign, minlength=n_lists) == 0
+        # пустые кластеры перезапускаем со случайных точек
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    def __init__(self, centroids, codes, scales, ids, offsets, codec: Codec):
+        self.centroids = centroids
+        self.codes = codes
+        self.scales = scales
+        self.ids = ids
+        self.offsets = offsets
+        self.codec = codec
+        self.alive = np.ones(len(ids), dtype=bool)
+        self.row_of = {point_id: row for row, point_id in enumerate(ids.tolist())}
+        # (ids, vectors) дельты меняем целиком, чтобы поиск без блокировки видел согласованную пару.
+        # Вектора дельты — float32 уже в пространстве индекса
+        self.delta = ([], np.empty((0, centroids.shape[1]), dtype=np.float32))
+        self.lock = threading.Lock()
+
+    @property
+    def delta_ids(self) -> list:
+        return self.delta[0]
+
+    @property
+    def delta_vectors(self) -> np.ndarray:
+        return self.delta[1]
+
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return int(self.alive.sum()) + len(self.delta_ids)
+
+    @classmethod
+    def build(cls, ids, vectors, n_lists: int | None = None, centroids=None, codec: Codec | None = None,
+              prepared: bool = False) -> "IVFIndex":
+        """prepared=True — вектора уже переведены в пространство индекса (пересборка раскладки)."""
+        codec = codec or get_codec()
+        vectors = normalize(vectors) if prepared else codec.transform(vectors)
+        ids = np.asarray(ids, dtype=str)
+        if centroids is None:
+            centroids = train_centroids(vectors, n_lists or n_lists_for(len(vectors)))
+        assign = np.argmax(vectors @ centroids.T, axis=1) if len(vectors) else np.empty(0, dtype=np.int64)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assign, minlength=len(centroids)))
+        codes, scales = codec.encode(vectors[order])
+        return cls(centroids, codes, scales, ids[order], offsets, codec)
+
+    def search(self, vector, k: int = 10, nprobe: int = DEFAULT_NPROBE) -> list[tuple[str, float]]:
+        query = self.codec.transform(vector)
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+        rows, sims = [], []
+        for c in probes:
+            start, end = self.offsets[c], self.offsets[c + 1]
+            if start == end:
+                continue
+            scales = self.scales[start:end] if self.scales is not None else None
+            part = self.codec.scores(query, self.codes[start:end], scales)
+            part[~self.alive[start:end]] = -np.inf
+            rows.append(np.arange(start, end))
+            sims.append(part)
+
+        delta_ids, delta_vectors = self.delta
+        if delta_ids:
+            rows.append(-1 - np.arange(len(delta_ids)))
+            sims.append(delta_vectors @ query)
+        if not rows:
+            return []
+
+        rows = np.concatenate(rows)
+        sims = np.concatenate(sims)
+        k = min(k, len(sims))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [
+            (str(self.ids[rows[i]]) if rows[i] >= 0 else delta_ids[-1 - rows[i]], float(sims[i]))
+            for i in top
+            if sims[i] > -np.inf
+        ]
+
+    def upsert(self, ids, vectors) -> None:
+        """Точечное обновление: старые строки помечаем удалёнными, новые кладём в дельту."""
+        self.add_prepared(ids, self.codec.transform(np.atleast_2d(vectors)))
+
+    def add_prepared(self, ids, vectors) -> None:
+        with self.lock:
+            replaced = set(ids)
+            keep = [i for i, point_id in enumerate(self.delta_ids) if point_id not in replaced]
+            delta_ids = [self.delta_ids[i] for i in keep] + list(ids)
+            delta_vectors = np.concatenate([self.delta_vectors[keep], np.asarray(vectors, dtype=np.float32)])
+            self.delta = (delta_ids, delta_vectors)
+            for point_id in ids:
+                row = self.row_of.get(point_id)
+                if row is not None:
+                    self.alive[row] = False
+
+    def needs_compaction(self) -> bool:
+        return len(self.delta_ids) > max(DELTA_COMPACT_MIN, DELTA_COMPACT_RATIO * len(self.ids))
+
+    def compacted(self) -> "IVFIndex":
+        scales = self.scales[self.alive] if self.scales is not None else None
+        ids = np.concatenate([self.ids[self.alive], np.asarray(self.delta_ids, dtype=str)])
+        vectors = np.concatenate([self.codec.decode(self.codes[self.alive], scales), self.delta_vectors])
+        return IVFIndex.build(ids, vectors, centroids=self.centroids, codec=self.codec, prepared=True)
+
+
+def index_dir() -> Path:
+    return Path(settings.ANN_INDEX_DIR)
+
+
+def _paths(city_id) -> tuple[Path, Path]:
+    return index_dir() / f"{city_id}.npz", index_dir() / f"{city_id}.delta.npz"
+
+
+def _atomic_savez(path: Path, **arrays) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def save_index(city_id, index: IVFIndex) -> None:
+    main_path, delta_path = _paths(city_id)
+    if index.delta_ids:
+        index = index.compacted()
+    arrays = dict(
+        centroids=index.centroids, codes=index.codes, ids=index.ids, offsets=index.offsets,
+        mode=np.array(index.codec.mode), **index.codec.params(),
+    )
+    if index.scales is not None:
+        arrays["scales"] = index.scales
+    _atomic_savez(main_path, **arrays)
+    delta_path.unlink(missing_ok=True)
+
+
+def _save_delta(city_id, index: IVFIndex) -> None:
+    _, delta_path = _paths(city_id)
+    _atomic_savez(
+        delta_path,
+        vectors=index.delta_vectors, ids=np.asarray(index.delta_ids, dtype=str).reshape(-1),
+    )
+
+
+def load_index(city_id) -> IVFIndex | None:
+    main_path, delta_path = _paths(city_id)
+    if not main_path.exists():
+        return None
+    with np.load(main_path) as data:
+        codec = get_codec(str(data["mode"]), {key: data[key] for key in data.files})
+        index = IVFIndex(
+            data["centroids"], data["codes"], data["scales"] if "scales" in data.files else None,
+            data["ids"], data["offsets"], codec,
+        )
+    if delta_path.exists():
+        with np.load(delta_path) as data:
+            index.add_prepared(data["ids"].tolist(), data["vectors"])
+    return index
+
+
+# Индексы в памяти процесса: city_id -> (mtime файлов, индекс)
+_indexes: dict = {}
+_lock = threading.Lock()
+
+
+def _mtimes(city_id) -> tuple:
+    return tuple(p.stat().st_mtime_ns if p.exists() else 0 for p in _paths(city_id))
+
+
+def get_index(city_id) -> IVFIndex | None:
+    """Индекс города, загружается при первом обращении; перечитываем с диска, если его обновил другой процесс.
+
+    Нет файлов или они не читаются — None (поиск без семантической части), попробуем снова при их смене.
+    """
+    mtimes = _mtimes(city_id)
+    cached = _indexes.get(city_id)
+    if cached is not None and cached[0] == mtimes:
+        return cached[1]
+    with _lock:
+        try:
+            index = load_index(city_id)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            logger.warning("ANN-индекс города %s не читается", city_id, exc_info=True)
+            index = None
+        _indexes[city_id] = (mtimes, index)
+    return index
+
+
+def preload() -> list:
+    """Загружает в память индексы всех городов, для которых есть файлы (ANN_PRELOAD)."""
+    cities = sorted(path.name[:-len(".npz")] for path in index_dir().glob("*.npz")
+                    if not path.name.endswith(".delta.npz"))
+    for city_id in cities:
+        get_index(city_id)
+    return cities
+
+
+def _publish(city_id, index: IVFIndex) -> None:
+    with _lock:
+        _indexes[city_id] = (_mtimes(city_id), index)
+
+
+@contextmanager
+def _city_lock(city_id):
+    """flock на {city_id}.lock: файлы индекса города читает-меняет-заменяет один процесс (и поток) за раз."""
+    path = index_dir() / f"{city_id}.lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _rebuild(city_id, snapshot=None) -> IVFIndex | None:
+    snapshot = snapshot or embedding_store.current_snapshot()
+    if snapshot is None:
+        return None
+    rows = snapshot.city_rows(city_id)
+    if not rows.size:
+        return None
+
+    index = IVFIndex.build(snapshot.ids[rows], snapshot.vectors[rows])
+    save_index(city_id, index)
+    _publish(city_id, index)
+    return index
+
+
+def build_city_index(city_id, snapshot=None) -> IVFIndex | None:
+    """Полная пересборка индекса города из mmap-хранилища эмбеддингов."""
+    with _city_lock(city_id):
+        return _rebuild(city_id, snapshot)
+
+
+def upsert_vectors(city_id, ids, vectors) -> None:
+    """Инкрементальное обновление индекса после пересчёта эмбеддингов."""
+    ids = list(ids)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    with _city_lock(city_id):
+        # под блокировкой get_index перечитает дельту, если её только что записал другой процесс,
+        # и наша запись не затрёт его вектора
+        index = get_index(city_id)
+        if index is None:
+            # пустой индекс (все точки удалены) — тоже индекс: len() == 0, но пересобирать его не нужно
+            index = _rebuild(city_id)
+        if index is None:
+            index = IVFIndex.build(ids, vectors)
+            save_index(city_id, index)
+            _publish(city_id, index)
+            return
+
+        index.upsert(ids, vectors)
+        if index.needs_compaction():
+            save_index(city_id, index)
+            index = load_index(city_id)
+        else:
+            _save_delta(city_id, index)
+        _publish(city_id, index)
+
+
+def search(city_id, vector, k: int = 10) -> list[tuple[str, float]]:
+    index = get_index(city_id)
+    if index is None:
+        return []
+    return index.search(vector, k)
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.utils.module_loading import autodiscover_modules
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.core"
+
+    def ready(self):
+        # регистрируем обработчики фоновых задач из apps/*/tasks.py
+        autodiscover_modules("tasks")
+        if settings.ANN_PRELOAD:
+            # первый поиск в городе не ждёт чтения индекса с диска; без настройки — загрузка по требованию
+            from . import ann
+
+            ann.preload()
@@ -0,0 +1,139 @@
+"""Хранилище эмбеддингов точек в виде одной непрерывной float32-матрицы на диске.
+
+Снапшот — каталог с vectors.npy (N x D, float32), ids.npy и cities.npy. Воркеры открывают его
+через mmap: данные не копируются в память процесса и делятся между воркерами через page cache.
+Файл CURRENT указывает на активный снапшот и подменяется атомарно (os.replace), поэтому
+читатели видят либо старый, либо новый снапшот целиком, но никогда недописанный.
+"""
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+EXPORT_CHUNK_SIZE = 2000
+# Сколько старых снапшотов оставлять на диске (открытые mmap переживут удаление в любом случае)
+KEEP_SNAPSHOTS = 2
+
+
+class EmbeddingSnapshot:
+    def __init__(self, path: Path):
+        self.path = path
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+        self.ids = np.load(path / "ids.npy")
+        self.cities = np.load(path / "cities.npy")
+        self.row_of = {point_id: row for row, point_id in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    def get(self, point_id) -> np.ndarray | None:
+        row = self.row_of.get(point_id)
+        return None if row is None else self.vectors[row]
+
+    def city_rows(self, city_id) -> np.ndarray:
+        return np.flatnonzero(self.cities == city_id)
+
+
+def store_dir() -> Path:
+    return Path(settings.EMBEDDING_STORE_DIR)
+
+
+def _current_file() -> Path:
+    return store_dir() / "CURRENT"
+
+
+def export_snapshot() -> EmbeddingSnapshot | None:
+    """Выгружаем все PointEmbedding в новый снапшот и делаем его текущим."""
+    from apps.routes.models import PointEmbedding
+
+    qs = PointEmbedding.objects.order_by("point_id")
+    total = qs.count()
+    if not total:
+        return None
+
+    name = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    tmp = store_dir() / "snapshots" / f".{name}.tmp"
+    tmp.mkdir(parents=True)
+
+    vectors = None
+    ids, cities = [], []
+    rows = qs.values_list("point_id", "point__city_id", "embedding").iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for point_id, city_id, embedding in rows:
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(
+                tmp / "vectors.npy", mode="w+", dtype=np.float32, shape=(total, len(embedding))
+            )
+        if len(ids) == total:
+            # точки, добавленные во время выгрузки, попадут в следующий снапшот
+            break
+        vectors[len(ids)] = embedding
+        ids.append(point_id)
+        cities.append(city_id)
+
+    if vectors is None:
+        # все строки удалили во время выгрузки — как и при пустой таблице, текущий снапшот не трогаем
+        shutil.rmtree(tmp, ignore_errors=True)
+        return None
+    vectors.flush()
+    del vectors
+    if len(ids) < total:
+        # часть строк удалили во время выгрузки — обрезаем матрицу
+        full = np.load(tmp / "vectors.npy", mmap_mode="r")
+        np.save(tmp / "vectors.part.npy", full[:len(ids)])
+        del full
+        os.replace(tmp / "vectors.part.npy", tmp / "vectors.npy")
+    np.save(tmp / "ids.npy", np.asarray(ids, dtype=str))
+    np.save(tmp / "cities.npy", np.asarray(cities, dtype=str))
+
+    final = store_dir() / "snapshots" / name
+    os.replace(tmp, final)
+    _switch_current(name)
+    _cleanup(keep=name)
+    return current_snapshot()
+
+
+def _switch_current(name: str) -> None:
+    tmp = store_dir() / f"CURRENT.{os.getpid()}.tmp"
+    tmp.write_text(name)
+    os.replace(tmp, _current_file())
+
+
+def _cleanup(keep: str) -> None:
+    snapshots = sorted(
+        (p for p in (store_dir() / "snapshots").iterdir() if not p.name.startswith(".")),
+        key=lambda p: int(p.name.split("-")[0]),
+    )
+    for path in snapshots[:-KEEP_SNAPSHOTS]:
+        if path.name != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+_current: tuple | None = None
+_lock = threading.Lock()
+
+
+def current_snapshot() -> EmbeddingSnapshot | None:
+    """Текущий снапшот; если CURRENT подменили — переоткрываем."""
+    global _current
+    try:
+        stamp = _current_file().stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cached = _current
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with _lock:
+        name = _current_file().read_text().strip()
+        snapshot = EmbeddingSnapshot(store_dir() / "snapshots" / name)
+        _current = (stamp, snapshot)
+    return snapshot
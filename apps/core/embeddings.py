@@ -0,0 +1,295 @@
+"""Провайдеры эмбеддингов и постоянный кеш перед ними.
+
+Провайдер выбирается настройкой EMBEDDING_PROVIDER:
+    openai  — API OpenAI (клиент создаётся при первом запросе, а не при импорте);
+    hashing — детерминированная локальная модель на хешировании слов и триграмм, без сети;
+    fake    — детерминированный «случайный» вектор по тексту, для бенчмарков и тестов.
+
+get_provider() оборачивает провайдер в CachedProvider: ключ — sha256(model + text),
+спереди LRU-словарь в памяти процесса, за ним sqlite-файл EMBEDDING_CACHE_PATH,
+который при превышении EMBEDDING_CACHE_MAX_MB чистится от давно не читанных записей.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+OPENAI_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 1536
+# Доля записей, удаляемых за одну чистку дискового кеша, и как часто проверять его размер
+CACHE_EVICT_FRACTION = 0.1
+CACHE_CHECK_EVERY = 200
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class EmbeddingProvider:
+    """Интерфейс провайдера: model — имя модели (попадает в ключ кеша и в PointEmbedding.model)."""
+    model = ""
+    dim = EMBEDDING_DIM
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+    def embed_one(self, text: str) -> list[float]:
+        return self.embed([text])[0]
+
+
+class OpenAIProvider(EmbeddingProvider):
+    def __init__(self, model: str = OPENAI_MODEL, api_key: str | None = None):
+        self.model = model
+        self.api_key = api_key
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key or settings.OPENAI_API_KEY)
+        return self._client
+
+    def embed(self, texts):
+        response = self.client.embeddings.create(model=self.model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class HashingProvider(EmbeddingProvider):
+    """Локальная модель: слова и символьные триграммы хешируются в dim корзин со знаком.
+
+    Похожие тексты дают близкие вектора, поэтому семантический поиск работает и без API,
+    хоть и заметно хуже настоящей модели.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.model = f"local-hashing-{dim}"
+
+    def _features(self, text: str):
+        for word in _TOKEN_RE.findall(text.lower()):
+            yield word, 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.5
+
+    def embed_one(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            vector[digest % self.dim] += weight if digest >> 63 else -weight
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed(self, texts):
+        return [self.embed_one(text) for text in texts]
+
+
+class FakeProvider(EmbeddingProvider):
+    """Вектор детерминированно зависит от текста; latency_ms имитирует сетевую задержку запроса."""
+
+    def __init__(self, dim: int = EMBEDDING_DIM, latency_ms: float = 0.0):
+        self.dim = dim
+        self.model = f"fake-{dim}"
+        self.latency_ms = latency_ms
+        self.requests = 0
+
+    def embed(self, texts):
+        self.requests += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Постоянный кеш векторов в sqlite (WAL): переживает рестарты и общий для процессов.
+
+    Размер ограничен max_bytes: при превышении удаляется доля записей с самым старым accessed_at.
+    Соединение своё у каждого потока.
+    """
+
+    def __init__(self, path, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, vector BLOB NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: list[str]) -> dict:
+        if not keys:
+            return {}
+        conn = self._connection()
+        found = {}
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+            ).fetchall()
+            found.update((key, np.frombuffer(blob, dtype=np.float32).tolist()) for key, blob in rows)
+        if found:
+            conn.executemany(
+                "UPDATE embeddings SET accessed_at = ? WHERE key = ?", [(time.time(), key) for key in found]
+            )
+        return found
+
+    def set_many(self, items: dict) -> None:
+        if not items:
+            return
+        now = time.time()
+        conn = self._connection()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, accessed_at) VALUES (?, ?, ?)",
+            [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()],
+        )
+        self._writes += len(items)
+        if self._writes >= CACHE_CHECK_EVERY:
+            self._writes = 0
+            self.evict()
+
+    def size_bytes(self) -> int:
+        conn = self._connection()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0] - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return page_size * pages
+
+    def evict(self) -> int:
+        """Удаляем давно не читанные записи, пока файл больше max_bytes. Возвращает число удалённых."""
+        conn = self._connection()
+        removed = 0
+        while self.size_bytes() > self.max_bytes:
+            count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if not count:
+                break
+            batch = max(1, int(count * CACHE_EVICT_FRACTION))
+            removed += conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?)", (batch,)
+            ).rowcount
+        return removed
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM embeddings")
+
+
+class CachedProvider(EmbeddingProvider):
+    """Провайдер за двумя уровнями кеша; в API уходят только тексты, которых нет ни в одном."""
+
+    def __init__(self, provider: EmbeddingProvider, disk: DiskCache | None = None, memory_size: int = 10_000):
+        self.provider = provider
+        self.disk = disk
+        self.memory_size = memory_size
+        self.memory: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self):
+        return self.provider.model
+
+    @property
+    def dim(self):
+        return self.provider.dim
+
+    def _remember(self, key, vector) -> None:
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def embed(self, texts):
+        keys = [cache_key(self.model, text) for text in texts]
+        found = {}
+        with self.lock:
+            for key in keys:
+                vector = self.memory.get(key)
+                if vector is not None:
+                    self.memory.move_to_end(key)
+                    found[key] = vector
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing and self.disk is not None:
+            from_disk = self.disk.get_many(missing)
+            found.update(from_disk)
+            missing = [key for key in missing if key not in from_disk]
+
+        computed = {}
+        if missing:
+            text_of = dict(zip(keys, texts))
+            vectors = self.provider.embed([text_of[key] for key in missing])
+            computed = dict(zip(missing, vectors))
+            if self.disk is not None:
+                self.disk.set_many(computed)
+            found.update(computed)
+
+        with self.lock:
+            self.misses += len(computed)
+            self.hits += len(keys) - len(computed)
+            for key in found:
+                self._remember(key, found[key])
+        return [found[key] for key in keys]
+
+
+def make_provider(name: str) -> EmbeddingProvider:
+    if name == "openai":
+        return OpenAIProvider(settings.EMBEDDING_MODEL)
+    if name == "hashing":
+        return HashingProvider(settings.EMBEDDING_DIM)
+    if name == "fake":
+        return FakeProvider(settings.EMBEDDING_DIM)
+    raise ValueError(f"Неизвестный провайдер эмбеддингов: {name}")
+
+
+_provider: CachedProvider | None = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> CachedProvider:
+    """Провайдер из настроек за кешем; создаётся при первом обращении, один на процесс."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                disk = None
+                if settings.EMBEDDING_CACHE_PATH:
+                    disk = DiskCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_MB * 2**20)
+                _provider = CachedProvider(
+                    make_provider(settings.EMBEDDING_PROVIDER), disk, settings.EMBEDDING_MEMORY_CACHE_SIZE
+                )
+    return _provider
+
+
+def reset_provider() -> None:
+    """Сбросить провайдер (после смены настроек, в тестах)."""
+    global _provider
+    with _provider_lock:
+        _provider = None
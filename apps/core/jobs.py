@@ -0,0 +1,174 @@
+"""Фоновые задачи на таблице jobs без внешнего брокера.
+
+Задача ставится через enqueue(), выполняет её воркер (manage.py run_jobs). Обработчик периодически
+сохраняет чекпоинт — после падения воркера задача подхватывается снова и продолжает с него.
+"""
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Задача в статусе running без heartbeat дольше этого времени считается брошенной
+STALE_AFTER = timedelta(minutes=5)
+MAX_ATTEMPTS = 3
+
+_handlers: dict = {}
+
+
+class PermanentJobError(Exception):
+    """Ошибка, которую бессмысленно повторять (например, неверные параметры): задача сразу failed."""
+
+
+def register(kind: str):
+    """Декоратор обработчика задачи: handler(job: JobContext) -> dict с результатом."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind: str, params: dict | None = None, user=None) -> Job:
+    if kind not in _handlers:
+        raise ValueError(f"Неизвестный тип задачи: {kind}")
+    return Job.objects.create(kind=kind, params=params or {}, user_id=getattr(user, "id", None))
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next(worker: str, kinds=None) -> Job | None:
+    """Забираем следующую задачу: свежую из очереди или брошенную упавшим воркером.
+
+    Захват — условный UPDATE по старому статусу и heartbeat, так что два воркера
+    не получат одну задачу даже без SELECT ... FOR UPDATE.
+    """
+    now = timezone.now()
+    stale = now - STALE_AFTER
+    candidates = Job.objects.filter(status=Job.Status.QUEUED) | Job.objects.filter(
+        status=Job.Status.RUNNING, heartbeat_at__lt=stale
+    )
+    if kinds:
+        candidates = candidates.filter(kind__in=kinds)
+
+    for job in candidates.order_by("created_at")[:10]:
+        claimed = Job.objects.filter(
+            pk=job.pk, status=job.status, heartbeat_at=job.heartbeat_at
+        ).update(
+            status=Job.Status.RUNNING,
+            worker=worker,
+            heartbeat_at=now,
+            started_at=job.started_at or now,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+class JobContext:
+    """То, что видит обработчик: параметры, чекпоинт и запись прогресса."""
+
+    def __init__(self, job: Job):
+        self.job = job
+
+    @property
+    def params(self) -> dict:
+        return self.job.params
+
+    @property
+    def user(self):
+        return self.job.user
+
+    @property
+    def checkpoint(self) -> str | None:
+        return self.job.checkpoint or None
+
+    @property
+    def result(self) -> dict:
+        return self.job.result
+
+    def set_total(self, total: int) -> None:
+        if self.job.total is None:
+            self.job.total = total
+            Job.objects.filter(pk=self.job.pk).update(total=total)
+
+    def progress(self, checkpoint, processed: int = 0, **counters) -> None:
+        """Сохраняем чекпоинт, прогресс и накопленные счётчики результата одним UPDATE."""
+        for key, value in counters.items():
+            self.job.result[key] = self.job.result.get(key, 0) + value
+        self.job.checkpoint = str(checkpoint)
+        self.job.processed += processed
+        Job.objects.filter(pk=self.job.pk).update(
+            checkpoint=self.job.checkpoint,
+            processed=F("processed") + processed,
+            result=self.job.result,
+            heartbeat_at=timezone.now(),
+        )
+
+
+def run_job(job: Job) -> Job:
+    handler = _handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"Неизвестный тип задачи: {job.kind}")
+        result = handler(JobContext(job)) or {}
+    except PermanentJobError as exc:
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.Status.FAILED, error=str(exc), finished_at=timezone.now()
+        )
+    except Exception:
+        logger.exception("Задача %s (%s) упала", job.pk, job.kind)
+        failed = job.attempts >= MAX_ATTEMPTS
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.Status.FAILED if failed else Job.Status.QUEUED,
+            error=traceback.format_exc(),
+            finished_at=timezone.now() if failed else None,
+        )
+    else:
+        job.result.update(result)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.Status.DONE,
+            result=job.result,
+            error="",
+            finished_at=timezone.now(),
+            heartbeat_at=timezone.now(),
+        )
+    job.refresh_from_db()
+    return job
+
+
+def run_job_in_pool(job_id: str) -> tuple[str, str]:
+    """Выполнение уже захваченной задачи в процессе пула; возвращает (id, статус)."""
+    job = run_job(Job.objects.get(pk=job_id))
+    return job.pk, job.status
+
+
+def job_status(job: Job) -> dict:
+    now = timezone.now()
+    elapsed = ((job.finished_at or now) - job.started_at).total_seconds() if job.started_at else 0.0
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "processed": job.processed,
+        "total": job.total,
+        "progress": round(job.processed / job.total, 4) if job.total else None,
+        "throughput_per_second": round(job.processed / elapsed, 2) if elapsed > 0 else None,
+        "checkpoint": job.checkpoint or None,
+        "attempts": job.attempts,
+        "result": job.result,
+        "error": job.error or None,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
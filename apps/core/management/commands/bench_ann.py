@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.core.ann import IVFIndex, n_lists_for
+from apps.core.quantization import get_codec
+
+
+def clustered_vectors(n: int, dim: int, clusters: int, rng) -> np.ndarray:
+    """Синтетические «эмбеддинги»: смесь гауссиан вокруг случайных направлений."""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(clusters, size=n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк ANN-индекса: латентность top-k и recall@k против полного перебора"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--points", type=int, default=100_000)
+        parser.add_argument("--dim", type=int, default=1536)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 12, 24])
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--mode", default="float32", choices=["float32", "float16", "int8"])
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        n, dim, k = options["points"], options["dim"], options["k"]
+
+        vectors = clustered_vectors(n, dim, clusters=max(n // 200, 1), rng=rng)
+        ids = [f"p{i}" for i in range(n)]
+        queries = vectors[rng.choice(n, options["queries"], replace=False)]
+        queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+
+        started = time.perf_counter()
+        index = IVFIndex.build(ids, vectors, codec=get_codec(options["mode"]))
+        self.stdout.write(
+            f"build: {time.perf_counter() - started:.1f} s, {n} points, dim {dim}, {n_lists_for(n)} lists"
+        )
+
+        exact, brute_ms = [], []
+        for query in queries:
+            started = time.perf_counter()
+            sims = vectors @ (query / np.linalg.norm(query))
+            top = np.argpartition(-sims, k - 1)[:k]
+            brute_ms.append((time.perf_counter() - started) * 1000)
+            exact.append({ids[i] for i in top})
+        self.stdout.write(f"brute force: p50 {np.percentile(brute_ms, 50):.2f} ms")
+
+        self.stdout.write(f'{"nprobe":>7} {"p50, ms":>8} {"p99, ms":>8} {f"recall@{k}":>10}')
+        for nprobe in options["nprobe"]:
+            timings, recalls = [], []
+            for query, truth in zip(queries, exact):
+                started = time.perf_counter()
+                found = index.search(query, k, nprobe=nprobe)
+                timings.append((time.perf_counter() - started) * 1000)
+                recalls.append(len(truth & {point_id for point_id, _ in found}) / k)
+            p50, p99 = np.percentile(timings, [50, 99])
+            self.stdout.write(f"{nprobe:>7} {p50:>8.3f} {p99:>8.3f} {np.mean(recalls):>10.3f}")
@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core import embedding_store
+from apps.core.ann import IVFIndex
+from apps.core.quantization import Codec, Float16Codec, Int8Codec, fit_pca, normalize
+from .bench_ann import clustered_vectors
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк компактных представлений: память, латентность и потеря recall@k против float32"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--points", type=int, default=50_000)
+        parser.add_argument("--dim", type=int, default=1536)
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--nprobe", type=int, default=8)
+        parser.add_argument("--pca-dims", type=int, nargs="+", default=[128, 256, 512])
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--snapshot", action="store_true",
+            help="Брать вектора из текущего снапшота эмбеддингов вместо синтетики (для PCA показательнее)",
+        )
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        n, dim, k, nprobe = options["points"], options["dim"], options["k"], options["nprobe"]
+
+        if options["snapshot"]:
+            snapshot = embedding_store.current_snapshot()
+            if snapshot is None:
+                raise CommandError("Нет снапшота эмбеддингов: сначала выполните export_embeddings")
+            vectors = normalize(snapshot.vectors[:n])
+            n, dim = vectors.shape
+        else:
+            vectors = clustered_vectors(n, dim, clusters=max(n // 200, 1), rng=rng)
+        ids = [f"p{i}" for i in range(n)]
+        queries = vectors[rng.choice(n, options["queries"], replace=False)]
+        queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        exact = [set(np.argpartition(-(vectors @ query), k - 1)[:k].tolist()) for query in queries]
+
+        codecs = [Codec(), Float16Codec(), Int8Codec()]
+        for pca_dim in options["pca_dims"]:
+            if pca_dim < dim:
+                codecs.append(fit_pca(vectors, pca_dim))
+
+        # Центроиды обучаем один раз во float32, чтобы сравнивать только представление векторов
+        base = IVFIndex.build(ids, vectors, codec=Codec())
+        self.stdout.write(f"{n} points, dim {dim}, {len(base.centroids)} lists, nprobe {nprobe}")
+        self.stdout.write(
+            f'{"mode":>10} {"MB":>8} {"brute p50":>10} {f"recall@{k}":>10}'
+            f' {"ivf p50":>8} {"ivf p99":>8} {f"ivf r@{k}":>9}'
+        )
+        for codec in codecs:
+            name = f"pca{codec.dim}" if codec.mode == "pca" else codec.mode
+            transformed = codec.transform(vectors)
+            codes, scales = codec.encode(transformed)
+            centroids = None if codec.mode == "pca" else base.centroids
+            index = IVFIndex.build(ids, transformed, centroids=centroids, codec=codec, prepared=True)
+
+            brute_ms, brute_recall = [], []
+            for query, truth in zip(queries, exact):
+                started = time.perf_counter()
+                sims = codec.scores(codec.transform(query), codes, scales)
+                top = np.argpartition(-sims, k - 1)[:k]
+                brute_ms.append((time.perf_counter() - started) * 1000)
+                brute_recall.append(len(truth & set(top.tolist())) / k)
+
+            ivf_ms, ivf_recall = [], []
+            for query, truth in zip(queries, exact):
+                started = time.perf_counter()
+                found = index.search(query, k, nprobe=nprobe)
+                ivf_ms.append((time.perf_counter() - started) * 1000)
+                ivf_recall.append(len(truth & {int(point_id[1:]) for point_id, _ in found}) / k)
+
+            memory = (codes.nbytes + (scales.nbytes if scales is not None else 0)) / 2**20
+            p50, p99 = np.percentile(ivf_ms, [50, 99])
+            self.stdout.write(
+                f"{name:>10} {memory:>8.1f} {np.percentile(brute_ms, 50):>10.2f} {np.mean(brute_recall):>10.3f}"
+                f" {p50:>8.3f} {p99:>8.3f} {np.mean(ivf_recall):>9.3f}"
+            )
@@ -0,0 +1,56 @@
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from apps.core.embeddings import CachedProvider, DiskCache, FakeProvider
+from apps.core.services import embed_texts, generate_embeddings
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк пропускной способности эмбеддинга на локальном фейковом провайдере (без сети)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--texts", type=int, default=2000)
+        parser.add_argument("--latency-ms", type=float, default=40.0, help="Имитация задержки одного запроса")
+        parser.add_argument("--batch-size", type=int, nargs="+", default=[16, 64, 256])
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+        parser.add_argument("--sequential-sample", type=int, default=100,
+                            help="Сколько текстов прогнать по одному (старый способ)")
+
+    def handle(self, *args, **options):
+        texts = [f"Точка {i}: описание, теги, интересы" for i in range(options["texts"])]
+        latency = options["latency_ms"]
+
+        fake = FakeProvider(latency_ms=latency)
+        sample = texts[:options["sequential_sample"]]
+        started = time.perf_counter()
+        for text in sample:
+            generate_embeddings([text], fake)
+        rate = len(sample) / (time.perf_counter() - started)
+        self.stdout.write(f"по одному тексту: {rate:,.0f} текстов/с ({fake.requests} запросов)")
+
+        self.stdout.write(f'{"batch":>6} {"conc":>5} {"texts/s":>10} {"requests":>9}')
+        for batch_size in options["batch_size"]:
+            for concurrency in options["concurrency"]:
+                fake = FakeProvider(latency_ms=latency)
+                started = time.perf_counter()
+                embed_texts(texts, fake, batch_size=batch_size, concurrency=concurrency)
+                rate = len(texts) / (time.perf_counter() - started)
+                self.stdout.write(f"{batch_size:>6} {concurrency:>5} {rate:>10,.0f} {fake.requests:>9}")
+
+        self.stdout.write("кеш (sha256(model + text)):")
+        with tempfile.TemporaryDirectory() as tmp:
+            fake = FakeProvider(latency_ms=latency)
+            disk = DiskCache(Path(tmp) / "cache.sqlite3", max_bytes=2**30)
+            cached = CachedProvider(fake, disk)
+            for label, provider in [
+                ("холодный", cached),
+                ("память", cached),
+                ("диск", CachedProvider(fake, disk)),
+            ]:
+                started = time.perf_counter()
+                embed_texts(texts, provider, batch_size=64, concurrency=4)
+                rate = len(texts) / (time.perf_counter() - started)
+                self.stdout.write(f"{label:>10}: {rate:>12,.0f} текстов/с, запросов к провайдеру всего {fake.requests}")
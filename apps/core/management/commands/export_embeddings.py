@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apps.core import ann, embedding_store
+
+
+class Command(BaseCommand):
+    help = "Выгрузить PointEmbedding в новый mmap-снапшот и пересобрать ANN-индексы городов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--skip-index", action="store_true", help="Не пересобирать ANN-индексы")
+
+    def handle(self, *args, **options):
+        snapshot = embedding_store.export_snapshot()
+        if snapshot is None:
+            self.stdout.write("Эмбеддингов нет, снапшот не создан")
+            return
+        self.stdout.write(
+            f"Снапшот {snapshot.name}: {len(snapshot)} векторов, размерность {snapshot.vectors.shape[1]}"
+        )
+        if options["skip_index"]:
+            return
+        for city_id in sorted(set(snapshot.cities.tolist())):
+            index = ann.build_city_index(city_id, snapshot)
+            self.stdout.write(f"  {city_id}: {len(index)} точек в индексе")
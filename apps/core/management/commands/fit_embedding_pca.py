@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core import embedding_store
+from apps.core.quantization import fit_pca, pca_path, save_pca
+
+
+class Command(BaseCommand):
+    help = "Обучает PCA-проекцию эмбеддингов по текущему снапшоту (для EMBEDDING_COMPACT_MODE=pca)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dim", type=int, default=256)
+        parser.add_argument("--sample", type=int, default=50_000)
+
+    def handle(self, *args, **options):
+        snapshot = embedding_store.current_snapshot()
+        if snapshot is None:
+            raise CommandError("Нет снапшота эмбеддингов: сначала выполните export_embeddings")
+        if options["dim"] >= snapshot.vectors.shape[1]:
+            raise CommandError(f"--dim должен быть меньше размерности эмбеддингов ({snapshot.vectors.shape[1]})")
+
+        started = time.perf_counter()
+        codec = fit_pca(snapshot.vectors, options["dim"], sample=options["sample"])
+        save_pca(codec)
+        self.stdout.write(self.style.SUCCESS(
+            f"PCA {snapshot.vectors.shape[1]} -> {codec.dim} по {len(snapshot)} векторам "
+            f"за {time.perf_counter() - started:.1f} s: {pca_path()}"
+        ))
+        self.stdout.write("Индексы подхватят проекцию после пересборки (export_embeddings)")
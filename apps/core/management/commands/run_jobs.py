@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+
+from apps.core.jobs import claim_next, run_job, run_job_in_pool, worker_name
+
+
+class Command(BaseCommand):
+    help = "Воркер фоновых задач: забирает задачи из таблицы jobs и выполняет их"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Выполнить все задачи из очереди и выйти")
+        parser.add_argument("--poll", type=float, default=2.0, help="Пауза между опросами пустой очереди, с")
+        parser.add_argument("--kinds", nargs="+", help="Брать только задачи этих типов")
+        parser.add_argument(
+            "--processes", type=int,
+            help="Сколько задач выполнять параллельно в пуле процессов; по умолчанию и при 0 — по числу ядер, "
+                 "1 — в самом воркере",
+        )
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        processes = options["processes"] or os.cpu_count() or 1
+        self.stdout.write(f"Воркер {worker} запущен" + (f", процессов: {processes}" if processes > 1 else ""))
+        try:
+            if processes > 1:
+                self.run_pool(worker, processes, options)
+            else:
+                self.run_inline(worker, options)
+        except KeyboardInterrupt:
+            self.stdout.write("Воркер остановлен")
+
+    def run_inline(self, worker, options):
+        while True:
+            job = claim_next(worker, options["kinds"])
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["poll"])
+                continue
+
+            self.stdout.write(f"{job.kind} {job.pk}: старт (попытка {job.attempts})")
+            job = run_job(job)
+            self.stdout.write(f"{job.kind} {job.pk}: {job.status}, обработано {job.processed}")
+
+    def run_pool(self, worker, processes, options):
+        """Задачи захватывает сам воркер и отдаёт в пул, пока в работе меньше processes задач.
+
+        Процессы пула запускаются через spawn и поднимают Django заново — соединения с БД
+        родителя им не достаются. Если процесс пула упал, пул пересоздаётся; его задача
+        останется running и будет подхвачена снова через STALE_AFTER.
+        """
+        context = multiprocessing.get_context("spawn")
+        while True:
+            try:
+                with ProcessPoolExecutor(processes, mp_context=context, initializer=django.setup) as pool:
+                    if self.feed_pool(pool, worker, processes, options):
+                        return
+            except BrokenProcessPool as exc:
+                self.stderr.write(f"Пул процессов сломан, пересоздаём: {exc}")
+
+    def feed_pool(self, pool, worker, processes, options) -> bool:
+        """Возвращает True, когда с --once очередь опустела."""
+        running = set()
+        while True:
+            job = claim_next(worker, options["kinds"]) if len(running) < processes else None
+            if job is not None:
+                self.stdout.write(f"{job.kind} {job.pk}: старт (попытка {job.attempts})")
+                running.add(pool.submit(run_job_in_pool, job.pk))
+                continue
+            if not running:
+                if options["once"]:
+                    return True
+                time.sleep(options["poll"])
+                continue
+            done, running = wait(running, timeout=options["poll"], return_when=FIRST_COMPLETED)
+            for future in done:
+                job_id, status = future.result()
+                self.stdout.write(f"{job_id}: {status}")
@@ -0,0 +1,51 @@
+"""Простые метрики процесса: счётчики, распределения времени и вычисляемые значения.
+
+Данные живут в памяти одного процесса (воркера) и отдаются админам через api/system/metrics/.
+"""
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters: dict = defaultdict(int)
+# name -> [count, total, max]
+_timings: dict = {}
+_gauges: dict = {}
+
+
+def incr(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float) -> None:
+    """Добавить наблюдение (обычно миллисекунды) в распределение name."""
+    with _lock:
+        stat = _timings.setdefault(name, [0, 0.0, 0.0])
+        stat[0] += 1
+        stat[1] += value
+        stat[2] = max(stat[2], value)
+
+
+def register_gauge(name: str, func) -> None:
+    """Значение, которое вычисляется в момент чтения метрик (размер кеша, доля попаданий)."""
+    _gauges[name] = func
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(_counters)
+        timings = {
+            name: {"count": count, "total": round(total, 3), "avg": round(total / count, 3), "max": round(peak, 3)}
+            for name, (count, total, peak) in _timings.items()
+        }
+    return {
+        "counters": counters,
+        "timings": timings,
+        "gauges": {name: func() for name, func in _gauges.items()},
+    }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _timings.clear()
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Кто поставил задачу (для пользовательских задач вроде генерации маршрута)",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="jobs",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="job",
+            index=models.Index(
+                fields=["kind", "user", "status"], name="jobs_kind_54479d_idx"
+            ),
+        ),
+    ]
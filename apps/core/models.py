@@ -1,3 +1,49 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class Job(models.Model):
+    """Фоновая задача. Выполняется командой run_jobs, прогресс сохраняется чекпоинтами."""
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "В очереди"
+        RUNNING = "running", "Выполняется"
+        DONE = "done", "Готово"
+        FAILED = "failed", "Ошибка"
+
+    id = models.CharField(max_length=50, primary_key=True, default=uuid.uuid4)
+    kind = models.CharField(max_length=50, help_text='Тип задачи, например "embed-missing"')
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    checkpoint = models.CharField(max_length=400, blank=True, default='', help_text='id последней обработанной точки')
+    processed = models.IntegerField(default=0)
+    total = models.IntegerField(null=True, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, default='')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="jobs",
+        null=True, blank=True,
+        help_text="Кто поставил задачу (для пользовательских задач вроде генерации маршрута)",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'jobs'
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['kind', 'user', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.id} ({self.status})"
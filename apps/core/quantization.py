@@ -0,0 +1,139 @@
+"""Компактные представления эмбеддингов для хранения и поиска.
+
+float32 — как есть; float16 — половина памяти почти без потерь; int8 — скалярное квантование
+с масштабом на вектор (четверть памяти); pca — проекция на первые d главных компонент,
+матрица проекции обучается офлайн командой fit_embedding_pca.
+Поиск всегда считает скалярные произведения во float32 — компактные коды разворачиваются кусками.
+"""
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+MODES = ("float32", "float16", "int8", "pca")
+
+
+def normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class Codec:
+    """float32 без сжатия; базовый класс для остальных режимов."""
+    mode = "float32"
+
+    def transform(self, vectors) -> np.ndarray:
+        """Перевод нормированных векторов в пространство индекса (для PCA — проекция)."""
+        return normalize(vectors)
+
+    def encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        return np.ascontiguousarray(vectors, dtype=np.float32), None
+
+    def decode(self, codes: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+        return np.asarray(codes, dtype=np.float32)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+        return codes @ query
+
+    def params(self) -> dict:
+        return {}
+
+
+class Float16Codec(Codec):
+    mode = "float16"
+
+    def encode(self, vectors):
+        return np.ascontiguousarray(vectors, dtype=np.float16), None
+
+    def scores(self, query, codes, scales):
+        return codes.astype(np.float32) @ query
+
+
+class Int8Codec(Codec):
+    mode = "int8"
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def decode(self, codes, scales):
+        return codes.astype(np.float32) * scales[:, None]
+
+    def scores(self, query, codes, scales):
+        return (codes.astype(np.float32) @ query) * scales
+
+
+class PCACodec(Codec):
+    mode = "pca"
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[1]
+
+    def transform(self, vectors):
+        return normalize((normalize(vectors) - self.mean) @ self.components)
+
+    def params(self) -> dict:
+        return {"pca_mean": self.mean, "pca_components": self.components}
+
+
+def fit_pca(vectors: np.ndarray, dim: int, sample: int = 50000, seed: int = 0) -> PCACodec:
+    """Главные компоненты по подвыборке нормированных векторов."""
+    vectors = normalize(vectors)
+    if len(vectors) > sample:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[np.sort(rng.choice(len(vectors), sample, replace=False))]
+    mean = vectors.mean(axis=0)
+    centered = vectors - mean
+    covariance = centered.T @ centered / max(len(centered) - 1, 1)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    order = np.argsort(eigenvalues)[::-1][:dim]
+    return PCACodec(mean, eigenvectors[:, order])
+
+
+def pca_path() -> Path:
+    return Path(settings.EMBEDDING_STORE_DIR) / "pca.npz"
+
+
+def save_pca(codec: PCACodec) -> None:
+    path = pca_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(tmp, mean=codec.mean, components=codec.components)
+    tmp.replace(path)
+
+
+def load_pca() -> PCACodec | None:
+    if not pca_path().exists():
+        return None
+    with np.load(pca_path()) as data:
+        return PCACodec(data["mean"], data["components"])
+
+
+def get_codec(mode: str | None = None, params: dict | None = None) -> Codec:
+    """Кодек по имени режима (по умолчанию — settings.EMBEDDING_COMPACT_MODE).
+
+    Для pca параметры берутся из params (сохранённый индекс) или из обученной проекции на диске.
+    """
+    mode = mode or settings.EMBEDDING_COMPACT_MODE
+    if mode == "float32":
+        return Codec()
+    if mode == "float16":
+        return Float16Codec()
+    if mode == "int8":
+        return Int8Codec()
+    if mode == "pca":
+        if params and "pca_mean" in params:
+            return PCACodec(params["pca_mean"], params["pca_components"])
+        codec = load_pca()
+        if codec is None:
+            raise ValueError("Проекция PCA не обучена: запустите manage.py fit_embedding_pca")
+        return codec
+    raise ValueError(f"Неизвестный режим хранения эмбеддингов: {mode}")
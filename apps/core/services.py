@@ -1,18 +1,168 @@
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
-from apps.routes.models import Point, PointEmbedding
-from openai import OpenAI
-from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
+from apps.routes.models import Point, PointEmbedding
+from .embeddings import EmbeddingProvider, cache_key, get_provider
+from .singleflight import get_flight
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+# Точек из БД за один проход, текстов в одном запросе к API, параллельных запросов
+EMBED_CHUNK_SIZE = 500
+EMBED_BATCH_SIZE = 64
+EMBED_CONCURRENCY = 4
 
 
 def generate_embedding(text: str) -> list[float]:
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return response.data[0].embedding
+    """Одновременные запросы с тем же текстом (описания из анкеты) ждут один вызов провайдера."""
+    provider = get_provider()
+    return get_flight("embedding").do(cache_key(provider.model, text), lambda: provider.embed_one(text))
+
+
+def generate_embeddings(texts: list[str], provider: EmbeddingProvider | None = None) -> list[list[float]]:
+    """Одна пачка текстов; порядок ответа совпадает с порядком texts."""
+    return (provider or get_provider()).embed(texts)
+
+
+def embed_texts(
+    texts: list[str],
+    provider: EmbeddingProvider | None = None,
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    pool: ThreadPoolExecutor | None = None,
+) -> list[list[float]]:
+    """Режем тексты на пачки и отправляем их параллельно, не больше concurrency запросов сразу."""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if pool is None:
+        with ThreadPoolExecutor(max_workers=concurrency) as own_pool:
+            results = list(own_pool.map(lambda batch: generate_embeddings(batch, provider), batches))
+    else:
+        results = list(pool.map(lambda batch: generate_embeddings(batch, provider), batches))
+    return [vector for batch in results for vector in batch]
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class EmbeddingRunStats:
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.created + self.updated
+
+
+def save_embeddings(point_ids: list, vectors: list, hashes: list, existing: set, model: str) -> tuple[int, int]:
+    """Пишем чанк эмбеддингов двумя bulk-запросами в короткой транзакции. Возвращает (created, updated)."""
+    now = timezone.now()
+    to_create, to_update = [], []
+    for point_id, vector, digest in zip(point_ids, vectors, hashes):
+        row = PointEmbedding(
+            point_id=point_id, embedding=vector, text_hash=digest, model=model, updated_at=now
+        )
+        (to_update if point_id in existing else to_create).append(row)
+
+    with transaction.atomic():
+        PointEmbedding.objects.bulk_create(to_create, batch_size=100)
+        PointEmbedding.objects.bulk_update(
+            to_update, ["embedding", "text_hash", "model", "updated_at"], batch_size=100
+        )
+    return len(to_create), len(to_update)
+
+
+def embed_points(
+    queryset,
+    provider: EmbeddingProvider | None = None,
+    chunk_size: int = EMBED_CHUNK_SIZE,
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    force: bool = False,
+    start_after=None,
+    on_chunk=None,
+    on_progress=None,
+) -> EmbeddingRunStats:
+    """Пересчёт эмбеддингов для точек из queryset.
+
+    Точки читаются чанками по id (keyset), для каждого чанка сразу строятся тексты и их хеши;
+    в API уходят только точки, у которых хеш текста или модель отличаются от сохранённых
+    (force=True — все) или которые были посчитаны другой моделью. Тексты отправляются пачками параллельно, результат чанка пишется
+    отдельной короткой транзакцией. on_chunk(points, vectors) получает только пересчитанные точки.
+
+    start_after — id, после которого продолжать (чекпоинт фоновой задачи);
+    on_progress(last_id, chunk_stats) вызывается после каждого записанного чанка.
+    """
+    provider = provider or get_provider()
+    stats = EmbeddingRunStats()
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for points in iter_point_chunks(queryset, chunk_size, start_after):
+            last_id = points[-1].id
+            texts = [build_point_text(point) for point in points]
+            hashes = [text_hash(text) for text in texts]
+            stored = {
+                point_id: (digest, model)
+                for point_id, digest, model in PointEmbedding.objects.filter(
+                    point_id__in=[point.id for point in points]
+                ).values_list("point_id", "text_hash", "model")
+            }
+            changed = [
+                i for i, (point, digest) in enumerate(zip(points, hashes))
+                if force or stored.get(point.id) != (digest, provider.model)
+            ]
+            chunk = EmbeddingRunStats(skipped=len(points) - len(changed))
+            if changed:
+                changed_points = [points[i] for i in changed]
+                vectors = embed_texts(
+                    [texts[i] for i in changed], provider, batch_size, concurrency, pool=pool
+                )
+                chunk.created, chunk.updated = save_embeddings(
+                    [point.id for point in changed_points], vectors, [hashes[i] for i in changed], set(stored),
+                    provider.model,
+                )
+                if on_chunk is not None:
+                    on_chunk(changed_points, vectors)
+
+            stats.created += chunk.created
+            stats.updated += chunk.updated
+            stats.skipped += chunk.skipped
+            if on_progress is not None:
+                on_progress(last_id, chunk)
+
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def iter_point_chunks(queryset, chunk_size: int = EMBED_CHUNK_SIZE, start_after=None):
+    """Точки чанками по id (keyset) с подгруженными интересами и настроениями.
+
+    На чанк — три запроса (точки + две m2m через prefetch_related), независимо от его размера.
+    """
+    queryset = queryset.order_by("id").prefetch_related("interests", "moods")
+    last_id = start_after
+    while True:
+        qs = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        points = list(qs[:chunk_size])
+        if points:
+            yield points
+        if len(points) < chunk_size:
+            return
+        last_id = points[-1].id
+
+
+def iter_point_texts(queryset, chunk_size: int = EMBED_CHUNK_SIZE):
+    """Генератор пар (point_id, text) для всех точек queryset без N+1 запросов."""
+    for points in iter_point_chunks(queryset, chunk_size):
+        for point in points:
+            yield point.id, build_point_text(point)
 
 
 def build_point_text(point: Point) -> str:
@@ -23,13 +173,14 @@ def build_point_text(point: Point) -> str:
     if point.tags:
         parts.append("Теги: " + ", ".join(point.tags))
 
-    # interests (ManyToMany)
-    interests = point.interests.values_list("name", flat=True)
+    # interests (ManyToMany); .all() берёт данные из prefetch_related, если он был.
+    # Сортируем, чтобы текст (и его хеш) не зависел от порядка строк из БД
+    interests = sorted(interest.label for interest in point.interests.all())
     if interests:
         parts.append("Интересы: " + ", ".join(interests))
 
     # moods (ManyToMany)
-    moods = point.moods.values_list("name", flat=True)
+    moods = sorted(mood.label for mood in point.moods.all())
     if moods:
         parts.append("Настроения: " + ", ".join(moods))
 
@@ -0,0 +1,197 @@
+"""Схлопывание одинаковых одновременных вычислений (singleflight).
+
+Внутри процесса первый вызов с ключом становится ведущим, остальные ждут его Future и
+получают тот же результат (или то же исключение). Между воркерами (gunicorn, несколько
+процессов на машине) ведущий держит flock на файле блокировки ключа (<sha256>.lock в
+SINGLEFLIGHT_DIR, каталог с правами 0700) и по окончании кладёт рядом результат в JSON.
+Воркер, взявший блокировку после него, читает этот результат; если результата нет (ведущий
+упал с ошибкой, результат не сериализуется в JSON) или ожидание затянулось — считает сам.
+
+Результат живёт не дольше RESULT_TTL_SECONDS: ждущие воркеры забирают его сразу после
+снятия блокировки, а кто пришёл позже срока, удаляет просроченный файл и считает заново.
+Оставшиеся файлы (ключи, которые больше не запрашивали) удаляет sweep. Между процессами
+передаются только JSON-совместимые значения: кортежи возвращаются списками.
+Без каталога (или без fcntl) работает только внутри процесса.
+"""
+import hashlib
+import os
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+from apps.core import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: только схлопывание потоков
+    fcntl = None
+
+# Сколько живёт результат ведущего для других процессов, сколько ждать чужой блокировки, как часто проверять
+RESULT_TTL_SECONDS = 5.0
+WAIT_TIMEOUT_SECONDS = 30.0
+POLL_SECONDS = 0.005
+# Раз в сколько вычислений ведущий чистит просроченные результаты и свободные блокировки
+SWEEP_EVERY = 200
+
+
+class SingleFlight:
+    def __init__(self, name: str, directory=None, result_ttl: float = RESULT_TTL_SECONDS,
+                 wait_timeout: float = WAIT_TIMEOUT_SECONDS):
+        self.name = name
+        self.directory = Path(directory) / name if directory and fcntl is not None else None
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self.calls: dict = {}
+        self.lock = threading.Lock()
+        self.computed = 0
+
+    def do(self, key: str, func):
+        """Результат func() для ключа; одновременные вызовы с тем же ключом считают его один раз."""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        if not leader:
+            metrics.incr(f"singleflight.{self.name}.shared")
+            return future.result()
+
+        try:
+            result = self._run(key, func)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def _run(self, key: str, func):
+        if self.directory is None:
+            return self._compute(func)
+
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        result_path = self.directory / f"{digest}.result"
+        lock_file = self._lock(self.directory / f"{digest}.lock")
+        if lock_file is None:
+            metrics.incr(f"singleflight.{self.name}.lock_timeouts")
+            return self._compute(func)
+        with lock_file:
+            try:
+                found, result = self._read_result(result_path)
+                if found:
+                    metrics.incr(f"singleflight.{self.name}.shared_process")
+                    return result
+                result = self._compute(func)
+                self._write_result(result_path, result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _lock(self, path: Path):
+        """Открытый и заблокированный файл ключа; None — не дождались за wait_timeout.
+
+        sweep может удалить файл между open и flock: тогда блокировка взята на сироте,
+        и файл открывается заново.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            lock_file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), "r+b")
+            locked = _try_lock(lock_file)
+            while not locked and time.monotonic() < deadline:
+                time.sleep(POLL_SECONDS)
+                locked = _try_lock(lock_file)
+            if not locked:
+                lock_file.close()
+                return None
+            try:
+                if os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    def _compute(self, func):
+        metrics.incr(f"singleflight.{self.name}.computed")
+        self.computed += 1
+        if self.directory is not None and self.computed % SWEEP_EVERY == 0:
+            self.sweep()
+        return func()
+
+    def _read_result(self, path: Path) -> tuple[bool, object]:
+        try:
+            if time.time() - path.stat().st_mtime > self.result_ttl:
+                path.unlink()
+                return False, None
+            with open(path, encoding="utf-8") as f:
+                return True, json.load(f)
+        except (OSError, ValueError):
+            return False, None
+
+    def _write_result(self, path: Path, result) -> None:
+        try:
+            data = json.dumps(result, ensure_ascii=False)
+        except (TypeError, ValueError):
+            metrics.incr(f"singleflight.{self.name}.not_shared")
+            return
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def sweep(self) -> None:
+        """Удаляет просроченные результаты и блокировки, которые сейчас никто не держит."""
+        if self.directory is None or not self.directory.exists():
+            return
+        cutoff = time.time() - self.result_ttl
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    continue
+                if entry.name.endswith((".result", ".tmp")):
+                    os.unlink(entry.path)
+                elif entry.name.endswith(".lock"):
+                    with open(entry.path, "r+b") as lock_file:
+                        # занятую блокировку не трогаем; свободную удаляем, держа её (см. _lock)
+                        if _try_lock(lock_file):
+                            os.unlink(entry.path)
+            except OSError:
+                pass
+
+
+def _try_lock(lock_file) -> bool:
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+_flights: dict = {}
+_flights_lock = threading.Lock()
+
+
+def get_flight(name: str) -> SingleFlight:
+    """Общий на процесс SingleFlight с каталогом из настроек."""
+    from django.conf import settings
+
+    with _flights_lock:
+        flight = _flights.get(name)
+        if flight is None:
+            flight = _flights[name] = SingleFlight(name, settings.SINGLEFLIGHT_DIR or None)
+        return flight
+
+
+def reset_flights() -> None:
+    """Забыть созданные SingleFlight (после смены SINGLEFLIGHT_DIR, в тестах)."""
+    with _flights_lock:
+        _flights.clear()
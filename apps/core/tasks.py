@@ -0,0 +1,74 @@
+"""Фоновые задачи по эмбеддингам точек (выполняются воркером run_jobs)."""
+from collections import defaultdict
+
+from apps.routes.models import Point
+from . import ann, embedding_store
+from .jobs import register
+from .services import embed_points
+
+
+def _index_chunk(points, vectors):
+    """После записи чанка обновляем ANN-индексы затронутых городов."""
+    by_city = defaultdict(lambda: ([], []))
+    for point, vector in zip(points, vectors):
+        ids, city_vectors = by_city[point.city_id]
+        ids.append(point.id)
+        city_vectors.append(vector)
+    for city_id, (ids, city_vectors) in by_city.items():
+        ann.upsert_vectors(city_id, ids, city_vectors)
+
+
+def _save_progress(job):
+    def on_progress(last_id, chunk):
+        job.progress(
+            last_id,
+            processed=chunk.processed + chunk.skipped,
+            created=chunk.created,
+            updated=chunk.updated,
+            skipped=chunk.skipped,
+        )
+    return on_progress
+
+
+def _export_and_reindex() -> dict:
+    snapshot = embedding_store.export_snapshot()
+    if snapshot is None:
+        return {"snapshot": None}
+    cities = sorted(set(snapshot.cities.tolist()))
+    for city_id in cities:
+        ann.build_city_index(city_id, snapshot)
+    return {"snapshot": snapshot.name, "indexed_cities": len(cities)}
+
+
+@register("embed-missing")
+def embed_missing(job):
+    queryset = Point.objects.filter(pointembedding__isnull=True)
+    job.set_total(queryset.count())
+    embed_points(
+        queryset,
+        start_after=job.checkpoint,
+        on_chunk=_index_chunk,
+        on_progress=_save_progress(job),
+    )
+    return {}
+
+
+@register("embed-refresh")
+def embed_refresh(job):
+    queryset = Point.objects.all()
+    job.set_total(queryset.count())
+    embed_points(
+        queryset,
+        force=bool(job.params.get("force")),
+        start_after=job.checkpoint,
+        on_progress=_save_progress(job),
+    )
+    # вектора перезаписаны — выгружаем новый снапшот хранилища и собираем индексы из него
+    if job.result.get("created", 0) + job.result.get("updated", 0):
+        return _export_and_reindex()
+    return {}
+
+
+@register("embed-export")
+def embed_export(job):
+    return _export_and_reindex()
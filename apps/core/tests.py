@@ -1,3 +1,554 @@
-from django.test import TestCase
+import hashlib
+import json
+import multiprocessing
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.apps import apps
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.routes.models import City, Interest, Mood, Point, PointEmbedding
+from . import ann, embedding_store, jobs
+from .embeddings import CachedProvider, DiskCache, FakeProvider, HashingProvider
+from .management.commands.bench_ann import clustered_vectors
+from .models import Job
+from .quantization import fit_pca, get_codec, normalize, pca_path
+from .services import build_point_text, embed_points, embed_texts, iter_point_texts, text_hash
+from .singleflight import SingleFlight
+
+
+class IterPointTextsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(id="moscow", name="Москва", description="")
+        cls.parks = Interest.objects.create(id="parks", label="Парки", description="")
+        cls.museums = Interest.objects.create(id="museums", label="Музеи", description="")
+        cls.relax = Mood.objects.create(id="relax", label="Отдохнуть", description="")
+
+    def create_points(self, count):
+        for i in range(count):
+            point = Point.objects.create(
+                name=f"Точка {i}",
+                description=f"Описание {i}",
+                tags=["центр"],
+                city=self.city,
+                coordinates_lat=55.75,
+                coordinates_lng=37.61,
+                average_visit_duration=30,
+            )
+            point.interests.set([self.parks, self.museums])
+            point.moods.set([self.relax])
+
+    def test_text_uses_labels(self):
+        self.create_points(1)
+        [(_, text)] = list(iter_point_texts(Point.objects.all()))
+        self.assertIn("Интересы: Музеи, Парки", text)
+        self.assertIn("Настроения: Отдохнуть", text)
+        self.assertIn("Теги: центр", text)
+
+    def test_query_count_does_not_depend_on_catalog_size(self):
+        self.create_points(3)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(list(iter_point_texts(Point.objects.all()))), 3)
+
+        self.create_points(40)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(list(iter_point_texts(Point.objects.all()))), 43)
+
+    def test_chunks_cover_all_points(self):
+        self.create_points(25)
+        ids = [point_id for point_id, _ in iter_point_texts(Point.objects.all(), chunk_size=10)]
+        self.assertEqual(sorted(ids), sorted(Point.objects.values_list("id", flat=True)))
+
+
+class RecordingProvider(FakeProvider):
+    """FakeProvider, который запоминает размеры пачек и сколько запросов шло одновременно."""
+
+    def __init__(self, dim=8, latency_ms=0.0, fail_on=None):
+        super().__init__(dim, latency_ms)
+        self.batches = []
+        self.in_flight = self.max_in_flight = 0
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+
+    def embed(self, texts):
+        with self.lock:
+            self.batches.append(len(texts))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            call = len(self.batches)
+        try:
+            if call == self.fail_on:
+                raise RuntimeError("провайдер недоступен")
+            return super().embed(texts)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class EmbedTextsTests(TestCase):
+    def test_batches_keep_order_and_size(self):
+        provider = RecordingProvider()
+        texts = [f"текст {i}" for i in range(130)]
+        vectors = embed_texts(texts, provider, batch_size=64, concurrency=2)
+        self.assertEqual(sorted(provider.batches), [2, 64, 64])
+        self.assertEqual(vectors, FakeProvider(dim=8).embed(texts))
+
+    def test_concurrency_is_bounded(self):
+        provider = RecordingProvider(latency_ms=30)
+        embed_texts([f"текст {i}" for i in range(40)], provider, batch_size=4, concurrency=3)
+        self.assertEqual(len(provider.batches), 10)
+        self.assertEqual(provider.max_in_flight, 3)
+
+
+@skipUnless(connection.vendor == "postgresql", "PointEmbedding.embedding — ArrayField PostgreSQL")
+class EmbedPointsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        city = City.objects.create(id="moscow", name="Москва", description="")
+        parks = Interest.objects.create(id="parks", label="Парки", description="")
+        for i in range(12):
+            point = Point.objects.create(
+                name=f"Точка {i}", description=f"Описание {i}", city=city,
+                coordinates_lat=55.75, coordinates_lng=37.61, average_visit_duration=30,
+            )
+            point.interests.set([parks])
+
+    def test_chunks_are_written_with_bulk_queries(self):
+        provider = RecordingProvider()
+        marks = []
+        with CaptureQueriesContext(connection) as queries:
+            stats = embed_points(
+                Point.objects.all(), provider, chunk_size=5, batch_size=2, concurrency=2,
+                on_progress=lambda last_id, chunk: marks.append(len(queries.captured_queries)),
+            )
+        self.assertEqual((stats.created, stats.updated, stats.skipped), (12, 0, 0))
+        # чанки 5, 5, 2 точки пачками по 2
+        self.assertEqual(sorted(provider.batches), [1, 1, 2, 2, 2, 2, 2])
+        # на чанк: точки, две m2m, сохранённые хеши и одна вставка между SAVEPOINT и RELEASE
+        self.assertEqual(np.diff([0] + marks).tolist(), [7, 7, 7])
+        inserts = [q["sql"] for q in queries.captured_queries if q["sql"].startswith('INSERT INTO "point_embeddings"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(PointEmbedding.objects.filter(model=provider.model).count(), 12)
+
+        # второй проход другой моделью: те же чанки, но одним UPDATE на чанк
+        provider = RecordingProvider(dim=4)
+        with CaptureQueriesContext(connection) as queries:
+            stats = embed_points(Point.objects.all(), provider, chunk_size=5)
+        self.assertEqual((stats.created, stats.updated, stats.skipped), (0, 12, 0))
+        updates = [q["sql"] for q in queries.captured_queries if q["sql"].startswith('UPDATE "point_embeddings"')]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(len(PointEmbedding.objects.first().embedding), 4)
+
+    def test_failed_chunk_keeps_earlier_chunks(self):
+        # чанк по 4 точки одной пачкой: второй запрос к провайдеру — второй чанк
+        provider = RecordingProvider(fail_on=2)
+        done = []
+        with self.assertRaises(RuntimeError):
+            embed_points(
+                Point.objects.all(), provider, chunk_size=4, batch_size=4, concurrency=1,
+                on_progress=lambda last_id, chunk: done.append(last_id),
+            )
+        first = list(Point.objects.order_by("id").values_list("id", flat=True)[:4])
+        self.assertEqual(done, [first[-1]])
+        self.assertEqual(sorted(PointEmbedding.objects.values_list("point_id", flat=True)), first)
+
+        stats = embed_points(Point.objects.all(), RecordingProvider(), chunk_size=4, start_after=done[-1])
+        self.assertEqual((stats.created, stats.skipped), (8, 0))
+        self.assertEqual(PointEmbedding.objects.count(), 12)
+
+    def test_unchanged_texts_are_skipped(self):
+        provider = RecordingProvider()
+        embed_points(Point.objects.all(), provider)
+        calls = len(provider.batches)
+        stored = dict(PointEmbedding.objects.values_list("point_id", "updated_at"))
+
+        stats = embed_points(Point.objects.all(), provider)
+        self.assertEqual((stats.created, stats.updated, stats.skipped), (0, 0, 12))
+        self.assertEqual(len(provider.batches), calls)
+        self.assertEqual(dict(PointEmbedding.objects.values_list("point_id", "updated_at")), stored)
+
+        stats = embed_points(Point.objects.all(), provider, force=True)
+        self.assertEqual((stats.created, stats.updated, stats.skipped), (0, 12, 0))
+
+    def test_changed_text_or_model_is_embedded_again(self):
+        provider = RecordingProvider()
+        embed_points(Point.objects.all(), provider)
+        changed = Point.objects.order_by("id").first()
+        changed.description = "Новое описание"
+        changed.save()
+        Point.objects.create(
+            name="Новая", description="Новая точка", city_id="moscow",
+            coordinates_lat=55.75, coordinates_lng=37.61, average_visit_duration=30,
+        )
+
+        stats = embed_points(Point.objects.all(), provider)
+        self.assertEqual((stats.created, stats.updated, stats.skipped), (1, 1, 11))
+        self.assertEqual(provider.batches[-1], 2)
+        row = PointEmbedding.objects.get(point=changed)
+        self.assertEqual(row.text_hash, text_hash(build_point_text(changed)))
+        self.assertEqual(row.embedding, provider.embed([build_point_text(changed)])[0])
+
+        # другая модель: хеши совпадают, но вектора из другого пространства — пересчитываем все
+        other = RecordingProvider(dim=4)
+        stats = embed_points(Point.objects.all(), other)
+        self.assertEqual((stats.created, stats.updated, stats.skipped), (0, 13, 0))
+        self.assertEqual(set(PointEmbedding.objects.values_list("model", flat=True)), {other.model})
+        self.assertEqual(embed_points(Point.objects.all(), other).skipped, 13)
+
+    def test_embed_missing_job_indexes_new_vectors(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        dirs = override_settings(ANN_INDEX_DIR=tmp.name, EMBEDDING_STORE_DIR=tmp.name)
+        dirs.enable()
+        self.addCleanup(dirs.disable)
+        self.addCleanup(ann._indexes.clear)
+
+        provider = RecordingProvider()
+        with mock.patch("apps.core.services.get_provider", return_value=provider):
+            jobs.enqueue("embed-missing")
+            job = jobs.run_job(jobs.claim_next("test", ["embed-missing"]))
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertEqual((job.processed, job.total), (12, 12))
+        self.assertEqual(job.result["created"], 12)
+        self.assertEqual(len(ann.get_index("moscow")), 12)
+
+
+class CachedProviderTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "cache.sqlite3"
+
+    def test_repeated_texts_hit_cache(self):
+        fake = FakeProvider(dim=8)
+        provider = CachedProvider(fake, DiskCache(self.path, max_bytes=2**20))
+        first = provider.embed(["a", "b", "a"])
+        self.assertEqual(first[0], first[2])
+        self.assertEqual(provider.embed(["b", "a"]), [first[1], first[0]])
+        self.assertEqual(fake.requests, 1)
+
+    def test_disk_cache_survives_new_provider(self):
+        CachedProvider(FakeProvider(dim=8), DiskCache(self.path, max_bytes=2**20)).embed(["текст"])
+        fake = FakeProvider(dim=8)
+        vector = CachedProvider(fake, DiskCache(self.path, max_bytes=2**20)).embed_one("текст")
+        self.assertEqual(fake.requests, 0)
+        self.assertAlmostEqual(sum(x * x for x in vector), 1.0, places=5)
+
+    def test_eviction_keeps_file_under_limit(self):
+        disk = DiskCache(self.path, max_bytes=64 * 1024)
+        provider = CachedProvider(FakeProvider(dim=256), disk, memory_size=10)
+        provider.embed([f"текст {i}" for i in range(500)])
+        disk.evict()
+        self.assertLessEqual(disk.size_bytes(), 64 * 1024)
+
+    def test_hashing_provider_is_deterministic(self):
+        provider = HashingProvider(dim=64)
+        self.assertEqual(provider.embed_one("Парк у реки"), HashingProvider(dim=64).embed_one("Парк у реки"))
+        near, far = provider.embed(["парк у реки", "ночной клуб"])
+        base = provider.embed_one("Парк у реки")
+        self.assertGreater(sum(x * y for x, y in zip(base, near)), sum(x * y for x, y in zip(base, far)))
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_threads_share_one_call(self):
+        fake = FakeProvider(dim=8, latency_ms=50)
+        flight = SingleFlight("test")
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda _: flight.do("парк", lambda: fake.embed_one("парк")), range(16)))
+        self.assertEqual(fake.requests, 1)
+        self.assertTrue(all(result == results[0] for result in results))
+
+    def test_error_reaches_every_waiter(self):
+        flight = SingleFlight("test")
+        started = threading.Event()
+
+        def fail():
+            started.wait(1)
+            raise ValueError("нет")
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(flight.do, "k", fail) for _ in range(4)]
+            started.set()
+            for future in futures:
+                self.assertRaises(ValueError, future.result)
+        self.assertEqual(flight.calls, {})
+
+    def test_workers_share_result_through_lock_file(self):
+        # отдельные экземпляры с общим каталогом ведут себя как разные процессы: у каждого свой flock
+        fake = FakeProvider(dim=8, latency_ms=50)
+        flights = [SingleFlight("test", self.tmp.name) for _ in range(4)]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda flight: flight.do("парк", lambda: fake.embed_one("парк")), flights))
+        self.assertEqual(fake.requests, 1)
+        self.assertTrue(all(result == results[0] for result in results))
+
+    def test_result_file_is_private_json_next_to_key_lock(self):
+        flight = SingleFlight("test", self.tmp.name)
+        self.assertEqual(flight.do("парк", lambda: ({"a": 1}, 2.5)), ({"a": 1}, 2.5))
+        directory = Path(self.tmp.name) / "test"
+        self.assertEqual(directory.stat().st_mode & 0o777, 0o700)
+        digest = hashlib.sha256("парк".encode()).hexdigest()
+        self.assertEqual(sorted(p.name for p in directory.iterdir()), [f"{digest}.lock", f"{digest}.result"])
+        self.assertEqual(json.loads((directory / f"{digest}.result").read_text()), [{"a": 1}, 2.5])
+        # другой процесс получает результат из файла: кортеж приходит списком
+        self.assertEqual(SingleFlight("test", self.tmp.name).do("парк", lambda: None), [{"a": 1}, 2.5])
+
+    def test_unserializable_result_is_not_shared(self):
+        flight = SingleFlight("test", self.tmp.name)
+        value = object()
+        self.assertIs(flight.do("k", lambda: value), value)
+        self.assertEqual(SingleFlight("test", self.tmp.name).do("k", lambda: 1), 1)
+
+    def test_expired_result_is_removed_and_recomputed(self):
+        SingleFlight("test", self.tmp.name).do("k", lambda: 1)
+        flight = SingleFlight("test", self.tmp.name, result_ttl=0)
+        self.assertEqual(flight.do("k", lambda: 2), 2)
+        self.assertEqual(SingleFlight("test", self.tmp.name).do("k", lambda: 3), 2)
+
+    def test_sweep_keeps_held_locks(self):
+        flight = SingleFlight("test", self.tmp.name, result_ttl=0)
+        for key in ("a", "b"):
+            flight.do(key, lambda: 1)
+        time.sleep(0.01)
+        directory = Path(self.tmp.name) / "test"
+        held = flight._lock(directory / f"{hashlib.sha256(b'a').hexdigest()}.lock")
+        self.addCleanup(held.close)
+        flight.sweep()
+        self.assertEqual([p.name for p in directory.iterdir()], [f"{hashlib.sha256(b'a').hexdigest()}.lock"])
+
+
+class WorkerKilled(BaseException):
+    """Смерть воркера посреди задачи: run_job её не ловит, задача остаётся running."""
+
+
+class JobResumeTests(TestCase):
+    def setUp(self):
+        self.seen = []
+        self.kill_after = 4
+
+        def handler(job):
+            # по одному элементу из десяти, чекпоинт — последний обработанный
+            job.set_total(10)
+            start = int(job.checkpoint) + 1 if job.checkpoint else 0
+            for item in range(start, 10):
+                if len(self.seen) == self.kill_after:
+                    raise WorkerKilled()
+                self.seen.append(item)
+                job.progress(item, processed=1, done=1)
+            return {"last": 9}
+
+        jobs.register("test-resume")(handler)
+        self.addCleanup(jobs._handlers.pop, "test-resume")
+
+    def test_reclaimed_job_continues_from_checkpoint(self):
+        job = jobs.enqueue("test-resume")
+        with self.assertRaises(WorkerKilled):
+            jobs.run_job(jobs.claim_next("first", ["test-resume"]))
+        self.assertEqual(self.seen, [0, 1, 2, 3])
+        # пока heartbeat свежий, задачу никто не забирает
+        self.assertIsNone(jobs.claim_next("second", ["test-resume"]))
+
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - jobs.STALE_AFTER - timedelta(seconds=1))
+        self.kill_after = None
+        job = jobs.run_job(jobs.claim_next("second", ["test-resume"]))
+
+        self.assertEqual(self.seen, list(range(10)))
+        self.assertEqual((job.status, job.attempts, job.worker), (Job.Status.DONE, 2, "second"))
+        self.assertEqual((job.processed, job.total), (10, 10))
+        self.assertEqual(job.result, {"done": 10, "last": 9})
+
+
+def _upsert_in_child(city_id, ids, seed):
+    ann.upsert_vectors(city_id, ids, np.random.default_rng(seed).normal(size=(len(ids), 16)))
+
+
+class AnnUpsertTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        dirs = override_settings(ANN_INDEX_DIR=self.tmp.name, EMBEDDING_STORE_DIR=self.tmp.name)
+        dirs.enable()
+        self.addCleanup(dirs.disable)
+        self.addCleanup(ann._indexes.clear)
+
+    def test_concurrent_processes_keep_every_delta(self):
+        vectors = np.random.default_rng(0).normal(size=(200, 16))
+        ann.save_index("moscow", ann.IVFIndex.build([f"p{i}" for i in range(200)], vectors))
+        # fork: у каждого процесса свой кеш индексов, общий только каталог с файлами
+        context = multiprocessing.get_context("fork")
+        children = [
+            context.Process(target=_upsert_in_child, args=("moscow", [f"new{n}-{i}" for i in range(5)], n))
+            for n in range(4)
+        ]
+        for child in children:
+            child.start()
+        for child in children:
+            child.join(30)
+            self.assertEqual(child.exitcode, 0)
+
+        ann._indexes.clear()
+        index = ann.get_index("moscow")
+        self.assertEqual(sorted(index.delta_ids), sorted(f"new{n}-{i}" for n in range(4) for i in range(5)))
+        self.assertEqual(len(index), 220)
+
+    def test_unreadable_index_is_skipped(self):
+        Path(self.tmp.name, "moscow.npz").write_bytes(b"not an npz")
+        with self.assertLogs("apps.core.ann", "WARNING"):
+            self.assertIsNone(ann.get_index("moscow"))
+        self.assertEqual(ann.search("moscow", np.ones(16)), [])
+
+
+class AnnSearchTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        dirs = override_settings(ANN_INDEX_DIR=self.tmp.name, EMBEDDING_STORE_DIR=self.tmp.name)
+        dirs.enable()
+        self.addCleanup(dirs.disable)
+        self.addCleanup(ann._indexes.clear)
+
+    def test_recall_at_default_nprobe(self):
+        rng = np.random.default_rng(0)
+        vectors = clustered_vectors(8000, 64, clusters=40, rng=rng)
+        ids = [f"p{i}" for i in range(len(vectors))]
+        index = ann.IVFIndex.build(ids, vectors)
+        queries = vectors[rng.choice(len(vectors), 100, replace=False)]
+        queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+
+        recalls, exhaustive = [], []
+        for query in queries:
+            truth = {ids[i] for i in np.argsort(-(vectors @ ann.normalize(query)))[:10]}
+            recalls.append(len(truth & {point_id for point_id, _ in index.search(query, 10)}) / 10)
+            found = index.search(query, 10, nprobe=len(index.centroids))
+            exhaustive.append(len(truth & {point_id for point_id, _ in found}) / 10)
+        self.assertGreaterEqual(np.mean(recalls), 0.9)
+        self.assertEqual(np.mean(exhaustive), 1.0)
+
+    def test_upsert_keeps_empty_index(self):
+        index = ann.IVFIndex.build(["p0"], np.ones((1, 16)))
+        ann.save_index("moscow", index)
+        # все строки основной части удалены: индекс есть, но len() == 0
+        index.alive[:] = False
+        ann._publish("moscow", index)
+        with mock.patch.object(ann, "_rebuild") as rebuild:
+            ann.upsert_vectors("moscow", ["p1"], np.ones((1, 16)))
+        rebuild.assert_not_called()
+        self.assertEqual(ann.get_index("moscow").delta_ids, ["p1"])
+        self.assertEqual([point_id for point_id, _ in ann.search("moscow", np.ones(16))], ["p1"])
+
+    def test_preload_reads_every_city(self):
+        for city_id in ("moscow", "kazan"):
+            ann.save_index(city_id, ann.IVFIndex.build(["p0", "p1"], np.eye(2, 16)))
+        ann.upsert_vectors("kazan", ["p2"], np.ones((1, 16)))
+        ann._indexes.clear()
+        self.assertEqual(ann.preload(), ["kazan", "moscow"])
+        self.assertEqual(set(ann._indexes), {"kazan", "moscow"})
+        self.assertEqual(len(ann._indexes["kazan"][1]), 3)
+
+        with mock.patch.object(ann, "preload") as preload:
+            with override_settings(ANN_PRELOAD=False):
+                apps.get_app_config("core").ready()
+            preload.assert_not_called()
+            with override_settings(ANN_PRELOAD=True):
+                apps.get_app_config("core").ready()
+            preload.assert_called_once()
+
+
+class QuantizationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # кластеры в 16-мерном подпространстве 64-мерного: у настоящих эмбеддингов тоже мало значимых направлений
+        rng = np.random.default_rng(0)
+        basis = np.linalg.qr(rng.standard_normal((64, 16)))[0].T.astype(np.float32)
+        vectors = clustered_vectors(4000, 16, clusters=40, rng=rng) @ basis
+        cls.vectors = normalize(vectors + 0.02 * rng.standard_normal(vectors.shape).astype(np.float32))
+        cls.ids = [f"p{i}" for i in range(len(cls.vectors))]
+        queries = cls.vectors[rng.choice(len(cls.vectors), 100, replace=False)]
+        cls.queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+        cls.codecs = {mode: get_codec(mode) for mode in ("float32", "float16", "int8")}
+        cls.codecs["pca"] = fit_pca(cls.vectors, 24)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        dirs = override_settings(ANN_INDEX_DIR=self.tmp.name, EMBEDDING_STORE_DIR=self.tmp.name)
+        dirs.enable()
+        self.addCleanup(dirs.disable)
+        self.addCleanup(ann._indexes.clear)
+
+    def test_round_trip_error_is_bounded(self):
+        codes, _ = self.codecs["float16"].encode(self.vectors)
+        error = np.abs(self.codecs["float16"].decode(codes, None) - self.vectors)
+        # половина шага float16 для |x| < 1
+        self.assertLessEqual(error.max(), 2.0 ** -12)
+
+        codes, scales = self.codecs["int8"].encode(self.vectors)
+        error = np.abs(self.codecs["int8"].decode(codes, scales) - self.vectors)
+        self.assertTrue(np.all(error <= scales[:, None] / 2 + 1e-7))
+        query = normalize(self.queries[0])
+        np.testing.assert_allclose(
+            self.codecs["int8"].scores(query, codes, scales), self.codecs["int8"].decode(codes, scales) @ query,
+            atol=1e-5,
+        )
+
+        pca = self.codecs["pca"]
+        restored = (self.vectors - pca.mean) @ pca.components @ pca.components.T + pca.mean
+        self.assertLess(np.abs(restored - self.vectors).max(), 0.1)
+        self.assertEqual(pca.transform(self.vectors).shape, (len(self.vectors), 24))
+
+    def test_codec_params_survive_save_and_load(self):
+        for mode, codec in self.codecs.items():
+            index = ann.IVFIndex.build(self.ids, self.vectors, codec=codec)
+            ann.save_index("moscow", index)
+            loaded = ann.load_index("moscow")
+            self.assertEqual(loaded.codec.mode, mode)
+            self.assertEqual(loaded.codes.dtype, index.codes.dtype)
+            for name, value in codec.params().items():
+                np.testing.assert_array_equal(loaded.codec.params()[name], value)
+            for query in self.queries[:5]:
+                self.assertEqual(loaded.search(query, 10), index.search(query, 10))
+        # проекция берётся из файла индекса, а не из pca.npz
+        self.assertFalse(pca_path().exists())
+
+    def test_recall_against_float32(self):
+        truth = [set(np.argsort(-(self.vectors @ normalize(query)))[:10].tolist()) for query in self.queries]
+        expected = {"float32": 1.0, "float16": 0.99, "int8": 0.95, "pca": 0.8}
+        for mode, codec in self.codecs.items():
+            index = ann.IVFIndex.build(self.ids, self.vectors, codec=codec)
+            recall = np.mean([
+                len(exact & {int(point_id[1:]) for point_id, _ in index.search(query, 10, len(index.centroids))}) / 10
+                for query, exact in zip(self.queries, truth)
+            ])
+            self.assertGreaterEqual(recall, expected[mode], mode)
+
+
+class EmbeddingStoreExportTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        store = override_settings(EMBEDDING_STORE_DIR=self.tmp.name)
+        store.enable()
+        self.addCleanup(store.disable)
+
+    def test_rows_deleted_during_export_skip_the_switch(self):
+        # count() видел строки, а к выгрузке их уже удалили
+        with mock.patch.object(QuerySet, "count", return_value=2):
+            self.assertIsNone(embedding_store.export_snapshot())
+        self.assertIsNone(embedding_store.current_snapshot())
+        self.assertEqual(list((Path(self.tmp.name) / "snapshots").iterdir()), [])
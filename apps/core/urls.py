@@ -1,8 +1,11 @@
 from django.urls import path
-from .views import EmbedMissingPointsView, EmbedRefreshPointsView, EmbedUpdatePointView
+from .views import EmbedMissingPointsView, EmbedRefreshPointsView, EmbedUpdatePointView, EmbedExportView, JobStatusView, MetricsView
 
 urlpatterns = [
     path("embed-missing/", EmbedMissingPointsView.as_view(), name="embed-missing-points"),
     path("embed-refresh/", EmbedRefreshPointsView.as_view(), name="embed-refresh-points"),
     path("embed-update/<str:point_id>/", EmbedUpdatePointView.as_view(), name="embed-update-point"),
+    path("embed-export/", EmbedExportView.as_view(), name="embed-export"),
+    path("jobs/<str:job_id>/", JobStatusView.as_view(), name="job-status"),
+    path("metrics/", MetricsView.as_view(), name="system-metrics"),
 ]
@@ -4,7 +4,10 @@ from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.db import transaction
 
-from .services import generate_embedding,build_point_text
+from . import ann, jobs, metrics
+from .models import Job
+from .embeddings import get_provider
+from .services import build_point_text, text_hash
 from apps.routes.models import Point, PointEmbedding
 
 
@@ -13,17 +16,10 @@ class EmbedMissingPointsView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def post(self, request):
-        created = 0
-        for point in Point.objects.all():
-            if not hasattr(point, "pointembedding"):
-                text = build_point_text(point)
-                embedding = generate_embedding(text)
-                PointEmbedding.objects.create(point=point, embedding=embedding)
-                created += 1
-
+        job = jobs.enqueue("embed-missing")
         return Response(
-            {"status": "success", "created_embeddings": created},
-            status=status.HTTP_201_CREATED
+            {"status": "success", "data": {"job_id": job.id, "kind": job.kind}},
+            status=status.HTTP_202_ACCEPTED
         )
 
 
@@ -31,21 +27,39 @@ class EmbedRefreshPointsView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def post(self, request):
-        refreshed = 0
-        with transaction.atomic():
-            for point in Point.objects.all():
-                text = build_point_text(point)
-                embedding = generate_embedding(text)
-                PointEmbedding.objects.update_or_create(
-                    point=point,
-                    defaults={"embedding": embedding}
-                )
-                refreshed += 1
+        job = jobs.enqueue("embed-refresh", {"force": bool(request.data.get("force"))})
+        return Response(
+            {"status": "success", "data": {"job_id": job.id, "kind": job.kind}},
+            status=status.HTTP_202_ACCEPTED
+        )
+
 
+class EmbedExportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        job = jobs.enqueue("embed-export")
         return Response(
-            {"status": "success", "refreshed_embeddings": refreshed},
-            status=status.HTTP_200_OK
+            {"status": "success", "data": {"job_id": job.id, "kind": job.kind}},
+            status=status.HTTP_202_ACCEPTED
         )
+
+
+class JobStatusView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(Job, id=job_id)
+        return Response({"status": "success", "data": jobs.job_status(job)}, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({"status": "success", "data": metrics.snapshot()}, status=status.HTTP_200_OK)
+
+
 class EmbedUpdatePointView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
@@ -56,15 +70,19 @@ class EmbedUpdatePointView(APIView):
         text = build_point_text(point)
 
         # генерируем новый эмбеддинг
-        embedding = generate_embedding(text)
+        provider = get_provider()
+        embedding = provider.embed_one(text)
 
         # обновляем или создаём запись
         with transaction.atomic():
             PointEmbedding.objects.update_or_create(
                 point=point,
-                defaults={"embedding": embedding}
+                defaults={"embedding": embedding, "text_hash": text_hash(text), "model": provider.model}
             )
 
+        # индекс города обновляем точечно, без полной пересборки
+        ann.upsert_vectors(point.city_id, [point.id], [embedding])
+
         return Response(
             {
                 "status": "success",
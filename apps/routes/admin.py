@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import City, CityArea, Interest, Mood, Point, PointEmbedding, Route, Feedback
+from .models import City, CityArea, Interest, Mood, Point, PointEmbedding, Route, RouteStop, Feedback
 
 
 @admin.register(City)
@@ -42,12 +42,19 @@ class PointEmbeddingAdmin(admin.ModelAdmin):
     search_fields = ("point__name",)
 
 
+class RouteStopInline(admin.TabularInline):
+    model = RouteStop
+    fields = ("position", "point", "planned_arrival")
+    raw_id_fields = ("point",)
+    extra = 0
+
+
 @admin.register(Route)
 class RouteAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "created_at", "total_duration", "total_cost", "status")
     search_fields = ("id", "user__username")
     list_filter = ("status", "created_at", "user")
-    filter_horizontal = ("points",)
+    inlines = (RouteStopInline,)
 
 
 @admin.register(Feedback)
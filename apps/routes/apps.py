@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class RoutesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.routes"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .generator.route_cache import register_metrics
+
+        register_metrics()
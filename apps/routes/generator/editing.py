@@ -0,0 +1,173 @@
+"""Точечная правка готового маршрута без полной генерации.
+
+Остальные точки маршрута остаются на своих местах: новая точка встаёт в самое дешёвое место
+(локальная вставка), затем 2-opt перебирает развороты только в окрестности правки. Матрица
+переходов берётся из общего кеша (travel.distance_cache), так что правка занимает миллисекунды.
+Замену без явной новой точки подбираем среди ближайших к убранной точек города — по общим
+интересам и настроениям, на единицу добавленного к маршруту времени.
+Правленый маршрут проверяется по условиям анкеты — времени, бюджету и часам работы точек;
+если не укладывается, правка отклоняется (для автоматической замены берём следующую по
+ценности подходящую точку).
+"""
+import numpy as np
+
+from .hours import RouteWindow, next_start_slots
+from .snapshot import CitySnapshot
+from .solver import RouteSolution, route_fits, route_solution
+from .travel import haversine_km, travel_minutes
+
+# Сколько ближайших к убранной точке кандидатов рассматриваем для автоматической замены
+REPLACE_CANDIDATES = 100
+# На сколько позиций в обе стороны от правки 2-opt может разворачивать участки
+EDIT_RADIUS = 3
+
+ACTIONS = ("replace", "remove", "insert")
+
+
+class RouteEditError(Exception):
+    """Правку применить нельзя (точки нет в маршруте, некем заменить и т.п.)."""
+
+
+def _insertion_costs(route: list[int], points: np.ndarray, travel: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Для каждой точки из points: лучшая позиция вставки в открытый путь route и добавленное время перехода."""
+    points = np.asarray(points)
+    if not route:
+        return np.zeros(points.size, dtype=np.int64), np.zeros(points.size)
+    r = np.asarray(route)
+    # (позиция, точка): перед первой, между соседями, после последней
+    added = np.empty((len(r) + 1, points.size))
+    added[0] = travel[points, r[0]]
+    added[1:-1] = travel[np.ix_(r[:-1], points)] + travel[np.ix_(points, r[1:])].T - travel[r[:-1], r[1:]][:, None]
+    added[-1] = travel[r[-1], points]
+    gap = added.argmin(axis=0)
+    return gap, added[gap, np.arange(points.size)]
+
+
+def _path_travel(route: list[int], travel: np.ndarray) -> float:
+    if len(route) < 2:
+        return 0.0
+    r = np.asarray(route)
+    return float(travel[r[:-1], r[1:]].sum())
+
+
+def local_two_opt(route: list[int], travel: np.ndarray, center: int, radius: int = EDIT_RADIUS) -> list[int]:
+    """2-opt только для разворотов, затрагивающих позиции center ± radius."""
+    route = list(route)
+    lo, hi = max(center - radius, 0), min(center + radius, len(route) - 1)
+    best = _path_travel(route, travel)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(lo, hi):
+            for k in range(i + 1, hi + 1):
+                candidate = route[:i] + route[i:k + 1][::-1] + route[k + 1:]
+                length = _path_travel(candidate, travel)
+                if length < best - 1e-6:
+                    route, best, improved = candidate, length, True
+    return route
+
+
+def _similarity(snapshot: CitySnapshot, rows: np.ndarray, like: int) -> np.ndarray:
+    shared = np.bitwise_count(snapshot.interest_mask[rows] & snapshot.interest_mask[like]).sum(axis=1)
+    shared += np.bitwise_count(snapshot.mood_mask[rows] & snapshot.mood_mask[like]).sum(axis=1)
+    return shared.astype(np.float64)
+
+
+def _replacement_candidates(snapshot: CitySnapshot, route_rows: list[int], removed: int) -> np.ndarray:
+    km = haversine_km(snapshot.lat[[removed]], snapshot.lng[[removed]], snapshot.lat, snapshot.lng)[0]
+    km[route_rows] = np.inf
+    km[removed] = np.inf
+    nearest = np.argsort(km)[:REPLACE_CANDIDATES]
+    return nearest[np.isfinite(km[nearest])]
+
+
+def edit_route(
+    snapshot: CitySnapshot, route_rows: list[int], action: str, row: int | None = None,
+    new_row: int | None = None, transport=None, time_budget: float | None = None,
+    cost_budget: int | None = None, window: RouteWindow | None = None,
+) -> tuple[np.ndarray, RouteSolution]:
+    """Правка маршрута в строках снапшота: replace (row -> new_row или подобранная), remove row, insert row.
+
+    time_budget, cost_budget и window (часы работы) — условия анкеты; None — не проверяем.
+    Возвращает, как plan_route, строки снапшота, по которым считалась матрица, и решение в их индексах.
+    """
+    if action not in ACTIONS:
+        raise RouteEditError(f"Неизвестное действие: {action}")
+    if row is None:
+        raise RouteEditError("Не указана точка")
+    if action in ("replace", "remove") and row not in route_rows:
+        raise RouteEditError("Точки нет в маршруте")
+    if action == "insert" and row in route_rows:
+        raise RouteEditError("Точка уже есть в маршруте")
+    if action == "remove" and len(route_rows) == 1:
+        raise RouteEditError("В маршруте должна остаться хотя бы одна точка")
+    if new_row is not None and new_row in route_rows:
+        raise RouteEditError("Новая точка уже есть в маршруте")
+
+    kept = [r for r in route_rows if r != row] if action != "insert" else list(route_rows)
+    candidates = []
+    if action == "insert":
+        candidates = [row]
+    elif action == "replace":
+        candidates = [new_row] if new_row is not None else list(_replacement_candidates(snapshot, route_rows, row))
+        if not candidates:
+            raise RouteEditError("Некем заменить точку")
+
+    # матрица по точкам маршрута, убранной точке и кандидатам — из общего кеша
+    rows = np.array(kept + [row] * (action != "insert") + candidates, dtype=np.int64)
+    travel = travel_minutes(snapshot, rows, transport)
+    visit, cost = snapshot.visit[rows], snapshot.cost[rows]
+    start_slots = next_start_slots(snapshot, rows, window) if window is not None else None
+    position_of = {int(r): i for i, r in enumerate(rows)}
+    base = [position_of[r] for r in kept]
+
+    def fits(route):
+        if time_budget is None and cost_budget is None and start_slots is None:
+            return True
+        limit = np.inf if time_budget is None else time_budget
+        return route_fits(visit, cost, travel, route, limit, cost_budget, start_slots)
+
+    if action == "remove":
+        center = route_rows.index(row)
+        choices = [None]
+    elif action == "replace" and new_row is None:
+        removed_pos = route_rows.index(row)
+        old_added = snapshot.visit[row] + _removal_gain(route_rows, removed_pos, position_of, travel)
+        choices = _rank_replacements(snapshot, base, row, candidates, position_of, travel, old_added)
+    else:
+        choices = candidates[:1]
+
+    for choice in choices:
+        route = list(base)
+        if choice is not None:
+            gap, _ = _insertion_costs(route, [position_of[choice]], travel)
+            center = int(gap[0])
+            route.insert(center, position_of[choice])
+        route = local_two_opt(route, travel, center)
+        if fits(route):
+            solution = route_solution(np.zeros(len(rows)), visit, cost, travel, route, start_slots)
+            return rows, solution
+    raise RouteEditError("После правки маршрут не укладывается во время, бюджет или часы работы точек")
+
+
+def _removal_gain(route_rows, pos, position_of, travel) -> float:
+    """Сколько времени перехода давала точка на позиции pos (то, что освобождается при её удалении)."""
+    prev = position_of[route_rows[pos - 1]] if pos > 0 else None
+    here = position_of[route_rows[pos]]
+    after = position_of[route_rows[pos + 1]] if pos + 1 < len(route_rows) else None
+    gain = (travel[prev, here] if prev is not None else 0.0) + (travel[here, after] if after is not None else 0.0)
+    if prev is not None and after is not None:
+        gain -= travel[prev, after]
+    return float(gain)
+
+
+def _rank_replacements(snapshot, route, removed, candidates, position_of, travel, old_added) -> list[int]:
+    """Кандидаты на замену от лучшего: похожие на убранную точку с лучшим сходством на минуту,
+    сперва те, что не удлиняют маршрут."""
+    _, travel_added = _insertion_costs(route, [position_of[c] for c in candidates], travel)
+    added = snapshot.visit[candidates] + travel_added
+    similarity = _similarity(snapshot, np.asarray(candidates), removed) + 1.0
+    value = similarity / np.maximum(added, 1.0)
+    fits = added <= old_added + 1e-9
+    order = np.lexsort((-value, ~fits))
+    return [int(candidates[i]) for i in order]
@@ -1,34 +1,417 @@
-
+import logging
+import time
 import uuid
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from apps.core import ann, metrics
+from apps.core.services import generate_embedding
+from apps.core.singleflight import get_flight
+from .scoring import score_points, semantic_scores, available_points
+from .snapshot import CitySnapshot, get_snapshot
+from .route_cache import bucket_budget, bucket_duration, route_cache, signature
+from .solver import solve_orienteering, RouteSolution, DEFAULT_DEADLINE_MS
+from apps.routes.services import save_generated_route
+from .hours import RouteWindow, next_start_slots, open_in_window, route_start
+from .travel import get_profile, travel_minutes
+
+# Сколько лучших по скору точек отдаём солверу
+MAX_CANDIDATES = 250
+# Альтернативные маршруты: сколько максимум, во сколько раз снижается скор точки за каждое
+# её появление в предыдущих маршрутах, какая доля общих точек допустима между двумя маршрутами
+ALTERNATIVES_MAX = 5
+ALTERNATIVE_PENALTY = 0.25
+MAX_OVERLAP = 0.3
+
+# Значения из формы (templates/core/quiz.html) -> верхняя граница бюджета, None — без ограничения
+BUDGET_PRESETS = {
+    "free": 0,
+    "0-500": 500,
+    "500-1000": 1000,
+    "1000+": None,
+}
+TIME_OF_DAY_ALIASES = {
+    "day": "afternoon",
+}
+
+
+NOTHING_FITS = "Ни одна точка не помещается в заданные время, бюджет и часы работы"
+
+logger = logging.getLogger(__name__)
+
+
+class RouteGenerationError(Exception):
+    """Маршрут построить нельзя (нет точек в городе, ничего не влезает в бюджет и т.п.)."""
+
+
+def parse_budget(value) -> int | None:
+    if value in (None, ""):
+        return None
+    if isinstance(value, str) and value in BUDGET_PRESETS:
+        return BUDGET_PRESETS[value]
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_time_of_day(value) -> str | None:
+    if not value:
+        return None
+    value = str(value).lower()
+    return TIME_OF_DAY_ALIASES.get(value, value)
+
+
+def _as_list(value) -> list:
+    if not value:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
 
-# Заглушка для ML-логики
-def generate_route_stub(city_id, time_of_day, interests, mood, budget, transport, duration_minutes, description, user):
+def prepare_candidates(
+    snapshot: CitySnapshot,
+    interests,
+    moods,
+    time_of_day,
+    budget: int | None,
+    duration_minutes: float,
+    month: int | None = None,
+    semantic_hits: list[tuple[str, float]] | None = None,
+    start: datetime | None = None,
+    include: int | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+    """Скоринг и отбор кандидатов: (скоры всех точек снапшота, индексы кандидатов, start_slots или None).
+
+    include — строка снапшота, которая должна остаться среди кандидатов (уже выбранный старт).
+    """
+    scores = score_points(snapshot, interests, moods, time_of_day)
+    if semantic_hits:
+        scores += semantic_scores(snapshot, semantic_hits)
+
+    window = RouteWindow(start, duration_minutes) if start is not None else None
+    if window is not None:
+        month = start.month
+    available = available_points(snapshot, duration_minutes, budget, month)
+    if window is not None:
+        available &= open_in_window(snapshot, window)
+    pool = np.flatnonzero(available)
+    if pool.size == 0:
+        return scores, pool, None
+
+    if pool.size > MAX_CANDIDATES:
+        top = np.argpartition(-scores[pool], MAX_CANDIDATES - 1)[:MAX_CANDIDATES]
+        pool = pool[top]
+    if include is not None and include not in pool:
+        pool = np.append(pool, include)
+
+    start_slots = None
+    if window is not None:
+        start_slots = next_start_slots(snapshot, pool, window)
+        fits = start_slots[:, 0] < window.n_slots
+        pool, start_slots = pool[fits], start_slots[fits]
+    return scores, pool, start_slots
+
+
+def plan_route(
+    snapshot: CitySnapshot,
+    interests,
+    moods,
+    time_of_day,
+    budget: int | None,
+    duration_minutes: float,
+    month: int | None = None,
+    semantic_hits: list[tuple[str, float]] | None = None,
+    deadline_ms: float = DEFAULT_DEADLINE_MS,
+    transport=None,
+    start: datetime | None = None,
+) -> tuple[np.ndarray, RouteSolution]:
+    """Чистая часть генерации без БД: скоринг, отбор кандидатов, солвер.
+
+    start — локальное время начала маршрута: тогда учитываются часы работы точек
+    (и месяц берётся из него). Возвращает индексы отобранных точек снапшота и решение в их терминах.
     """
-    В будущем здесь будет вызов ML-модуля.
-    Пока возвращаем фиктивный маршрут.
+    scores, pool, start_slots = prepare_candidates(
+        snapshot, interests, moods, time_of_day, budget, duration_minutes, month, semantic_hits, start
+    )
+    if pool.size == 0:
+        return pool, RouteSolution()
+
+    travel = travel_minutes(snapshot, pool, transport)
+    solution = solve_orienteering(
+        scores[pool],
+        snapshot.visit[pool],
+        snapshot.cost[pool],
+        travel,
+        time_budget=duration_minutes,
+        cost_budget=budget,
+        deadline_ms=deadline_ms,
+        start_slots=start_slots,
+    )
+    return pool, solution
+
+
+def route_overlap(a: list[int], b: list[int]) -> float:
+    """Доля общих точек относительно более короткого маршрута."""
+    if not a or not b:
+        return 0.0
+    return len(set(a) & set(b)) / min(len(a), len(b))
+
+
+def plan_alternatives(
+    snapshot: CitySnapshot,
+    interests,
+    moods,
+    time_of_day,
+    budget: int | None,
+    duration_minutes: float,
+    k: int,
+    month: int | None = None,
+    semantic_hits: list[tuple[str, float]] | None = None,
+    deadline_ms: float = DEFAULT_DEADLINE_MS,
+    transport=None,
+    start: datetime | None = None,
+) -> tuple[np.ndarray, list[RouteSolution]]:
+    """До k непохожих маршрутов из одного скоринга и одной матрицы переходов.
+
+    Каждый следующий маршрут решается со скорами, пониженными у уже использованных точек;
+    если он всё равно делит с каким-то из предыдущих больше MAX_OVERLAP точек, использованные
+    точки исключаются совсем. Скор в решениях — по исходным скорам.
     """
+    scores, pool, start_slots = prepare_candidates(
+        snapshot, interests, moods, time_of_day, budget, duration_minutes, month, semantic_hits, start
+    )
+    if pool.size == 0:
+        return pool, []
+
+    travel = travel_minutes(snapshot, pool, transport)
+    base = scores[pool]
+    uses = np.zeros(pool.size)
+    solutions = []
+
+    def solve(exclude=None):
+        return solve_orienteering(
+            base * ALTERNATIVE_PENALTY ** uses,
+            snapshot.visit[pool],
+            snapshot.cost[pool],
+            travel,
+            time_budget=duration_minutes,
+            cost_budget=budget,
+            deadline_ms=deadline_ms,
+            start_slots=start_slots,
+            exclude=exclude,
+        )
+
+    for _ in range(k):
+        solution = solve()
+        if any(route_overlap(solution.order, other.order) > MAX_OVERLAP for other in solutions):
+            solution = solve(exclude=np.flatnonzero(uses))
+        if not solution.order:
+            break
+        solutions.append(replace(solution, score=float(base[solution.order].sum())))
+        uses[solution.order] += 1
+    return pool, solutions
+
+
+def find_semantic_hits(city_id, description) -> list[tuple[str, float]]:
+    """Точки города, близкие по смыслу к свободному описанию. Без индекса или API — пусто.
+
+    Семантика — только добавка к скорингу: любая ошибка провайдера эмбеддингов (сеть, лимиты,
+    кеш на диске) или индекса (битые файлы, другая размерность) не должна ронять генерацию.
+    """
+    if not description or not str(description).strip():
+        return []
+    try:
+        vector = generate_embedding(str(description))
+        return ann.search(city_id, vector, k=MAX_CANDIDATES)
+    except Exception:
+        logger.warning("Семантический поиск по описанию не удался, строим маршрут без него", exc_info=True)
+        metrics.incr("route_generate.semantic_errors")
+        return []
+
+
+def _map_url(points: list[dict], rtt: str = "pd") -> str:
+    rtext = "~".join(f'{p["coordinates"]["lat"]},{p["coordinates"]["lng"]}' for p in points)
+    return f"https://yandex.ru/maps/?rtext={rtext}&rtt={rtt}"
+
+
+def format_point(snapshot: CitySnapshot, i: int, leg: float, arrival: float, profile, start=None) -> dict:
+    """Точка маршрута для ответа API; i — строка снапшота, arrival — минуты от начала маршрута."""
+    row = snapshot.rows[i]
+    cost = int(snapshot.cost[i])
+    arrival_at = start + timedelta(minutes=arrival) if start else None
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "description": row["description"],
+        "image_url": row["image_url"],
+        "visit_time": f'{row["average_visit_duration"]} мин',
+        "tags": [f"💸 {cost} ₽", f"{profile.icon} {round(leg)} мин"],
+        "coordinates": {"lat": float(snapshot.lat[i]), "lng": float(snapshot.lng[i])},
+        "arrival_time": arrival_at.strftime("%H:%M") if arrival_at else None,
+        "arrival_at": arrival_at.isoformat() if arrival_at else None,
+    }
+
+
+def format_route(snapshot: CitySnapshot, pool: np.ndarray, solution: RouteSolution, transport=None, start=None) -> dict:
+    """Маршрут для ответа API без route_id и user_id (их добавляет generate_route)."""
+    profile = get_profile(transport)
+    points = [
+        format_point(snapshot, int(pool[index]), leg, arrival, profile, start)
+        for index, leg, arrival in zip(solution.order, solution.legs, solution.arrivals)
+    ]
     return {
-        "route_id": str(uuid.uuid4())[:8],
-        "user_id": user.id,
-        "map_url": "https://yandex.ru/maps/?text=" + city_id,
-        "points": [
-            {
-                "id": "1",
-                "name": "Парк Горького",
-                "description": "Один из самых популярных парков города — идеально для прогулки вечером.",
-                "image_url": "https://example.com/gorky.jpg",
-                "visit_time": "30 мин",
-                "tags": ["🌳", "💸 0 ₽", "🚶 10 мин"],
-                "coordinates": {"lat": 55.792, "lng": 37.586},
-            },
-            {
-                "id": "2",
-                "name": "ВкусОчка",
-                "description": "Элитный ресторан Москвы",
-                "image_url": "https://example.com/gorky.jpg",
-                "visit_time": "30 мин",
-                "tags": ["🌳", "💸 1 ₽", "🚶 10 мин"],
-                "coordinates": {"lat": 55.792, "lng": 37.586},
-            }
-        ],
-    }
\ No newline at end of file
+        "map_url": _map_url(points, profile.yandex_rtt),
+        "transport": profile.name,
+        "total_duration": round(solution.total_minutes),
+        "total_travel_minutes": round(solution.travel_minutes),
+        "total_wait_minutes": round(solution.wait_minutes),
+        "start_at": start.isoformat() if start else None,
+        "total_cost": solution.total_cost,
+        "points": points,
+    }
+
+
+@dataclass
+class RouteRequest:
+    """Нормализованная анкета: то, что уходит в планировщик и в ключ кеша маршрутов."""
+    city_id: str
+    snapshot: CitySnapshot
+    interests: list
+    moods: list
+    time_of_day: str | None
+    budget: int | None
+    duration_minutes: float
+    transport: str
+    description: str | None
+    start: datetime
+    key: tuple
+
+    @property
+    def flight_key(self) -> str:
+        """Ключ singleflight: одно построение на одинаковые точные ограничения, а не на корзину кеша."""
+        return f"{self.snapshot.fingerprint}:{self.key!r}:{self.duration_minutes}:{self.budget}"
+
+    def accepts(self, payload) -> bool:
+        """Маршрут (или список альтернатив) из корзины кеша укладывается в точные длительность и бюджет."""
+        routes = payload if isinstance(payload, list) else [payload]
+        return all(
+            route["total_duration"] <= self.duration_minutes
+            and (self.budget is None or (route["total_cost"] or 0) <= self.budget)
+            for route in routes
+        )
+
+
+def prepare_request(
+    city_id, time_of_day, interests, mood, budget, transport, duration_minutes, description, start_at=None
+) -> RouteRequest:
+    """Проверяет и нормализует анкету; RouteGenerationError — если маршрут строить не из чего."""
+    try:
+        duration_minutes = float(duration_minutes)
+    except (TypeError, ValueError):
+        raise RouteGenerationError("duration_minutes должен быть числом")
+
+    snapshot = get_snapshot(city_id)
+    if not len(snapshot):
+        raise RouteGenerationError(f"В городе {city_id} нет точек")
+
+    time_of_day = normalize_time_of_day(time_of_day)
+    start = route_start(start_at, time_of_day)
+    interests, moods = _as_list(interests), _as_list(mood)
+    budget = parse_budget(budget)
+    transport = get_profile(transport).name
+    # корзины — только для ключа кеша, маршрут строится по точным значениям
+    key = signature(
+        snapshot, interests, moods, time_of_day, bucket_budget(budget), bucket_duration(duration_minutes),
+        transport, description, start,
+    )
+    return RouteRequest(
+        city_id, snapshot, interests, moods, time_of_day, budget, duration_minutes, transport, description, start, key
+    )
+
+
+def issue_route(payload: dict, req: RouteRequest, user) -> dict:
+    """Готовый маршрут получает свой route_id и сохраняется за пользователем вместе с условиями анкеты."""
+    route_data = {"route_id": str(uuid.uuid4())[:8], "user_id": getattr(user, "id", None), **payload}
+    save_generated_route(route_data, req.city_id, user, req.duration_minutes, req.budget)
+    return route_data
+
+
+def generate_route(
+    city_id, time_of_day, interests, mood, budget, transport, duration_minutes, description, user, start_at=None
+):
+    """Строит маршрут по анкете: снапшот города -> векторный скоринг -> солвер с дедлайном.
+
+    start_at — когда пользователь выходит; без него — сегодня по time_of_day или прямо сейчас.
+    """
+    req = prepare_request(
+        city_id, time_of_day, interests, mood, budget, transport, duration_minutes, description, start_at
+    )
+    payload = route_cache.get(req.key, req.accepts)
+    if payload is None:
+        def build():
+            started = time.perf_counter()
+            pool, solution = plan_route(
+                req.snapshot,
+                req.interests,
+                req.moods,
+                req.time_of_day,
+                req.budget,
+                req.duration_minutes,
+                semantic_hits=find_semantic_hits(city_id, description),
+                transport=req.transport,
+                start=req.start,
+            )
+            if not solution.order:
+                raise RouteGenerationError(NOTHING_FITS)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics.observe("route_generate.ms", elapsed_ms)
+            return format_route(req.snapshot, pool, solution, req.transport, req.start), elapsed_ms
+
+        # одинаковые одновременные запросы (в потоках и воркерах) ждут одно построение
+        payload, elapsed_ms = get_flight("route-generate").do(req.flight_key, build)
+        route_cache.put(req.key, payload, elapsed_ms)
+
+    return issue_route(payload, req, user)
+
+
+def generate_alternatives(
+    city_id, time_of_day, interests, mood, budget, transport, duration_minutes, description, user, start_at=None,
+    alternatives: int = 2,
+) -> list[dict]:
+    """Как generate_route, но до alternatives непохожих маршрутов за один проход (см. plan_alternatives)."""
+    req = prepare_request(
+        city_id, time_of_day, interests, mood, budget, transport, duration_minutes, description, start_at
+    )
+    k = max(1, min(int(alternatives), ALTERNATIVES_MAX))
+    key = req.key + (("alternatives", k),)
+    payloads = route_cache.get(key, req.accepts)
+    if payloads is None:
+        def build():
+            started = time.perf_counter()
+            pool, solutions = plan_alternatives(
+                req.snapshot,
+                req.interests,
+                req.moods,
+                req.time_of_day,
+                req.budget,
+                req.duration_minutes,
+                k,
+                semantic_hits=find_semantic_hits(city_id, description),
+                transport=req.transport,
+                start=req.start,
+            )
+            if not solutions:
+                raise RouteGenerationError(NOTHING_FITS)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics.observe("route_alternatives.ms", elapsed_ms)
+            routes = [format_route(req.snapshot, pool, solution, req.transport, req.start) for solution in solutions]
+            return routes, elapsed_ms
+
+        payloads, elapsed_ms = get_flight("route-generate").do(f"{req.flight_key}:{k}", build)
+        route_cache.put(key, payloads, elapsed_ms)
+
+    return [issue_route(payload, req, user) for payload in payloads]
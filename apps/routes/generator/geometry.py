@@ -0,0 +1,71 @@
+"""Протяжённость и геометрия готового маршрута — считаются один раз при сохранении.
+
+Длина плеча берётся из графа дорог города, если пара точек есть в его таблице (roads.py),
+иначе — прямая haversine с поправкой detour профиля транспорта, как в travel_minutes.
+Геометрия хранится encoded polyline (формат Google, точность 1e-5) по точкам маршрута.
+"""
+import numpy as np
+
+from .travel import EARTH_RADIUS_KM, get_profile
+
+POLYLINE_PRECISION = 5
+
+
+def leg_km(lat, lng) -> np.ndarray:
+    """Расстояния между соседними точками пути по дуге большого круга, км (len - 1 значений)."""
+    lat, lng = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lng, dtype=np.float64))
+    if lat.size < 2:
+        return np.zeros(0)
+    dlat, dlng = np.diff(lat), np.diff(lng)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def encode_polyline(lat, lng, precision: int = POLYLINE_PRECISION) -> str:
+    """Encoded polyline: дельты координат в целых единицах 1e-precision, zigzag и 5-битные группы."""
+    scale = 10 ** precision
+    coords = np.column_stack([
+        np.round(np.asarray(lat, dtype=np.float64) * scale),
+        np.round(np.asarray(lng, dtype=np.float64) * scale),
+    ]).astype(np.int64)
+    if not len(coords):
+        return ""
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chars = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return "".join(chars)
+
+
+def decode_polyline(encoded: str, precision: int = POLYLINE_PRECISION) -> list[tuple[float, float]]:
+    values, value, shift = [], 0, 0
+    for char in encoded:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1F) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    coords = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return [(float(lat), float(lng)) for lat, lng in coords]
+
+
+def route_geometry(city_id, point_ids, lat, lng, transport=None) -> tuple[float, str]:
+    """(протяжённость маршрута в км, encoded polyline) по точкам в порядке обхода."""
+    from .roads import get_graph
+
+    lat, lng = np.asarray(lat, dtype=np.float64), np.asarray(lng, dtype=np.float64)
+    profile = get_profile(transport)
+    legs = leg_km(lat, lng) * profile.detour
+    graph = get_graph(city_id) if profile.uses_roads and len(point_ids) > 1 else None
+    if graph is not None and graph.point_ids is not None:
+        road = graph.road_km(list(point_ids))
+        road = road[np.arange(len(point_ids) - 1), np.arange(1, len(point_ids))]
+        known = ~np.isnan(road)
+        legs[known] = road[known]
+    return round(float(legs.sum()), 3), encode_polyline(lat, lng)
@@ -0,0 +1,94 @@
+"""Окно маршрута по времени и часы работы точек из снапшота.
+
+Окно — слоты по 15 минут от начала маршрута до конца duration_minutes, с переходом через
+полночь и конец недели. Предфильтр по всему городу — побитовое И упакованных карт точек
+с маской окна; для отобранных кандидатов карты распаковываются, и для каждого слота
+считается ближайший слот, с которого визит целиком помещается в открытый интервал.
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from apps.routes.opening_hours import BYTES_PER_DAY, SLOT_MINUTES, SLOTS_PER_DAY
+from .snapshot import CitySnapshot
+
+# Начало маршрута по умолчанию для времени суток из анкеты
+TIME_OF_DAY_START = {
+    "morning": time(10, 0),
+    "afternoon": time(13, 0),
+    "evening": time(18, 0),
+    "night": time(22, 0),
+}
+
+
+def _ceil_to_slot(moment: datetime) -> datetime:
+    moment = moment.replace(second=0, microsecond=0)
+    return moment + timedelta(minutes=-moment.minute % SLOT_MINUTES)
+
+
+def route_start(start_at: datetime | None = None, time_of_day=None) -> datetime:
+    """Локальное время начала маршрута: явно заданное, иначе сегодня по времени суток, иначе сейчас."""
+    if start_at is not None:
+        if timezone.is_naive(start_at):
+            start_at = timezone.make_aware(start_at)
+        return _ceil_to_slot(timezone.localtime(start_at))
+
+    now = _ceil_to_slot(timezone.localtime())
+    default = TIME_OF_DAY_START.get(time_of_day)
+    if default is None:
+        return now
+    return max(now.replace(hour=default.hour, minute=default.minute), now)
+
+
+class RouteWindow:
+    """Слоты маршрута: первый слот — от начала недели дня старта, всего n_slots."""
+
+    def __init__(self, start: datetime, duration_minutes: float):
+        self.start = start
+        self.first_slot = start.weekday() * SLOTS_PER_DAY + (start.hour * 60 + start.minute) // SLOT_MINUTES
+        self.n_slots = max(int(np.ceil(duration_minutes / SLOT_MINUTES)), 1)
+
+    def packed_mask(self) -> np.ndarray:
+        """Маска окна в упаковке карт точек: (7, 12) uint8."""
+        bits = np.zeros(7 * SLOTS_PER_DAY, dtype=bool)
+        bits[(self.first_slot + np.arange(self.n_slots)) % bits.size] = True
+        return np.packbits(bits, bitorder="little").reshape(7, BYTES_PER_DAY)
+
+    def slot_bits(self, open_slots: np.ndarray) -> np.ndarray:
+        """Распакованные слоты окна для карт (P, 7, 12): (P, n_slots) bool."""
+        days = self.first_slot // SLOTS_PER_DAY + np.arange((self.first_slot % SLOTS_PER_DAY + self.n_slots - 1)
+                                                            // SLOTS_PER_DAY + 1)
+        bits = np.unpackbits(open_slots[:, days % 7], axis=-1, bitorder="little").reshape(len(open_slots), -1)
+        offset = self.first_slot % SLOTS_PER_DAY
+        return bits[:, offset:offset + self.n_slots].astype(bool)
+
+    def minutes_at(self, slot: int) -> float:
+        return float(slot * SLOT_MINUTES)
+
+
+def open_in_window(snapshot: CitySnapshot, window: RouteWindow) -> np.ndarray:
+    """Маска точек города, открытых хотя бы в один слот окна (побитовое И по всем точкам сразу)."""
+    mask = window.packed_mask()
+    return (snapshot.open_slots & mask).reshape(len(snapshot), -1).any(axis=1)
+
+
+def next_start_slots(snapshot: CitySnapshot, rows: np.ndarray, window: RouteWindow) -> np.ndarray:
+    """(P, n_slots + 1): для точки и слота t — ближайший слот >= t, с которого визит целиком
+    попадает в открытое время и в окно маршрута; n_slots — такого нет."""
+    bits = window.slot_bits(snapshot.open_slots[rows])
+    n = window.n_slots
+    need = np.maximum(np.ceil(snapshot.visit[rows] / SLOT_MINUTES).astype(np.int64), 1)
+
+    open_count = np.zeros((len(rows), n + 1), dtype=np.int64)
+    np.cumsum(bits, axis=1, out=open_count[:, 1:])
+    starts = np.arange(n)[None, :]
+    ends = starts + need[:, None]
+    inside = ends <= n
+    fits = inside & (
+        np.take_along_axis(open_count, np.minimum(ends, n), axis=1) - open_count[:, :n] == need[:, None]
+    )
+
+    result = np.full((len(rows), n + 1), n, dtype=np.int64)
+    result[:, :n] = np.where(fits, starts, n)
+    return np.minimum.accumulate(result[:, ::-1], axis=1)[:, ::-1]
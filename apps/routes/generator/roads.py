@@ -0,0 +1,424 @@
+"""Пешеходный граф дорог города и расстояния по нему между точками.
+
+Граф строится офлайн из выгрузки OSM (manage.py build_road_graph), обрезается по City.bbox
+и хранится в ROAD_GRAPH_DIR/{city_id}/ как набор .npy (CSR: indptr, indices, length в метрах,
+координаты узлов). Там же лежит таблица «точка -> точка»: для каждой точки — кратчайшие
+расстояния по графу до всех точек в радиусе MAX_LEG_KM. Со scipy они считаются пачками
+источников за вызов csgraph.dijkstra (indices=, limit=), без неё — Dijkstra на Python по
+точке за раз с ранней остановкой. Файлы открываются через mmap, поэтому воркеры делят их
+через page cache.
+
+Таблица покрывает только пары не дальше MAX_LEG_KM (по прямой и по дорогам): дальше пешком
+не ходят, а строк было бы O(N²). Пары дальше радиуса, точки дальше SNAP_MAX_METERS от графа
+и точки, добавленные после сборки таблицы, считаются по прямой с поправкой detour — сборка и
+road_km пишут об этом в лог.
+
+Каждая сборка пишется в новый каталог versions/{имя}/ (граф и таблица вместе), файл CURRENT
+указывает на активную версию и подменяется атомарно (os.replace), как в embedding_store:
+процесс видит либо старый набор файлов, либо новый целиком. CURRENT перечитывается
+не чаще раза в GRAPH_RECHECK_SECONDS; нет графа или файлы не читаются — расстояния по прямой.
+
+Во время запроса граф не обходится: матрица для кандидатов собирается из таблицы одним
+векторным gather (road_km), пары без записи в таблице остаются NaN и считаются по прямой
+до пересчёта таблицы (build_road_graph без --osm).
+"""
+import heapq
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .travel import EARTH_RADIUS_KM, haversine_km
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+except ImportError:  # без scipy — Dijkstra на Python по точке за раз
+    dijkstra = None
+
+# Дороги, по которым можно идти пешком (значения тега highway)
+WALKABLE_HIGHWAYS = {
+    "footway", "pedestrian", "path", "steps", "living_street", "residential", "service", "track",
+    "unclassified", "tertiary", "tertiary_link", "secondary", "secondary_link", "primary", "primary_link",
+    "cycleway", "bridleway", "corridor",
+}
+# Радиус таблицы расстояний между точками и максимальное расстояние привязки точки к графу
+MAX_LEG_KM = 5.0
+SNAP_MAX_METERS = 300.0
+# Шаг сетки для поиска ближайшего узла, градусы (~500 м по широте)
+SNAP_CELL_DEG = 0.005
+# Память под одну пачку источников csgraph.dijkstra: строка на источник по всем узлам графа (float64)
+DIJKSTRA_BATCH_BYTES = 256 * 1024 * 1024
+# Нулевой вес scipy считает отсутствием ребра; совпадающие узлы соединяем ребром в миллиметр
+MIN_EDGE_METERS = 1e-3
+
+# Как часто процесс проверяет CURRENT города, с; своя сборка видна сразу
+GRAPH_RECHECK_SECONDS = 30
+# Сколько версий графа оставлять на диске (открытые mmap переживут удаление в любом случае)
+KEEP_VERSIONS = 2
+
+GRAPH_FILES = ("lat", "lng", "indptr", "indices", "length")
+TABLE_FILES = ("point_ids", "point_indptr", "point_neighbors", "point_meters")
+
+logger = logging.getLogger(__name__)
+
+
+def graph_dir(city_id) -> Path:
+    return Path(settings.ROAD_GRAPH_DIR) / str(city_id)
+
+
+def _in_bbox(lat, lng, bbox) -> bool:
+    if not bbox:
+        return True
+    return bbox["min_lat"] <= lat <= bbox["max_lat"] and bbox["min_lon"] <= lng <= bbox["max_lon"]
+
+
+def parse_osm(path, bbox=None) -> dict:
+    """Пешеходные рёбра из OSM XML, узлы вне bbox отбрасываются.
+
+    Возвращает массивы графа (CSR, рёбра в обе стороны) по крупнейшей компоненте связности.
+    """
+    coords, edges = {}, []
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag == "node":
+            lat, lng = float(element.get("lat")), float(element.get("lon"))
+            if _in_bbox(lat, lng, bbox):
+                coords[int(element.get("id"))] = (lat, lng)
+        elif element.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            if tags.get("highway") in WALKABLE_HIGHWAYS and tags.get("foot") != "no" \
+                    and tags.get("access") not in ("private", "no"):
+                refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+                edges.extend(
+                    (a, b) for a, b in zip(refs, refs[1:]) if a in coords and b in coords and a != b
+                )
+        if element.tag in ("node", "way", "relation"):
+            element.clear()
+
+    used = sorted({node for edge in edges for node in edge})
+    number = {node: i for i, node in enumerate(used)}
+    lat = np.array([coords[node][0] for node in used])
+    lng = np.array([coords[node][1] for node in used])
+    src = np.array([number[a] for a, _ in edges], dtype=np.int64)
+    dst = np.array([number[b] for _, b in edges], dtype=np.int64)
+    return _largest_component(lat, lng, src, dst)
+
+
+def _csr(n, src, dst, length) -> tuple:
+    src, dst = np.concatenate([src, dst]), np.concatenate([dst, src])
+    length = np.concatenate([length, length])
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(src, minlength=n))
+    return indptr, dst[order].astype(np.int32), length[order].astype(np.float32)
+
+
+def _largest_component(lat, lng, src, dst) -> dict:
+    length = _edge_lengths(lat, lng, src, dst)
+    indptr, indices, _ = _csr(len(lat), src, dst, length)
+
+    component = np.full(len(lat), -1, dtype=np.int64)
+    ptr, nbr = indptr.tolist(), indices.tolist()
+    label = 0
+    for start in range(len(lat)):
+        if component[start] >= 0:
+            continue
+        component[start] = label
+        stack = [start]
+        while stack:
+            u = stack.pop()
+            for k in range(ptr[u], ptr[u + 1]):
+                v = nbr[k]
+                if component[v] < 0:
+                    component[v] = label
+                    stack.append(v)
+        label += 1
+
+    keep = component == np.argmax(np.bincount(component)) if label else np.zeros(0, dtype=bool)
+    renumber = np.cumsum(keep) - 1
+    edge_keep = keep[src] & keep[dst]
+    src, dst, length = renumber[src[edge_keep]], renumber[dst[edge_keep]], length[edge_keep]
+    n = int(keep.sum())
+    indptr, indices, length = _csr(n, src, dst, length)
+    return {"lat": lat[keep], "lng": lng[keep], "indptr": indptr, "indices": indices, "length": length}
+
+
+def _edge_lengths(lat, lng, src, dst) -> np.ndarray:
+    lat1, lng1, lat2, lng2 = (np.radians(x) for x in (lat[src], lng[src], lat[dst], lng[dst]))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return (2 * EARTH_RADIUS_KM * 1000 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))).astype(np.float32)
+
+
+
+
+class RoadGraph:
+    """Граф дорог города (mmap) и таблица расстояний между точками, если она построена."""
+
+    def __init__(self, directory: Path, stamp=None):
+        self.directory = directory
+        self.stamp = stamp
+        for name in GRAPH_FILES:
+            setattr(self, name, np.load(directory / f"{name}.npy", mmap_mode="r"))
+        self.point_ids = None
+        if (directory / "point_ids.npy").exists():
+            self.point_ids = np.load(directory / "point_ids.npy")
+            self.point_indptr = np.load(directory / "point_indptr.npy", mmap_mode="r")
+            self.point_neighbors = np.load(directory / "point_neighbors.npy", mmap_mode="r")
+            self.point_meters = np.load(directory / "point_meters.npy", mmap_mode="r")
+            self.point_row = {point_id: row for row, point_id in enumerate(self.point_ids.tolist())}
+        self._lists = None
+        self._matrix = None
+        self._grid = None
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _adjacency(self) -> tuple:
+        # Для Dijkstra на Python списки быстрее, чем индексация mmap-массивов по одному элементу
+        if self._lists is None:
+            self._lists = (self.indptr.tolist(), self.indices.tolist(), self.length.tolist())
+        return self._lists
+
+    def snap(self, lat, lng) -> tuple[np.ndarray, np.ndarray]:
+        """Ближайшие узлы графа для координат: (узлы, расстояние до узла в метрах); -1 — дальше SNAP_MAX_METERS."""
+        if self._grid is None:
+            cells = np.floor(np.stack([self.lat, self.lng], axis=1) / SNAP_CELL_DEG).astype(np.int64)
+            keys = cells[:, 0] * 1_000_000 + cells[:, 1]
+            order = np.argsort(keys, kind="stable")
+            self._grid = (keys[order], order)
+        keys, order = self._grid
+
+        lat, lng = np.atleast_1d(lat), np.atleast_1d(lng)
+        nodes = np.full(len(lat), -1, dtype=np.int64)
+        offsets = np.full(len(lat), np.inf)
+        for i, (point_lat, point_lng) in enumerate(zip(lat, lng)):
+            cell_lat, cell_lng = int(np.floor(point_lat / SNAP_CELL_DEG)), int(np.floor(point_lng / SNAP_CELL_DEG))
+            candidates = []
+            for d_lat in (-1, 0, 1):
+                for d_lng in (-1, 0, 1):
+                    key = (cell_lat + d_lat) * 1_000_000 + cell_lng + d_lng
+                    start, end = np.searchsorted(keys, [key, key + 1])
+                    candidates.append(order[start:end])
+            candidates = np.concatenate(candidates)
+            if not candidates.size:
+                continue
+            meters = haversine_km([point_lat], [point_lng], self.lat[candidates], self.lng[candidates])[0] * 1000
+            best = int(np.argmin(meters))
+            if meters[best] <= SNAP_MAX_METERS:
+                nodes[i], offsets[i] = candidates[best], meters[best]
+        return nodes, offsets
+
+    def shortest_paths(self, source: int, targets=None, limit_m: float = MAX_LEG_KM * 1000) -> dict:
+        """Dijkstra из source до расстояния limit_m; останавливается, когда все targets достигнуты."""
+        indptr, indices, length = self._adjacency()
+        dist = {source: 0.0}
+        done = set()
+        remaining = set(targets) if targets is not None else None
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            if remaining is not None:
+                remaining.discard(u)
+                if not remaining:
+                    break
+            for k in range(indptr[u], indptr[u + 1]):
+                v, nd = indices[k], d + length[k]
+                if nd <= limit_m and nd < dist.get(v, np.inf):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return {node: dist[node] for node in done}
+
+    def distances(self, sources, targets: list, limit_m: float = MAX_LEG_KM * 1000) -> list[np.ndarray]:
+        """Для каждого узла sources[k] — кратчайшие расстояния (м) до узлов targets[k]; inf — дальше limit_m."""
+        sources = np.asarray(sources, dtype=np.int64)
+        if dijkstra is None:
+            result = []
+            for source, target in zip(sources.tolist(), targets):
+                dist = self.shortest_paths(source, set(target.tolist()), limit_m) if len(target) else {}
+                result.append(np.array([dist.get(node, np.inf) for node in target.tolist()], dtype=np.float64))
+            return result
+
+        if self._matrix is None:
+            length = np.maximum(np.asarray(self.length, dtype=np.float64), MIN_EDGE_METERS)
+            self._matrix = csr_matrix((length, self.indices, self.indptr), shape=(len(self), len(self)))
+        # точки на одном узле делят один обход
+        unique, inverse = np.unique(sources, return_inverse=True)
+        result = [None] * len(sources)
+        batch = max(DIJKSTRA_BATCH_BYTES // (8 * max(len(self), 1)), 1)
+        for start in range(0, len(unique), batch):
+            dist = dijkstra(self._matrix, indices=unique[start:start + batch], limit=limit_m)
+            for k in np.flatnonzero((inverse >= start) & (inverse < start + batch)):
+                result[k] = dist[inverse[k] - start, np.asarray(targets[k], dtype=np.int64)]
+        return result
+
+    def many_to_many(self, sources, targets, limit_m: float = MAX_LEG_KM * 1000) -> np.ndarray:
+        """Матрица кратчайших расстояний (м) между узлами sources и targets; inf — дальше limit_m."""
+        targets = np.asarray(list(targets), dtype=np.int64)
+        result = np.full((len(sources), len(targets)), np.inf, dtype=np.float32)
+        for i, dist in enumerate(self.distances(sources, [targets] * len(sources), limit_m)):
+            result[i] = dist
+        return result
+
+    def road_km(self, point_ids) -> np.ndarray:
+        """Матрица расстояний по дорогам (км) между точками из таблицы; NaN — пары без записи."""
+        n = len(point_ids)
+        result = np.full((n, n), np.nan, dtype=np.float32)
+        np.fill_diagonal(result, 0.0)
+        if self.point_ids is None:
+            return result
+
+        table_rows = np.array([self.point_row.get(point_id, -1) for point_id in point_ids], dtype=np.int64)
+        known = np.flatnonzero(table_rows >= 0)
+        if known.size < n:
+            logger.info(
+                "Граф дорог %s: %d из %d точек нет в таблице (добавлены после сборки), для них расстояния по прямой",
+                self.directory, n - known.size, n,
+            )
+        if not known.size:
+            return result
+        position = np.full(len(self.point_ids), -1, dtype=np.int64)
+        position[table_rows[known]] = known
+
+        starts = self.point_indptr[table_rows[known]]
+        counts = self.point_indptr[table_rows[known] + 1] - starts
+        flat = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts) + np.arange(counts.sum())
+        row_of = np.repeat(known, counts)
+        col_of = position[self.point_neighbors[flat]]
+        hit = col_of >= 0
+        result[row_of[hit], col_of[hit]] = self.point_meters[flat][hit] / 1000
+        return result
+
+
+def build_point_table(graph: RoadGraph, point_ids, lat, lng, limit_km: float = MAX_LEG_KM) -> dict:
+    """Кратчайшие расстояния по графу между точками не дальше limit_km друг от друга.
+
+    В расстояние входит и привязка к графу на обоих концах (по прямой до ближайшего узла).
+    Пар дальше limit_km (по прямой или по дорогам) в таблице нет — см. описание модуля.
+    """
+    started = time.perf_counter()
+    nodes, offsets = graph.snap(lat, lng)
+    snapped = np.flatnonzero(nodes >= 0)
+    if snapped.size < len(point_ids):
+        logger.warning(
+            "%d из %d точек дальше %.0f м от графа дорог, для них расстояния по прямой",
+            len(point_ids) - snapped.size, len(point_ids), SNAP_MAX_METERS,
+        )
+    straight = haversine_km(lat[snapped], lng[snapped], lat[snapped], lng[snapped])
+    near = [snapped[(straight[k] <= limit_km) & (snapped != i)] for k, i in enumerate(snapped)]
+    found = graph.distances(nodes[snapped], [nodes[j] for j in near], limit_km * 1000)
+
+    neighbors, meters, counts = [], [], np.zeros(len(point_ids), dtype=np.int64)
+    for i, row, dist in zip(snapped, near, found):
+        reached = np.isfinite(dist)
+        neighbors.append(row[reached])
+        meters.append(dist[reached] + offsets[i] + offsets[row[reached]])
+        counts[i] = reached.sum()
+
+    indptr = np.zeros(len(point_ids) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(counts)
+    logger.info(
+        "Таблица точек: %d точек, %d пар в радиусе %.1f км за %.1f с (%s)",
+        len(point_ids), indptr[-1], limit_km, time.perf_counter() - started,
+        "scipy" if dijkstra is not None else "Dijkstra на Python",
+    )
+    return {
+        "point_ids": np.asarray(point_ids, dtype=str),
+        "point_indptr": indptr,
+        "point_neighbors": np.concatenate(neighbors).astype(np.int32) if neighbors else np.zeros(0, np.int32),
+        "point_meters": np.concatenate(meters).astype(np.float32) if meters else np.zeros(0, np.float32),
+    }
+
+
+def _versions_dir(city_id) -> Path:
+    return graph_dir(city_id) / "versions"
+
+
+def current_version(city_id) -> str | None:
+    try:
+        return (graph_dir(city_id) / "CURRENT").read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _publish(city_id, arrays: dict, link_from: str | None = None) -> str:
+    """Новая версия: arrays плюс жёсткие ссылки на файлы link_from, затем атомарная смена CURRENT."""
+    name = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    tmp = _versions_dir(city_id) / f".{name}.tmp"
+    tmp.mkdir(parents=True)
+    if link_from is not None:
+        for path in (_versions_dir(city_id) / link_from).glob("*.npy"):
+            if path.stem not in arrays:
+                try:
+                    os.link(path, tmp / path.name)
+                except OSError:
+                    shutil.copy2(path, tmp / path.name)
+    for file_name, array in arrays.items():
+        np.save(tmp / f"{file_name}.npy", array)
+    os.replace(tmp, _versions_dir(city_id) / name)
+
+    current = graph_dir(city_id) / f"CURRENT.{os.getpid()}.tmp"
+    current.write_text(name)
+    os.replace(current, graph_dir(city_id) / "CURRENT")
+    _cleanup(city_id, keep=name)
+    # свой процесс видит новую версию сразу, остальные — после GRAPH_RECHECK_SECONDS
+    _graphs.pop(city_id, None)
+    return name
+
+
+def _cleanup(city_id, keep: str) -> None:
+    versions = sorted(
+        (p for p in _versions_dir(city_id).iterdir() if not p.name.startswith(".")),
+        key=lambda p: int(p.name.split("-")[0]),
+    )
+    for path in versions[:-KEEP_VERSIONS]:
+        if path.name != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def save_graph(city_id, arrays: dict) -> str:
+    """Новый граф без таблицы точек: старая таблица к нему не относится."""
+    return _publish(city_id, {name: arrays[name] for name in GRAPH_FILES})
+
+
+def save_point_table(city_id, arrays: dict) -> str:
+    """Таблица точек для текущего графа; файлы графа переносятся в новую версию жёсткими ссылками."""
+    version = current_version(city_id)
+    if version is None:
+        raise FileNotFoundError(f"Граф города {city_id} не построен")
+    return _publish(city_id, {name: arrays[name] for name in TABLE_FILES}, link_from=version)
+
+
+# Графы в памяти процесса: city_id -> (когда проверяли CURRENT, версия, граф или None)
+_graphs: dict = {}
+_lock = threading.Lock()
+
+
+def get_graph(city_id) -> RoadGraph | None:
+    """Граф города или None, если его нет или файлы не читаются (тогда расстояния по прямой)."""
+    now = time.monotonic()
+    cached = _graphs.get(city_id)
+    if cached is not None and now - cached[0] < GRAPH_RECHECK_SECONDS:
+        return cached[2]
+    with _lock:
+        cached = _graphs.get(city_id)
+        if cached is not None and now - cached[0] < GRAPH_RECHECK_SECONDS:
+            return cached[2]
+        version = current_version(city_id)
+        graph = cached[2] if cached is not None and cached[1] == version else None
+        if graph is None and version is not None:
+            try:
+                graph = RoadGraph(_versions_dir(city_id) / version, version)
+            except (OSError, ValueError):
+                logger.warning("Граф дорог %s (%s) не читается, считаем по прямой", city_id, version, exc_info=True)
+        _graphs[city_id] = (now, version, graph)
+    return graph
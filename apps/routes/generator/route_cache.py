@@ -0,0 +1,120 @@
+"""Кеш готовых маршрутов по нормализованной сигнатуре запроса.
+
+Похожие анкеты сводятся к одной сигнатуре: интересы и настроения — отсортированное множество,
+длительность и бюджет в ключе округляются вниз до корзины, время суток и транспорт нормализуются.
+Маршрут строится по точным длительности и бюджету запроса, поэтому запись корзины отдаётся только
+если укладывается в точные ограничения нового запроса (accept в get), иначе это промах и маршрут
+строится заново. В ключ входит версия точек города,
+поэтому любое изменение точки (сигналы -> bump_version) делает старые записи недостижимыми.
+Кешируется маршрут без route_id и user_id — их каждый раз выдаёт generate_route.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from apps.core import metrics
+
+ROUTE_CACHE_MAX_ENTRIES = 2000
+ROUTE_CACHE_TTL = 10 * 60
+DURATION_BUCKET_MINUTES = 15
+# Границы корзин бюджета, ₽: бюджет округляется вниз до ближайшей
+BUDGET_BUCKETS = (0, 300, 500, 700, 1000, 1500, 2000, 3000, 5000, 10000)
+
+
+def bucket_duration(duration_minutes: float) -> float:
+    if duration_minutes < DURATION_BUCKET_MINUTES:
+        return float(duration_minutes)
+    return float(duration_minutes // DURATION_BUCKET_MINUTES * DURATION_BUCKET_MINUTES)
+
+
+def bucket_budget(budget: int | None) -> int | None:
+    if budget is None:
+        return None
+    return max(bound for bound in BUDGET_BUCKETS if bound <= budget)
+
+
+def _normalize_text(value) -> str:
+    return " ".join(str(value or "").lower().split())
+
+
+def signature(snapshot, interests, moods, time_of_day, budget, duration_minutes, transport, description, start) -> tuple:
+    """budget и duration_minutes — корзины bucket_budget/bucket_duration, а не точные значения."""
+    return (
+        snapshot.city_id,
+        snapshot.version,
+        tuple(sorted({str(value) for value in interests})),
+        tuple(sorted({str(value) for value in moods})),
+        time_of_day,
+        budget,
+        duration_minutes,
+        transport,
+        _normalize_text(description),
+        start.isoformat() if start else None,
+    )
+
+
+class RouteCache:
+    """LRU с TTL; метрики попаданий и сэкономленного времени пишутся в apps.core.metrics."""
+
+    def __init__(self, max_entries: int = ROUTE_CACHE_MAX_ENTRIES, ttl: float = ROUTE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, accept=None) -> dict | None:
+        """accept(payload) -> bool — подходит ли запись этому запросу; неподходящая остаётся для других."""
+        started = time.perf_counter()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is not None and accept is not None and not accept(entry[1]):
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            metrics.incr("route_cache.misses")
+            return None
+        metrics.incr("route_cache.hits")
+        metrics.observe("route_cache.saved_ms", max(entry[2] - (time.perf_counter() - started) * 1000, 0.0))
+        return entry[1]
+
+    def put(self, key, payload: dict, cost_ms: float) -> None:
+        """cost_ms — сколько заняло построение: столько экономит каждое попадание."""
+        city_id, version = key[0], key[1]
+        with self.lock:
+            for old in [k for k in self.entries if k[0] == city_id and k[1] != version]:
+                del self.entries[old]
+            self.entries[key] = (time.monotonic() + self.ttl, payload, cost_ms)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate_city(self, city_id) -> None:
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == city_id]:
+                del self.entries[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def hit_rate(self) -> float | None:
+        total = self.hits + self.misses
+        return round(self.hits / total, 4) if total else None
+
+
+route_cache = RouteCache()
+
+
+def register_metrics() -> None:
+    """Показатели кеша в /api/metrics/; вызывается из RoutesConfig.ready()."""
+    metrics.register_gauge("route_cache.entries", lambda: len(route_cache.entries))
+    metrics.register_gauge("route_cache.hit_rate", route_cache.hit_rate)
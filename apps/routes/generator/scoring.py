@@ -0,0 +1,59 @@
+import numpy as np
+
+from .snapshot import CitySnapshot, BEST_TIME_BITS
+
+# Веса составляющих скора
+BASE_SCORE = 0.1
+INTEREST_WEIGHT = 1.0
+MOOD_WEIGHT = 0.5
+TIME_OF_DAY_WEIGHT = 0.25
+SEMANTIC_WEIGHT = 1.0
+
+
+def _overlap(masks: np.ndarray, request: np.ndarray) -> np.ndarray:
+    """Число совпавших битов для каждой строки (N, W) с маской запроса (W,)."""
+    return np.bitwise_count(masks & request).sum(axis=1, dtype=np.int64)
+
+
+def score_points(snapshot: CitySnapshot, interests, moods, time_of_day) -> np.ndarray:
+    """Скор всех точек города разом: доля совпавших интересов и настроений плюс время суток.
+
+    Базовое значение ненулевое, чтобы при пустой анкете маршрут всё равно строился.
+    """
+    scores = np.full(len(snapshot), BASE_SCORE)
+
+    interests = set(interests)
+    if interests:
+        request = snapshot.encode_interests(interests)
+        scores += INTEREST_WEIGHT * _overlap(snapshot.interest_mask, request) / len(interests)
+
+    moods = set(moods)
+    if moods:
+        request = snapshot.encode_moods(moods)
+        scores += MOOD_WEIGHT * _overlap(snapshot.mood_mask, request) / len(moods)
+
+    bit = BEST_TIME_BITS.get(time_of_day)
+    if bit:
+        scores += TIME_OF_DAY_WEIGHT * ((snapshot.time_mask & bit) != 0)
+
+    return scores
+
+
+def semantic_scores(snapshot: CitySnapshot, hits: list[tuple[str, float]]) -> np.ndarray:
+    """Близость точек к свободному описанию из анкеты (результат поиска по ANN-индексу)."""
+    scores = np.zeros(len(snapshot))
+    for point_id, similarity in hits:
+        i = snapshot.index.get(point_id)
+        if i is not None:
+            scores[i] = max(similarity, 0.0)
+    return SEMANTIC_WEIGHT * scores
+
+
+def available_points(snapshot: CitySnapshot, duration_minutes: float, budget: int | None, month: int | None) -> np.ndarray:
+    """Маска точек, которые вообще можно поставить в маршрут."""
+    mask = snapshot.visit <= duration_minutes
+    if budget is not None:
+        mask &= snapshot.cost <= budget
+    if month is not None:
+        mask &= (snapshot.month_mask & (1 << (month - 1))) != 0
+    return mask
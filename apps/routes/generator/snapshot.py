@@ -0,0 +1,214 @@
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+
+from apps.routes.models import City, Point
+from apps.routes.opening_hours import ALWAYS_OPEN, BYTES_PER_DAY
+
+# Страховка на случай изменений мимо сигналов (queryset.update, bulk_create)
+SNAPSHOT_MAX_AGE = 15 * 60
+# Как долго процесс доверяет прочитанной версии точек города, с
+VERSION_CHECK_SECONDS = 1.0
+
+BEST_TIME_BITS = {
+    "morning": 1 << 0,
+    "afternoon": 1 << 1,
+    "evening": 1 << 2,
+    "night": 1 << 3,
+}
+ANY_TIME = (1 << len(BEST_TIME_BITS)) - 1
+
+
+@dataclass
+class CitySnapshot:
+    """Точки одного города в памяти процесса: координаты, битовые маски, вектора стоимости и времени.
+
+    interest_mask/mood_mask — (N, W) uint64, бит i соответствует interest_bits/mood_bits.
+    time_mask — биты BEST_TIME_BITS, month_mask — бит m-1 для месяца m.
+    open_slots — (N, 7, 12) uint8: битовая карта открытых 15-минутных слотов по дням недели
+    (см. opening_hours.py); у точек без режима работы все биты выставлены.
+    version — City.points_version на момент сборки; fingerprint — хеш набора точек.
+    """
+    city_id: str
+    version: int
+    ids: list
+    lat: np.ndarray
+    lng: np.ndarray
+    visit: np.ndarray
+    cost: np.ndarray
+    interest_mask: np.ndarray
+    mood_mask: np.ndarray
+    time_mask: np.ndarray
+    month_mask: np.ndarray
+    open_slots: np.ndarray
+    interest_bits: dict
+    mood_bits: dict
+    rows: list
+    built_at: float = field(default_factory=time.monotonic)
+    index: dict = field(init=False)
+    fingerprint: str = field(init=False)
+
+    def __post_init__(self):
+        self.index = {point_id: i for i, point_id in enumerate(self.ids)}
+        self.fingerprint = hashlib.blake2b("\n".join(map(str, self.ids)).encode(), digest_size=12).hexdigest()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode_interests(self, interest_ids) -> np.ndarray:
+        return encode_mask(self.interest_bits, interest_ids, self.interest_mask.shape[1])
+
+    def encode_moods(self, mood_ids) -> np.ndarray:
+        return encode_mask(self.mood_bits, mood_ids, self.mood_mask.shape[1])
+
+
+def encode_mask(bits: dict, ids, words: int) -> np.ndarray:
+    """Набор id -> маска из words слов uint64. Неизвестные id игнорируются."""
+    mask = np.zeros(words, dtype=np.uint64)
+    for value in ids:
+        bit = bits.get(value)
+        if bit is not None:
+            mask[bit // 64] |= np.uint64(1 << (bit % 64))
+    return mask
+
+
+def _words(count: int) -> int:
+    return max(1, (count + 63) // 64)
+
+
+def best_time_mask(values) -> int:
+    """best_visit_time -> биты BEST_TIME_BITS; строка — одно значение, "any" — любое время, пусто — 0."""
+    if not values:
+        return 0
+    if isinstance(values, str):
+        values = [values]
+    mask = 0
+    for value in values:
+        if value == "any":
+            return ANY_TIME
+        mask |= BEST_TIME_BITS.get(value, 0)
+    return mask
+
+
+def build_snapshot(city_id, version: int = 0) -> CitySnapshot:
+    """Собираем снапшот тремя запросами: точки + обе m2m-таблицы."""
+    rows = list(
+        Point.objects.filter(city_id=city_id).order_by("id").values(
+            "id", "name", "description", "image_url", "tags",
+            "coordinates_lat", "coordinates_lng",
+            "average_visit_duration", "average_cost",
+            "best_visit_time", "month_mask", "open_slots",
+        )
+    )
+    position = {row["id"]: i for i, row in enumerate(rows)}
+
+    interest_links = list(
+        Point.interests.through.objects.filter(point__city_id=city_id).values_list("point_id", "interest_id")
+    )
+    mood_links = list(
+        Point.moods.through.objects.filter(point__city_id=city_id).values_list("point_id", "mood_id")
+    )
+    interest_bits = {value: i for i, value in enumerate(sorted({v for _, v in interest_links}))}
+    mood_bits = {value: i for i, value in enumerate(sorted({v for _, v in mood_links}))}
+
+    interest_mask = np.zeros((len(rows), _words(len(interest_bits))), dtype=np.uint64)
+    for point_id, interest_id in interest_links:
+        bit = interest_bits[interest_id]
+        interest_mask[position[point_id], bit // 64] |= np.uint64(1 << (bit % 64))
+
+    mood_mask = np.zeros((len(rows), _words(len(mood_bits))), dtype=np.uint64)
+    for point_id, mood_id in mood_links:
+        bit = mood_bits[mood_id]
+        mood_mask[position[point_id], bit // 64] |= np.uint64(1 << (bit % 64))
+
+    return CitySnapshot(
+        city_id=city_id,
+        version=version,
+        ids=[row["id"] for row in rows],
+        lat=np.array([float(row["coordinates_lat"]) for row in rows], dtype=np.float64),
+        lng=np.array([float(row["coordinates_lng"]) for row in rows], dtype=np.float64),
+        visit=np.array([row["average_visit_duration"] for row in rows], dtype=np.float64),
+        cost=np.array([row["average_cost"] or 0 for row in rows], dtype=np.int64),
+        interest_mask=interest_mask,
+        mood_mask=mood_mask,
+        time_mask=np.array([best_time_mask(row["best_visit_time"]) for row in rows], dtype=np.uint8),
+        month_mask=np.array([row["month_mask"] for row in rows], dtype=np.uint16),
+        open_slots=np.frombuffer(
+            b"".join(bytes(row["open_slots"]) if row["open_slots"] else ALWAYS_OPEN for row in rows), dtype=np.uint8
+        ).reshape(len(rows), 7, BYTES_PER_DAY),
+        interest_bits=interest_bits,
+        mood_bits=mood_bits,
+        rows=[
+            {
+                "id": row["id"],
+                "name": row["name"],
+                "description": row["description"],
+                "image_url": row["image_url"],
+                "tags": row["tags"],
+                "average_visit_duration": row["average_visit_duration"],
+            }
+            for row in rows
+        ],
+    )
+
+
+# Прочитанная из БД версия точек города: city_id -> (версия, когда читали по time.monotonic)
+_versions: dict = {}
+
+
+def get_version(city_id) -> int:
+    """Версия точек города из БД — общая для всех воркеров.
+
+    Запрос по первичному ключу идёт не чаще раза в VERSION_CHECK_SECONDS на город, остальные
+    вызовы отвечают из памяти; изменения из других процессов видны с такой задержкой.
+    """
+    now = time.monotonic()
+    cached = _versions.get(city_id)
+    if cached is not None and now - cached[1] < VERSION_CHECK_SECONDS:
+        return cached[0]
+    version = City.objects.filter(id=city_id).values_list("points_version", flat=True).first() or 0
+    _versions[city_id] = (version, now)
+    return version
+
+
+def bump_version(city_id) -> None:
+    """Сдвигаем версию точек города — снапшоты во всех процессах пересоберутся при следующей проверке версии.
+
+    Счётчик меняется в той же транзакции, что и точки: откат изменения откатывает и его.
+    Свой процесс забывает прочитанную версию сразу и ещё раз после коммита.
+    """
+    if city_id is not None:
+        City.objects.filter(id=city_id).update(points_version=F("points_version") + 1)
+        _versions.pop(city_id, None)
+        transaction.on_commit(lambda: _versions.pop(city_id, None))
+
+
+_snapshots: dict = {}
+_lock = threading.Lock()
+
+
+def get_snapshot(city_id) -> CitySnapshot:
+    """Снапшот города из памяти процесса; пересобираем, только если версия точек сменилась."""
+    version = get_version(city_id)
+    snapshot = _snapshots.get(city_id)
+    if snapshot is not None and snapshot.version == version \
+            and time.monotonic() - snapshot.built_at < SNAPSHOT_MAX_AGE:
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshots.get(city_id)
+        if snapshot is None or snapshot.version != version \
+                or time.monotonic() - snapshot.built_at >= SNAPSHOT_MAX_AGE:
+            snapshot = build_snapshot(city_id, version)
+            _snapshots[city_id] = snapshot
+    return snapshot
+
+
+def drop_snapshots() -> None:
+    _snapshots.clear()
+    _versions.clear()
@@ -0,0 +1,294 @@
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Жёсткий лимит работы солвера по умолчанию, мс
+DEFAULT_DEADLINE_MS = 100
+# Сколько лучших кандидатов на шаге жадной вставки проверяем расписанием, если есть часы работы
+WINDOW_TRIES = 20
+SLOT_MINUTES = 15
+
+
+@dataclass
+class RouteSolution:
+    """Результат решения задачи ориентирования.
+
+    order — индексы кандидатов в порядке посещения,
+    legs — время перехода к каждой точке от предыдущей (у первой 0),
+    arrivals — начало визита в минутах от старта маршрута (с учётом ожидания открытия).
+    """
+    order: list[int] = field(default_factory=list)
+    legs: list[float] = field(default_factory=list)
+    arrivals: list[float] = field(default_factory=list)
+    visit_minutes: float = 0.0
+    travel_minutes: float = 0.0
+    wait_minutes: float = 0.0
+    total_cost: int = 0
+    score: float = 0.0
+
+    @property
+    def total_minutes(self) -> float:
+        return self.visit_minutes + self.travel_minutes + self.wait_minutes
+
+
+def allowed_points(visit, cost, time_budget: float, cost_budget: int | None = None, start_slots=None) -> np.ndarray:
+    """Кандидаты, которые по отдельности укладываются в бюджеты времени, денег и свои часы работы."""
+    allowed = visit <= time_budget
+    if cost_budget is not None:
+        allowed &= cost <= cost_budget
+    if start_slots is not None:
+        allowed &= start_slots[:, 0] * SLOT_MINUTES + visit <= time_budget
+    return allowed
+
+
+class _Solver:
+    def __init__(self, scores, visit, cost, travel, time_budget, cost_budget, deadline, start_slots=None,
+                 start_clock=0.0):
+        self.start_slots = start_slots
+        self.scores = scores
+        self.visit = visit
+        self.cost = cost
+        self.travel = travel
+        self.time_budget = time_budget
+        self.cost_budget = cost_budget
+        self.deadline = deadline
+        # Минута от начала маршрута, в которую начинается визит стартовой точки (при досчёте хвоста маршрута)
+        self.start_clock = start_clock
+
+        self.allowed = allowed_points(visit, cost, time_budget, cost_budget, start_slots)
+        if start_slots is not None:
+            self.n_slots = start_slots.shape[1] - 1
+
+    def expired(self) -> bool:
+        return time.perf_counter() >= self.deadline
+
+    def path_travel(self, route: list[int]) -> float:
+        if len(route) < 2:
+            return 0.0
+        r = np.asarray(route)
+        return float(self.travel[r[:-1], r[1:]].sum())
+
+    def route_time(self, route: list[int]) -> float:
+        if self.start_slots is not None:
+            arrivals = self.schedule(route)
+            return np.inf if arrivals is None else arrivals[-1] + float(self.visit[route[-1]])
+        return self.start_clock + float(self.visit[route].sum()) + self.path_travel(route)
+
+    def schedule(self, route: list[int]) -> list[float] | None:
+        """Начало каждого визита с ожиданием открытия; None — точка не успевает в свои часы работы."""
+        arrivals, clock, prev = [], self.start_clock, None
+        for point in route:
+            if prev is not None:
+                clock += float(self.travel[prev, point])
+            slot = int(np.ceil(clock / SLOT_MINUTES - 1e-9))
+            if slot > self.n_slots:
+                return None
+            start = self.start_slots[point, slot]
+            if start >= self.n_slots:
+                return None
+            clock = max(clock, float(start * SLOT_MINUTES))
+            arrivals.append(clock)
+            clock += float(self.visit[point])
+            prev = point
+        return arrivals
+
+    def fits(self, route: list[int]) -> bool:
+        return self.route_time(route) <= self.time_budget + 1e-9
+
+    def route_cost(self, route: list[int]) -> int:
+        return int(self.cost[route].sum())
+
+    def route_score(self, route: list[int]) -> float:
+        return float(self.scores[route].sum())
+
+    def better(self, a: list[int], b: list[int]) -> bool:
+        score_a, score_b = self.route_score(a), self.route_score(b)
+        if abs(score_a - score_b) > 1e-9:
+            return score_a > score_b
+        return self.path_travel(a) < self.path_travel(b) - 1e-6
+
+    def insert_greedy(self, route: list[int]) -> list[int]:
+        """Жадная вставка: на каждом шаге берём точку с лучшим
+        отношением скора к добавленному времени и ставим её в самое дешёвое место."""
+        route = list(route)
+        in_route = np.zeros(len(self.scores), dtype=bool)
+        in_route[route] = True
+        # Без ожидания открытия: для проверки ok это необходимое условие и при часах работы
+        time_used = self.start_clock + float(self.visit[route].sum()) + self.path_travel(route)
+        cost_used = self.route_cost(route)
+
+        while not self.expired():
+            cand = np.flatnonzero(self.allowed & ~in_route)
+            if cand.size == 0:
+                break
+
+            r = np.asarray(route)
+            # Вставка после позиции g: prev -> cand -> next (у последней позиции next нет — путь открытый)
+            delta = self.travel[np.ix_(r, cand)].astype(np.float64)
+            if len(r) > 1:
+                delta[:-1] += (
+                    self.travel[np.ix_(cand, r[1:])].T
+                    - self.travel[r[:-1], r[1:]][:, None]
+                )
+            gap = delta.argmin(axis=0)
+            added = delta[gap, np.arange(cand.size)] + self.visit[cand]
+
+            ok = time_used + added <= self.time_budget + 1e-9
+            if self.cost_budget is not None:
+                ok &= cost_used + self.cost[cand] <= self.cost_budget
+            if not ok.any():
+                break
+
+            ratio = np.where(ok, self.scores[cand] / np.maximum(added, 1.0), -np.inf)
+            if self.start_slots is None:
+                best = int(np.argmax(ratio))
+            else:
+                # added — оценка снизу (без ожидания открытия), поэтому лучших кандидатов проверяем расписанием
+                best = None
+                for i in np.argsort(-ratio)[:WINDOW_TRIES]:
+                    if ratio[i] == -np.inf:
+                        break
+                    if self.fits(route[:gap[i] + 1] + [int(cand[i])] + route[gap[i] + 1:]):
+                        best = int(i)
+                        break
+                if best is None:
+                    break
+            point = int(cand[best])
+
+            route.insert(int(gap[best]) + 1, point)
+            in_route[point] = True
+            time_used += float(added[best])
+            cost_used += int(self.cost[point])
+
+        return route
+
+    def two_opt(self, route: list[int]) -> list[int]:
+        """2-opt для открытого пути с фиксированной стартовой точкой."""
+        route = list(route)
+        best_travel = self.path_travel(route)
+        improved = True
+        while improved and not self.expired():
+            improved = False
+            for i in range(1, len(route) - 1):
+                for k in range(i + 1, len(route)):
+                    candidate = route[:i] + route[i:k + 1][::-1] + route[k + 1:]
+                    travel = self.path_travel(candidate)
+                    if travel < best_travel - 1e-6 and (self.start_slots is None or self.fits(candidate)):
+                        route, best_travel = candidate, travel
+                        improved = True
+                        break
+                if improved or self.expired():
+                    break
+        return route
+
+    def replace_weakest(self, route: list[int]) -> list[int]:
+        """Пробуем выкинуть слабые точки и заполнить освободившееся время заново."""
+        best, best_score = route, self.route_score(route)
+        ratio = self.scores[route[1:]] / np.maximum(self.visit[route[1:]], 1.0)
+        for pos in np.argsort(ratio):
+            if self.expired():
+                break
+            trial = best[:]
+            removed = route[int(pos) + 1]
+            if removed not in trial:
+                continue
+            trial.remove(removed)
+            self.allowed[removed] = False
+            trial = self.insert_greedy(self.two_opt(trial))
+            self.allowed[removed] = True
+            score = self.route_score(trial)
+            if score > best_score + 1e-9:
+                best, best_score = trial, score
+        return best
+
+    def solution(self, route: list[int]) -> RouteSolution:
+        r = np.asarray(route)
+        legs = [0.0] + [float(x) for x in self.travel[r[:-1], r[1:]]]
+        arrivals = self.schedule(route) if self.start_slots is not None else None
+        if arrivals is None:
+            arrivals = list(
+                self.start_clock + np.cumsum(legs) + np.concatenate([[0.0], np.cumsum(self.visit[r])[:-1]])
+            )
+        visit_minutes = float(self.visit[r].sum())
+        return RouteSolution(
+            order=[int(i) for i in route],
+            legs=legs,
+            arrivals=[float(x) for x in arrivals],
+            visit_minutes=visit_minutes,
+            travel_minutes=float(sum(legs)),
+            wait_minutes=max(
+                arrivals[-1] + float(self.visit[r[-1]]) - self.start_clock - visit_minutes - sum(legs), 0.0
+            ),
+            total_cost=self.route_cost(route),
+            score=self.route_score(route),
+        )
+
+
+def _make_solver(scores, visit, cost, travel, time_budget, cost_budget, deadline, start_slots, start_clock=0.0):
+    return _Solver(
+        np.asarray(scores, dtype=np.float64),
+        np.asarray(visit, dtype=np.float64),
+        np.asarray(cost, dtype=np.int64),
+        np.asarray(travel),
+        float(time_budget),
+        cost_budget,
+        deadline,
+        start_slots,
+        start_clock,
+    )
+
+
+def route_solution(scores, visit, cost, travel, route: list[int], start_slots=None) -> RouteSolution:
+    """Решение для уже выбранного порядка точек (без оптимизации): плечи, расписание, итоги."""
+    return _make_solver(scores, visit, cost, travel, np.inf, None, 0.0, start_slots).solution(route)
+
+
+def route_fits(visit, cost, travel, route: list[int], time_budget: float, cost_budget: int | None = None,
+               start_slots=None) -> bool:
+    """Укладывается ли готовый порядок точек в бюджеты времени, денег и часы работы (start_slots)."""
+    solver = _make_solver(np.zeros(len(visit)), visit, cost, travel, time_budget, cost_budget, 0.0, start_slots)
+    return solver.fits(route) and (cost_budget is None or solver.route_cost(route) <= cost_budget)
+
+
+def solve_orienteering(
+    scores,
+    visit,
+    cost,
+    travel,
+    time_budget: float,
+    cost_budget: int | None = None,
+    start: int | None = None,
+    deadline_ms: float = DEFAULT_DEADLINE_MS,
+    start_slots=None,
+    start_clock: float = 0.0,
+    exclude=None,
+) -> RouteSolution:
+    """Эвристика для задачи ориентирования с ограничением по времени.
+
+    Жадная вставка + локальный поиск (2-opt и замена слабых точек),
+    всё укладывается в deadline_ms — по истечении отдаём лучшее найденное.
+    travel — матрица времени переходов между кандидатами в минутах.
+    start_slots — часы работы (hours.next_start_slots): визит начинается не раньше открытия
+    и целиком укладывается в открытый интервал, ожидание входит в бюджет времени.
+    start_clock и exclude — для досчёта хвоста маршрута: визит в start начинается в минуту
+    start_clock от начала маршрута (time_budget тоже от начала), точки exclude уже пройдены.
+    """
+    deadline = time.perf_counter() + deadline_ms / 1000
+    solver = _make_solver(scores, visit, cost, travel, time_budget, cost_budget, deadline, start_slots, start_clock)
+    if exclude is not None:
+        solver.allowed[np.asarray(exclude, dtype=np.int64)] = False
+    if not solver.allowed.any():
+        return RouteSolution()
+
+    if start is None or not solver.allowed[start]:
+        start = int(np.argmax(np.where(solver.allowed, solver.scores, -np.inf)))
+
+    route = solver.insert_greedy([start])
+    while not solver.expired():
+        improved = solver.replace_weakest(solver.insert_greedy(solver.two_opt(route)))
+        if not solver.better(improved, route):
+            break
+        route = improved
+
+    return solver.solution(route)
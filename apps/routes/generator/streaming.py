@@ -0,0 +1,131 @@
+"""Потоковая генерация маршрута: точки отдаются клиенту по мере того, как солвер их фиксирует.
+
+Старт выбирается сразу после скоринга — до запроса эмбеддинга описания и матрицы переходов,
+поэтому первая точка уходит через единицы миллисекунд. Дальше маршрут достраивается
+скользящим горизонтом: на каждом шаге солвер решает задачу для хвоста от последней
+зафиксированной точки (с оставшимися временем и деньгами) за короткий дедлайн, и первая точка
+его решения фиксируется. Зафиксированный префикс больше не меняется, так что каждое
+отправленное событие окончательное.
+"""
+import time
+
+import numpy as np
+
+from apps.core import metrics
+from .generator import (
+    NOTHING_FITS, RouteRequest, find_semantic_hits, format_point, format_route, issue_route, prepare_candidates,
+)
+from .route_cache import route_cache
+from .snapshot import CitySnapshot
+from .solver import SLOT_MINUTES, RouteSolution, allowed_points, route_solution, solve_orienteering
+from .travel import get_profile, travel_minutes
+
+# Дедлайн солвера на один шаг скользящего горизонта, мс
+STREAM_STEP_DEADLINE_MS = 15
+
+
+def stream_plan(
+    snapshot: CitySnapshot,
+    interests,
+    moods,
+    time_of_day,
+    budget: int | None,
+    duration_minutes: float,
+    semantic=None,
+    transport=None,
+    start=None,
+    step_deadline_ms: float = STREAM_STEP_DEADLINE_MS,
+):
+    """Чистая часть потоковой генерации (без БД), генератор событий:
+
+    ("point", строка снапшота, плечо, прибытие в минутах от начала) — по одной на точку, первая — старт;
+    ("done", pool, solution) — последним, solution в индексах pool, как у plan_route.
+    semantic — функция без аргументов, возвращающая семантические попадания; вызывается после старта.
+    """
+    scores, pool, start_slots = prepare_candidates(
+        snapshot, interests, moods, time_of_day, budget, duration_minutes, start=start
+    )
+    allowed = allowed_points(
+        snapshot.visit[pool].astype(np.float64), snapshot.cost[pool], duration_minutes, budget, start_slots
+    )
+    if not allowed.any():
+        yield "done", pool, RouteSolution()
+        return
+
+    first = int(np.argmax(np.where(allowed, scores[pool], -np.inf)))
+    first_row = int(pool[first])
+    yield "point", first_row, 0.0, float(start_slots[first, 0] * SLOT_MINUTES) if start_slots is not None else 0.0
+
+    hits = semantic() if semantic is not None else None
+    if hits:
+        scores, pool, start_slots = prepare_candidates(
+            snapshot, interests, moods, time_of_day, budget, duration_minutes,
+            semantic_hits=hits, start=start, include=first_row,
+        )
+    travel = travel_minutes(snapshot, pool, transport)
+    visit, cost = snapshot.visit[pool], snapshot.cost[pool]
+    route = [int(np.flatnonzero(pool == first_row)[0])]
+    arrival = float(start_slots[route[0], 0] * SLOT_MINUTES) if start_slots is not None else 0.0
+
+    while True:
+        spent = int(cost[route[:-1]].sum())
+        tail = solve_orienteering(
+            scores[pool], visit, cost, travel,
+            time_budget=duration_minutes,
+            cost_budget=None if budget is None else budget - spent,
+            start=route[-1],
+            deadline_ms=step_deadline_ms,
+            start_slots=start_slots,
+            start_clock=arrival,
+            exclude=route[:-1],
+        )
+        if len(tail.order) < 2 or tail.order[0] != route[-1]:
+            break
+        following = tail.order[1]
+        route.append(following)
+        arrival = tail.arrivals[1]
+        yield "point", int(pool[following]), tail.legs[1], arrival
+
+    yield "done", pool, route_solution(scores[pool], visit, cost, travel, route, start_slots)
+
+
+def stream_route(req: RouteRequest, user):
+    """События для API: {"event": "start" | "point", "point": ...}, затем {"event": "done", "route": ...}
+    или {"event": "error", "message": ...}. Маршрут из кеша отдаётся теми же событиями сразу."""
+    payload = route_cache.get(req.key, req.accepts)
+    if payload is not None:
+        for position, point in enumerate(payload["points"]):
+            yield {"event": "point" if position else "start", "point": point}
+        yield {"event": "done", "route": issue_route(payload, req, user)}
+        return
+
+    profile = get_profile(req.transport)
+    started = time.perf_counter()
+    events = stream_plan(
+        req.snapshot, req.interests, req.moods, req.time_of_day, req.budget, req.duration_minutes,
+        semantic=lambda: find_semantic_hits(req.city_id, req.description),
+        transport=req.transport,
+        start=req.start,
+    )
+    first = True
+    for event in events:
+        if event[0] == "point":
+            _, row, leg, arrival = event
+            if first:
+                metrics.observe("route_stream.first_point_ms", (time.perf_counter() - started) * 1000)
+            yield {
+                "event": "start" if first else "point",
+                "point": format_point(req.snapshot, row, leg, arrival, profile, req.start),
+            }
+            first = False
+            continue
+
+        _, pool, solution = event
+        if not solution.order:
+            yield {"event": "error", "message": NOTHING_FITS}
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.observe("route_stream.ms", elapsed_ms)
+        payload = format_route(req.snapshot, pool, solution, req.transport, req.start)
+        route_cache.put(req.key, payload, elapsed_ms)
+        yield {"event": "done", "route": issue_route(payload, req, user)}
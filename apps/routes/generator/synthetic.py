@@ -0,0 +1,59 @@
+import numpy as np
+
+from apps.routes.opening_hours import ALL_MONTHS, ALWAYS_OPEN, BYTES_PER_DAY, compile_open_slots
+from .snapshot import CitySnapshot, encode_mask, BEST_TIME_BITS
+
+INTEREST_IDS = ["parks", "museums", "food", "architecture", "art", "history", "nightlife", "shopping"]
+MOOD_IDS = ["explore", "relax", "romantic", "active", "family"]
+
+
+def make_snapshot(n: int, seed: int = 0, center=(55.751, 37.618), radius_km: float = 12.0) -> CitySnapshot:
+    """Синтетический город из n точек для бенчмарков (без БД)."""
+    rng = np.random.default_rng(seed)
+    lat = center[0] + rng.normal(0, radius_km / 3 / 111.0, n)
+    lng = center[1] + rng.normal(0, radius_km / 3 / 111.0 / np.cos(np.radians(center[0])), n)
+    visit = rng.choice([15, 20, 30, 45, 60, 90], n).astype(np.float64)
+    cost = np.where(rng.random(n) < 0.5, 0, rng.integers(100, 2000, n)).astype(np.int64)
+
+    interest_bits = {value: i for i, value in enumerate(INTEREST_IDS)}
+    mood_bits = {value: i for i, value in enumerate(MOOD_IDS)}
+    interest_mask = np.stack([
+        encode_mask(interest_bits, rng.choice(INTEREST_IDS, rng.integers(1, 4), replace=False), 1)
+        for _ in range(n)
+    ])
+    mood_mask = np.stack([
+        encode_mask(mood_bits, rng.choice(MOOD_IDS, rng.integers(1, 3), replace=False), 1)
+        for _ in range(n)
+    ])
+    time_bits = np.array(list(BEST_TIME_BITS.values()), dtype=np.uint8)
+
+    # Типичные режимы работы; без режима (всегда открыто) — половина точек
+    hours = np.stack([
+        np.frombuffer(compile_open_slots(value) or ALWAYS_OPEN, dtype=np.uint8).reshape(7, BYTES_PER_DAY)
+        for value in [None, None, None, "10:00-22:00", "Mo-Fr 09:00-18:00", "12:00-02:00"]
+    ])
+
+    ids = [f"p{i}" for i in range(n)]
+    return CitySnapshot(
+        city_id=f"synthetic-{n}-{seed}",
+        version=0,
+        ids=ids,
+        lat=lat,
+        lng=lng,
+        visit=visit,
+        cost=cost,
+        interest_mask=interest_mask,
+        mood_mask=mood_mask,
+        time_mask=time_bits[rng.integers(len(time_bits), size=n)],
+        month_mask=np.full(n, ALL_MONTHS, dtype=np.uint16),
+        open_slots=hours[rng.integers(len(hours), size=n)],
+        interest_bits=interest_bits,
+        mood_bits=mood_bits,
+        rows=[
+            {
+                "id": ids[i], "name": f"Точка {i}", "description": "", "image_url": None, "tags": [],
+                "average_visit_duration": int(visit[i]),
+            }
+            for i in range(n)
+        ],
+    )
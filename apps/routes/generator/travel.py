@@ -0,0 +1,218 @@
+"""Время в пути между точками для разных видов транспорта.
+
+Расстояния считаются векторизованным haversine и кешируются в памяти процесса
+(ключ — город, версия точек и размер снапшота): запрос берёт подматрицу уже посчитанной
+матрицы через np.ix_. Время получается из расстояния по профилю транспорта.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Общий лимит памяти на матрицы; до скольких точек в городе держим полную матрицу (3000² float32 ≈ 34 MB);
+# со сколькими последними наборами кандидатов сверяемся в поисках надмножества
+MATRIX_CACHE_MAX_BYTES = 256 * 2**20
+FULL_MATRIX_ROWS = 3000
+SUPERSET_LOOKUP = 16
+
+
+@dataclass(frozen=True)
+class TransportProfile:
+    """speed_kmh — средняя скорость, detour — во сколько раз путь длиннее прямой,
+    overhead_minutes — постоянная добавка на переход (ожидание транспорта, парковка).
+    walk_fallback — короткие переходы выгоднее пройти пешком.
+    uses_roads — время считается по пешеходному графу города, если он построен (roads.py).
+    """
+    name: str
+    speed_kmh: float
+    detour: float
+    overhead_minutes: float = 0.0
+    walk_fallback: bool = False
+    icon: str = "🚶"
+    yandex_rtt: str = "pd"
+    uses_roads: bool = True
+
+    def minutes(self, km: np.ndarray, road: bool = False) -> np.ndarray:
+        """road=True — km уже расстояние по дорогам, поправку detour не применяем."""
+        minutes = km * ((1.0 if road else self.detour) / self.speed_kmh * 60)
+        if self.overhead_minutes:
+            minutes = minutes + np.where(km > 0, self.overhead_minutes, 0.0)
+        if self.walk_fallback:
+            minutes = np.minimum(minutes, WALK.minutes(km, road))
+        return minutes.astype(np.float32)
+
+
+WALK = TransportProfile("walk", speed_kmh=4.5, detour=1.3)
+PROFILES = {
+    "walk": WALK,
+    "bike": TransportProfile("bike", speed_kmh=14.0, detour=1.25, overhead_minutes=2, walk_fallback=True,
+                             icon="🚲", yandex_rtt="bc"),
+    "public_transport": TransportProfile("public_transport", speed_kmh=20.0, detour=1.4, overhead_minutes=8,
+                                         walk_fallback=True, icon="🚌", yandex_rtt="mt"),
+    "car": TransportProfile("car", speed_kmh=25.0, detour=1.35, overhead_minutes=6, walk_fallback=True,
+                            icon="🚗", yandex_rtt="auto", uses_roads=False),
+}
+# Значения из формы (templates/core/quiz.html) и синонимы
+TRANSPORT_ALIASES = {
+    "on_foot": "walk",
+    "foot": "walk",
+    "walking": "walk",
+    "bicycle": "bike",
+    "public": "public_transport",
+    "transit": "public_transport",
+    "bus": "public_transport",
+    "metro": "public_transport",
+}
+
+
+def get_profile(transport) -> TransportProfile:
+    """Профиль по значению из запроса; неизвестное или пустое — пешком."""
+    if not transport:
+        return WALK
+    name = str(transport).lower()
+    return PROFILES.get(TRANSPORT_ALIASES.get(name, name), WALK)
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Матрица расстояний (len(lat1), len(lat2)) по дуге большого круга, км."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lng1, lat2, lng2))
+    dlat = lat1[:, None] - lat2[None, :]
+    dlng = lng1[:, None] - lng2[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1)[:, None] * np.cos(lat2)[None, :] * np.sin(dlng / 2) ** 2
+    return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))).astype(np.float32)
+
+
+class _Entry:
+    """Матрица расстояний по строкам rows снапшота (rows отсортированы)."""
+
+    def __init__(self, rows: np.ndarray, km: np.ndarray):
+        self.rows = rows
+        self.km = km
+
+    @property
+    def nbytes(self) -> int:
+        return self.km.nbytes + self.rows.nbytes
+
+    def positions(self, rows: np.ndarray) -> np.ndarray | None:
+        """Позиции rows в записи или None, если каких-то строк нет."""
+        if rows.size > self.rows.size:
+            return None
+        pos = np.searchsorted(self.rows, rows)
+        pos[pos == len(self.rows)] = 0
+        return pos if np.array_equal(self.rows[pos], rows) else None
+
+
+class DistanceCache:
+    """LRU матриц расстояний с общим лимитом памяти.
+
+    Для города до full_rows точек один раз считается полная матрица, дальше любые наборы
+    кандидатов — её срезы. Для больших городов кешируется матрица каждого набора кандидатов;
+    запрос, чей набор целиком входит в один из недавних, берёт срез из него.
+    """
+
+    def __init__(self, compute=None, max_bytes: int = MATRIX_CACHE_MAX_BYTES, full_rows: int = FULL_MATRIX_ROWS):
+        self.compute = compute or _haversine_rows
+        self.max_bytes = max_bytes
+        self.full_rows = full_rows
+        self.entries: OrderedDict = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def distances(self, snapshot, rows, stamp=None) -> np.ndarray:
+        """Матрица расстояний (км) между строками rows снапшота в порядке rows.
+
+        stamp — версия внешних данных для compute (например, файлов графа дорог).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        city = (snapshot.city_id, snapshot.version, len(snapshot), stamp)
+        full = len(snapshot) <= self.full_rows
+        key = (city, None) if full else (city, hashlib.blake2b(np.sort(rows).tobytes(), digest_size=16).digest())
+
+        found = self._lookup(key, city, rows)
+        if found is not None:
+            self.hits += 1
+            return found
+        self.misses += 1
+
+        merged = np.arange(len(snapshot)) if full else np.unique(rows)
+        entry = _Entry(merged, self.compute(snapshot, merged))
+        with self.lock:
+            self._drop_versions(snapshot.city_id, city)
+            if key not in self.entries:
+                self.entries[key] = entry
+                self.nbytes += entry.nbytes
+            self._evict()
+        pos = entry.positions(rows)
+        return entry.km[np.ix_(pos, pos)]
+
+    def _lookup(self, key, city, rows: np.ndarray) -> np.ndarray | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                candidates = [entry]
+            else:
+                candidates = [
+                    entry for entry_key, entry in reversed(self.entries.items()) if entry_key[0] == city
+                ][:SUPERSET_LOOKUP]
+        for entry in candidates:
+            pos = entry.positions(rows)
+            if pos is not None:
+                return entry.km[np.ix_(pos, pos)]
+        return None
+
+    def _drop_versions(self, city_id, keep) -> None:
+        for key in [key for key in self.entries if key[0][0] == city_id and key[0] != keep]:
+            self.nbytes -= self.entries.pop(key).nbytes
+
+    def _evict(self) -> None:
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.nbytes -= entry.nbytes
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+
+def _haversine_rows(snapshot, rows) -> np.ndarray:
+    lat, lng = snapshot.lat[rows], snapshot.lng[rows]
+    return haversine_km(lat, lng, lat, lng)
+
+
+def _road_rows(snapshot, rows) -> np.ndarray:
+    from .roads import get_graph
+    graph = get_graph(snapshot.city_id)
+    if graph is None:
+        # граф пропал между проверкой и расчётом — все пары по прямой
+        return np.full((len(rows), len(rows)), np.nan, dtype=np.float32)
+    return graph.road_km([snapshot.ids[i] for i in rows])
+
+
+distance_cache = DistanceCache()
+road_cache = DistanceCache(_road_rows)
+
+
+def travel_minutes(snapshot, rows, transport=None) -> np.ndarray:
+    """Матрица времени в пути (мин) между строками rows снапшота для выбранного транспорта.
+
+    Если для города построен граф дорог, известные по нему пары считаются по дорогам,
+    остальные — по прямой с поправкой detour.
+    """
+    from .roads import get_graph
+
+    profile = get_profile(transport)
+    minutes = profile.minutes(distance_cache.distances(snapshot, rows))
+    graph = get_graph(snapshot.city_id) if profile.uses_roads else None
+    if graph is not None and graph.point_ids is not None:
+        road = road_cache.distances(snapshot, rows, stamp=graph.stamp)
+        known = ~np.isnan(road)
+        minutes[known] = profile.minutes(road[known], road=True)
+    return minutes
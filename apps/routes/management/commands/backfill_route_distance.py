@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.routes.generator.geometry import route_geometry
+from apps.routes.models import Route, RouteStop
+from apps.users.stats import rebuild_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Считает протяжённость и геометрию (polyline) сохранённых маршрутов пачками; "
+        "по умолчанию только маршрутов без геометрии. Затем пересчитывает статистику пользователей"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=500)
+        parser.add_argument("--all", action="store_true", help="Пересчитать и маршруты с уже посчитанной геометрией")
+        parser.add_argument(
+            "--transport", default="walk", help="Транспорт для старых маршрутов (в маршруте он не хранится)"
+        )
+
+    def handle(self, *args, **options):
+        routes = Route.objects.order_by("id")
+        if not options["all"]:
+            routes = routes.filter(polyline="")
+        started = time.perf_counter()
+        done, last_id = 0, ""
+        while True:
+            batch = list(routes.filter(id__gt=last_id).only("id", "city_id")[:options["batch"]])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            # точки всей пачки по порядку одним запросом
+            stops = {}
+            for route_id, point_id, lat, lng in (
+                RouteStop.objects.filter(route__in=batch)
+                .order_by("route_id", "position")
+                .values_list("route_id", "point_id", "point__coordinates_lat", "point__coordinates_lng")
+            ):
+                stops.setdefault(route_id, []).append((point_id, float(lat), float(lng)))
+
+            for route in batch:
+                point_ids, lat, lng = zip(*stops[route.id]) if route.id in stops else ((), (), ())
+                route.total_distance_km, route.polyline = route_geometry(
+                    route.city_id, point_ids, lat, lng, options["transport"]
+                )
+            Route.objects.bulk_update(batch, ["total_distance_km", "polyline"])
+            done += len(batch)
+            self.stdout.write(f"{done} маршрутов…")
+
+        users = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(
+            f"Геометрия посчитана для {done} маршрутов за {time.perf_counter() - started:.1f} s, "
+            f"статистика пересчитана для {users} пользователей"
+        ))
@@ -0,0 +1,63 @@
+import time
+from itertools import combinations
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.routes.generator.generator import plan_alternatives, plan_route, route_overlap
+from apps.routes.generator.synthetic import make_snapshot, INTEREST_IDS, MOOD_IDS
+from apps.routes.generator.travel import distance_cache
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк альтернативных маршрутов: k маршрутов за один проход против k отдельных генераций"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+        parser.add_argument("--k", type=int, default=3)
+        parser.add_argument("--runs", type=int, default=30)
+        parser.add_argument("--duration", type=int, default=180)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--transport", default="walk")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        k = options["k"]
+        self.stdout.write(
+            f'{"points":>8} {f"{k} calls p50":>12} {"together p50":>13} {"speedup":>8} '
+            f'{"overlap":>8} {"score":>6} {"routes":>7}'
+        )
+        for size in options["sizes"]:
+            snapshot = make_snapshot(size, seed=options["seed"])
+            separate, together, overlaps, scores, counts = [], [], [], [], []
+            for _ in range(options["runs"]):
+                interests = list(rng.choice(INTEREST_IDS, 2, replace=False))
+                moods = list(rng.choice(MOOD_IDS, 1))
+                args = (snapshot, interests, moods, "evening", None, options["duration"])
+
+                # оба варианта начинают с пустым кешем матриц; отдельные вызовы после первого попадают в него
+                distance_cache.clear()
+                started = time.perf_counter()
+                for _ in range(k):
+                    _, best = plan_route(*args, transport=options["transport"])
+                separate.append((time.perf_counter() - started) * 1000)
+
+                distance_cache.clear()
+                started = time.perf_counter()
+                _, solutions = plan_alternatives(*args, k, transport=options["transport"])
+                together.append((time.perf_counter() - started) * 1000)
+
+                counts.append(len(solutions))
+                overlaps.extend(route_overlap(a.order, b.order) for a, b in combinations(solutions, 2))
+                if best.score:
+                    scores.append(np.mean([solution.score for solution in solutions[1:]] or [0.0]) / best.score)
+
+            self.stdout.write(
+                f"{size:>8} {np.median(separate):>12.1f} {np.median(together):>13.1f} "
+                f"{np.median(separate) / np.median(together):>7.1f}x {np.mean(overlaps or [0]):>8.2f} "
+                f"{np.mean(scores):>6.2f} {np.mean(counts):>7.1f}"
+            )
+        self.stdout.write(
+            "overlap — средняя доля общих точек между альтернативами; "
+            "score — скор альтернатив относительно лучшего маршрута"
+        )
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.routes.generator.editing import edit_route
+from apps.routes.generator.generator import plan_route
+from apps.routes.generator.synthetic import make_snapshot, INTEREST_IDS, MOOD_IDS
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк точечной правки маршрута (replace/remove/insert) против полной генерации"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+        parser.add_argument("--runs", type=int, default=30)
+        parser.add_argument("--duration", type=int, default=240)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--transport", default="walk")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        self.stdout.write(
+            f'{"points":>8} {"solve p50":>10} {"replace p50":>12} {"swap p50":>9} {"remove p50":>11} '
+            f'{"insert p50":>11} {"edit p95":>9}'
+        )
+        for size in options["sizes"]:
+            snapshot = make_snapshot(size, seed=options["seed"])
+            timings = {"solve": [], "replace": [], "swap": [], "remove": [], "insert": []}
+            for _ in range(options["runs"]):
+                interests = list(rng.choice(INTEREST_IDS, 2, replace=False))
+                moods = list(rng.choice(MOOD_IDS, 1))
+                started = time.perf_counter()
+                pool, solution = plan_route(
+                    snapshot, interests, moods, "evening", None, options["duration"], transport=options["transport"]
+                )
+                timings["solve"].append((time.perf_counter() - started) * 1000)
+                rows = [int(pool[i]) for i in solution.order]
+                if len(rows) < 2:
+                    continue
+
+                target = rows[int(rng.integers(len(rows)))]
+                outside = int(rng.choice(np.setdiff1d(np.arange(size), rows)))
+                for action, row, new_row in (
+                    ("replace", target, None),
+                    ("swap", target, outside),
+                    ("remove", target, None),
+                    ("insert", outside, None),
+                ):
+                    started = time.perf_counter()
+                    edit_route(
+                        snapshot, rows, "replace" if action == "swap" else action, row, new_row,
+                        transport=options["transport"],
+                    )
+                    timings[action].append((time.perf_counter() - started) * 1000)
+
+            edits = timings["replace"] + timings["swap"] + timings["remove"] + timings["insert"]
+            self.stdout.write(
+                f"{size:>8} {np.median(timings['solve']):>10.2f} {np.median(timings['replace']):>12.2f} "
+                f"{np.median(timings['swap']):>9.2f} {np.median(timings['remove']):>11.2f} "
+                f"{np.median(timings['insert']):>11.2f} {np.percentile(edits, 95):>9.2f}"
+            )
+        self.stdout.write("replace — замена на подобранную точку, swap — на заданную")
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from apps.routes.generator.generator import plan_route
+from apps.routes.generator.hours import route_start
+from apps.routes.generator.travel import distance_cache
+from apps.routes.generator.synthetic import make_snapshot, INTEREST_IDS, MOOD_IDS
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк генерации маршрута: латентность в зависимости от числа точек в городе"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000, 20000])
+        parser.add_argument("--runs", type=int, default=50)
+        parser.add_argument("--duration", type=int, default=180)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--transport", default="walk")
+        parser.add_argument("--start", help="Начало маршрута (ISO 8601) — с учётом часов работы точек")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        start = route_start(parse_datetime(options["start"])) if options["start"] else None
+        self.stdout.write(f'{"points":>8} {"p50, ms":>9} {"p95, ms":>9} {"p99, ms":>9} {"stops":>6}')
+
+        for size in options["sizes"]:
+            snapshot = make_snapshot(size, seed=options["seed"])
+            timings, stops = [], []
+            for _ in range(options["runs"]):
+                interests = list(rng.choice(INTEREST_IDS, 2, replace=False))
+                moods = list(rng.choice(MOOD_IDS, 1))
+                started = time.perf_counter()
+                _, solution = plan_route(
+                    snapshot, interests, moods, "evening", None, options["duration"], transport=options["transport"],
+                    start=start,
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+                stops.append(len(solution.order))
+
+            p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+            self.stdout.write(f"{size:>8} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {np.mean(stops):>6.1f}")
+        self.stdout.write(
+            f"кеш матриц: {distance_cache.hits} попаданий, {distance_cache.misses} промахов, "
+            f"{distance_cache.nbytes / 2**20:.1f} MB"
+        )
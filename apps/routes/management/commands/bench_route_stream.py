@@ -0,0 +1,119 @@
+import json
+import time
+import urllib.request
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from apps.routes.generator.generator import plan_route
+from apps.routes.generator.hours import route_start
+from apps.routes.generator.streaming import stream_plan
+from apps.routes.generator.synthetic import make_snapshot, INTEREST_IDS, MOOD_IDS
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк потоковой генерации: время до первой точки против блокирующей генерации. "
+        "Без --url — на синтетических городах без БД; с --url — по HTTP против запущенного сервера"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+        parser.add_argument("--runs", type=int, default=30)
+        parser.add_argument("--duration", type=int, default=180)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--transport", default="walk")
+        parser.add_argument("--start", help="Начало маршрута (ISO 8601) — с учётом часов работы точек")
+        parser.add_argument(
+            "--semantic-ms", type=float, default=300.0,
+            help="Имитация запроса эмбеддинга описания (сеть до провайдера), мс; 0 — без описания",
+        )
+        parser.add_argument("--url", help="Базовый адрес сервера, например http://127.0.0.1:8000")
+        parser.add_argument("--token", help="JWT access-токен для --url")
+        parser.add_argument("--city", help="city_id для --url")
+        parser.add_argument("--description", default="", help="Описание в анкете для --url")
+
+    def handle(self, *args, **options):
+        if options["url"]:
+            self.bench_http(options)
+        else:
+            self.bench_local(options)
+
+    def bench_local(self, options):
+        rng = np.random.default_rng(options["seed"])
+        start = route_start(parse_datetime(options["start"])) if options["start"] else None
+        self.stdout.write(
+            f'{"points":>8} {"blocking p50":>13} {"first p50":>10} {"first p95":>10} {"stream p50":>11} '
+            f'{"score":>6}'
+        )
+        for size in options["sizes"]:
+            snapshot = make_snapshot(size, seed=options["seed"])
+
+            blocking, first, streamed, ratio = [], [], [], []
+            for _ in range(options["runs"]):
+                hits = [(snapshot.ids[i], float(rng.random())) for i in rng.choice(size, 50, replace=False)]
+
+                def semantic():
+                    if options["semantic_ms"]:
+                        time.sleep(options["semantic_ms"] / 1000)
+                    return hits
+
+                interests = list(rng.choice(INTEREST_IDS, 2, replace=False))
+                moods = list(rng.choice(MOOD_IDS, 1))
+                args = (snapshot, interests, moods, "evening", None, options["duration"])
+
+                started = time.perf_counter()
+                _, solution = plan_route(
+                    *args, semantic_hits=semantic(), transport=options["transport"], start=start
+                )
+                blocking.append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                first_at = None
+                for event in stream_plan(*args, semantic=semantic, transport=options["transport"], start=start):
+                    if first_at is None:
+                        first_at = (time.perf_counter() - started) * 1000
+                streamed.append((time.perf_counter() - started) * 1000)
+                first.append(first_at)
+                ratio.append(event[2].score / solution.score if solution.score else 1.0)
+
+            self.stdout.write(
+                f"{size:>8} {np.median(blocking):>13.1f} {np.median(first):>10.1f} "
+                f"{np.percentile(first, 95):>10.1f} {np.median(streamed):>11.1f} {np.mean(ratio):>6.2f}"
+            )
+        self.stdout.write("score — суммарный скор потокового маршрута относительно блокирующего")
+
+    def bench_http(self, options):
+        if not options["token"] or not options["city"]:
+            raise CommandError("Для --url нужны --token и --city")
+        body = {
+            "city_id": options["city"],
+            "interests": [],
+            "duration_minutes": options["duration"],
+            "transport": options["transport"],
+            "description": options["description"],
+        }
+        if options["start"]:
+            body["start_at"] = options["start"]
+
+        self.stdout.write(f'{"endpoint":>10} {"ttfb p50":>9} {"ttfb p95":>9} {"total p50":>10}')
+        for name, path in (("blocking", "/api/route/generate/"), ("stream", "/api/route/generate/stream/")):
+            ttfb, total = [], []
+            for run in range(options["runs"]):
+                # разная длительность, чтобы не попадать в кеш маршрутов
+                payload = {**body, "duration_minutes": options["duration"] + 15 * (run % 8)}
+                request = urllib.request.Request(
+                    options["url"].rstrip("/") + path,
+                    data=json.dumps(payload).encode(),
+                    headers={"Content-Type": "application/json", "Authorization": f"Bearer {options['token']}"},
+                )
+                started = time.perf_counter()
+                with urllib.request.urlopen(request) as response:
+                    response.read(1)
+                    ttfb.append((time.perf_counter() - started) * 1000)
+                    response.read()
+                total.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{name:>10} {np.median(ttfb):>9.1f} {np.percentile(ttfb, 95):>9.1f} {np.median(total):>10.1f}"
+            )
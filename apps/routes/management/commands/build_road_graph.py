@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.routes.generator import roads
+from apps.routes.models import City, Point
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит пешеходный граф города из выгрузки OSM (обрезка по City.bbox) "
+        "и таблицу расстояний по дорогам между точками"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("city_id")
+        parser.add_argument("--osm", help="Файл .osm (XML); без него пересчитывается только таблица точек")
+        parser.add_argument("--max-leg-km", type=float, default=roads.MAX_LEG_KM)
+
+    def handle(self, *args, **options):
+        city = City.objects.filter(id=options["city_id"]).first()
+        if city is None:
+            raise CommandError(f"Город {options['city_id']} не найден")
+
+        if options["osm"]:
+            started = time.perf_counter()
+            arrays = roads.parse_osm(options["osm"], city.bbox)
+            if not len(arrays["lat"]):
+                raise CommandError("В выгрузке нет пешеходных дорог внутри bbox города")
+            roads.save_graph(city.id, arrays)
+            self.stdout.write(
+                f"граф: {len(arrays['lat'])} узлов, {len(arrays['indices']) // 2} рёбер "
+                f"за {time.perf_counter() - started:.1f} s"
+            )
+
+        graph = roads.get_graph(city.id)
+        if graph is None:
+            raise CommandError("Граф города не построен: укажите --osm")
+
+        rows = list(
+            Point.objects.filter(city=city).order_by("id").values_list("id", "coordinates_lat", "coordinates_lng")
+        )
+        ids = [point_id for point_id, _, _ in rows]
+        lat = np.array([row[1] for row in rows], dtype=np.float64)
+        lng = np.array([row[2] for row in rows], dtype=np.float64)
+
+        started = time.perf_counter()
+        table = roads.build_point_table(graph, ids, lat, lng, options["max_leg_km"])
+        roads.save_point_table(city.id, table)
+        snapped = int(np.count_nonzero(np.diff(table["point_indptr"])))
+        self.stdout.write(self.style.SUCCESS(
+            f"таблица точек: {len(ids)} точек, {snapped} с соседями по графу, "
+            f"{len(table['point_neighbors'])} пар за {time.perf_counter() - started:.1f} s"
+        ))
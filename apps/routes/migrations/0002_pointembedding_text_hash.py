@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("routes", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pointembedding",
+            name="model",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Модель, которой построен эмбеддинг",
+                max_length=100,
+            ),
+        ),
+        migrations.AddField(
+            model_name="pointembedding",
+            name="text_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="sha256 текста, из которого построен эмбеддинг",
+                max_length=64,
+            ),
+        ),
+    ]
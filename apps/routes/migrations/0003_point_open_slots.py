@@ -0,0 +1,49 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:16
+
+from django.db import migrations, models
+
+from apps.routes.opening_hours import compile_month_mask, compile_open_slots
+
+
+def compile_schedules(apps, schema_editor):
+    Point = apps.get_model("routes", "Point")
+    batch = []
+    for point in Point.objects.only(
+        "id", "working_hours_json", "is_seasonal", "seasonal_months"
+    ).iterator(chunk_size=1000):
+        point.open_slots = compile_open_slots(point.working_hours_json)
+        point.month_mask = compile_month_mask(point.is_seasonal, point.seasonal_months)
+        batch.append(point)
+        if len(batch) >= 1000:
+            Point.objects.bulk_update(batch, ["open_slots", "month_mask"])
+            batch = []
+    Point.objects.bulk_update(batch, ["open_slots", "month_mask"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("routes", "0002_pointembedding_text_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="point",
+            name="month_mask",
+            field=models.PositiveSmallIntegerField(
+                default=4095,
+                editable=False,
+                help_text="Маска месяцев работы: бит m-1 — месяц m",
+            ),
+        ),
+        migrations.AddField(
+            model_name="point",
+            name="open_slots",
+            field=models.BinaryField(
+                blank=True,
+                help_text="Открытые 15-минутные слоты по дням недели (7 × 96 бит); пусто — режим неизвестен",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(compile_schedules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_stops(apps, schema_editor):
+    """Переносим порядок из point_sequence; точки старой связи без места в порядке — в конец."""
+    Route = apps.get_model("routes", "Route")
+    RouteStop = apps.get_model("routes", "RouteStop")
+    Point = apps.get_model("routes", "Point")
+    linked = {}
+    for route_id, point_id in Route.points.through.objects.values_list(
+        "route_id", "point_id"
+    ).iterator():
+        linked.setdefault(route_id, []).append(point_id)
+    existing = set(Point.objects.values_list("id", flat=True))
+
+    batch = []
+    for route_id, sequence in Route.objects.values_list(
+        "id", "point_sequence"
+    ).iterator(chunk_size=1000):
+        order = []
+        for point_id in list(sequence or []) + linked.get(route_id, []):
+            if point_id in existing and point_id not in order:
+                order.append(point_id)
+        batch.extend(
+            RouteStop(route_id=route_id, point_id=point_id, position=position)
+            for position, point_id in enumerate(order)
+        )
+        if len(batch) >= 5000:
+            RouteStop.objects.bulk_create(batch)
+            batch = []
+    RouteStop.objects.bulk_create(batch)
+
+
+def restore_sequence(apps, schema_editor):
+    Route = apps.get_model("routes", "Route")
+    RouteStop = apps.get_model("routes", "RouteStop")
+    sequences = {}
+    for route_id, point_id in RouteStop.objects.order_by(
+        "route_id", "position"
+    ).values_list("route_id", "point_id"):
+        sequences.setdefault(route_id, []).append(point_id)
+    for route in Route.objects.filter(id__in=sequences).only("id").iterator():
+        route.point_sequence = sequences[route.id]
+        route.save(update_fields=["point_sequence"])
+        route.points.set(sequences[route.id])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("routes", "0003_point_open_slots"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RouteStop",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "position",
+                    models.PositiveSmallIntegerField(
+                        help_text="Порядковый номер точки в маршруте, с 0"
+                    ),
+                ),
+                (
+                    "planned_arrival",
+                    models.DateTimeField(
+                        blank=True, help_text="Плановое время прибытия", null=True
+                    ),
+                ),
+                (
+                    "point",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stops",
+                        to="routes.point",
+                    ),
+                ),
+                (
+                    "route",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stops",
+                        to="routes.route",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Точка маршрута",
+                "verbose_name_plural": "Точки маршрута",
+                "db_table": "route_stops",
+                "ordering": ["route", "position"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("route", "position"), name="route_stop_position_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_stops, restore_sequence),
+        # сменить through у существующей связи нельзя — пересоздаём поле, старая таблица уходит
+        migrations.RemoveField(
+            model_name="route",
+            name="points",
+        ),
+        migrations.AddField(
+            model_name="route",
+            name="points",
+            field=models.ManyToManyField(through="routes.RouteStop", to="routes.point"),
+        ),
+        migrations.RemoveField(
+            model_name="route",
+            name="point_sequence",
+        ),
+    ]
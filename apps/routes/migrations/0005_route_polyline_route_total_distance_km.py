@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("routes", "0004_routestop"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="route",
+            name="polyline",
+            field=models.TextField(
+                blank=True,
+                default="",
+                help_text="Геометрия маршрута (encoded polyline)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="route",
+            name="total_distance_km",
+            field=models.FloatField(
+                default=0.0, help_text="Протяжённость маршрута, км"
+            ),
+        ),
+    ]
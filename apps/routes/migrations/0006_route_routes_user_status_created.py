@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("routes", "0005_route_polyline_route_total_distance_km"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="route",
+            index=models.Index(
+                fields=["user", "status", "created_at", "id"],
+                include=("total_duration", "total_cost", "total_distance_km"),
+                name="routes_user_status_created",
+            ),
+        ),
+    ]
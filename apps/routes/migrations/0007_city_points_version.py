@@ -0,0 +1,22 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("routes", "0006_route_routes_user_status_created"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="city",
+            name="points_version",
+            field=models.PositiveBigIntegerField(
+                default=0,
+                editable=False,
+                help_text="Счётчик изменений точек города (для снапшотов во всех процессах)",
+            ),
+        ),
+    ]
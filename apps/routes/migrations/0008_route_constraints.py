@@ -0,0 +1,43 @@
+# Generated by Django 5.0.14 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("routes", "0007_city_points_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="route",
+            name="budget",
+            field=models.IntegerField(
+                blank=True, help_text="Бюджет из анкеты", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="route",
+            name="duration_minutes",
+            field=models.FloatField(
+                blank=True, help_text="Сколько времени есть на прогулку, мин", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="route",
+            name="start_at",
+            field=models.DateTimeField(
+                blank=True, help_text="Начало прогулки", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="route",
+            name="transport",
+            field=models.CharField(
+                default="walk",
+                help_text="Способ передвижения (travel.PROFILES)",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -3,6 +3,10 @@ from django.contrib.postgres.fields import ArrayField
 import uuid
 from apps.partners.models import Partner
 from django.conf import settings
+from .opening_hours import ALL_MONTHS, compile_open_slots, compile_month_mask
+
+# Поля, из которых компилируются open_slots и month_mask
+SCHEDULE_SOURCE_FIELDS = {"working_hours_json", "is_seasonal", "seasonal_months"}
 
 
 class City(models.Model):
@@ -13,6 +17,9 @@ class City(models.Model):
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
     bbox = models.JSONField(null=True, blank=True)  # {"min_lat": ..., "max_lat": ..., "min_lon": ..., "max_lon": ...}
+    points_version = models.PositiveBigIntegerField(
+        default=0, editable=False, help_text="Счётчик изменений точек города (для снапшотов во всех процессах)"
+    )
     class Meta:
         db_table = 'cities'
         verbose_name = 'Город'
@@ -99,6 +106,14 @@ class Point(models.Model):
         help_text='Сезонное место (например, летние веранды, катки)'
     )
     seasonal_months = models.JSONField(default=list)
+    # Скомпилированные working_hours_json и seasonal_months (apps/routes/opening_hours.py), пересчитываются в save()
+    open_slots = models.BinaryField(
+        null=True, blank=True, editable=False,
+        help_text='Открытые 15-минутные слоты по дням недели (7 × 96 бит); пусто — режим неизвестен'
+    )
+    month_mask = models.PositiveSmallIntegerField(
+        default=ALL_MONTHS, editable=False, help_text='Маска месяцев работы: бит m-1 — месяц m'
+    )
     # Дополнительные поля для аналитики
     view_count = models.IntegerField(default=0)
     success_rate = models.DecimalField(max_digits=3, decimal_places=2, default=0.0)
@@ -115,10 +130,23 @@ class Point(models.Model):
     def __str__(self):
         return f"{self.name} ({self.city.name})"
 
+    def compile_schedule(self):
+        self.open_slots = compile_open_slots(self.working_hours_json)
+        self.month_mask = compile_month_mask(self.is_seasonal, self.seasonal_months)
+
+    def save(self, *args, **kwargs):
+        self.compile_schedule()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and SCHEDULE_SOURCE_FIELDS & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"open_slots", "month_mask"}
+        super().save(*args, **kwargs)
+
 
 class PointEmbedding(models.Model):
     point = models.OneToOneField(Point, on_delete=models.CASCADE, primary_key=True)
     embedding = ArrayField(models.FloatField(), size=1536, help_text='Векторное представление описания точки')
+    text_hash = models.CharField(max_length=64, blank=True, default='', help_text='sha256 текста, из которого построен эмбеддинг')
+    model = models.CharField(max_length=100, blank=True, default='', help_text='Модель, которой построен эмбеддинг')
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -135,6 +163,13 @@ class Route(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     total_duration = models.IntegerField(help_text='Общее время прогулки в минутах')
     total_cost = models.IntegerField(null=True, blank=True, help_text='Общий бюджет маршрута')
+    total_distance_km = models.FloatField(default=0.0, help_text="Протяжённость маршрута, км")
+    polyline = models.TextField(blank=True, default="", help_text="Геометрия маршрута (encoded polyline)")
+    # условия анкеты: по ним проверяется правка маршрута (apps/routes/services.py, apply_route_edit)
+    transport = models.CharField(max_length=20, default="walk", help_text="Способ передвижения (travel.PROFILES)")
+    start_at = models.DateTimeField(null=True, blank=True, help_text="Начало прогулки")
+    duration_minutes = models.FloatField(null=True, blank=True, help_text="Сколько времени есть на прогулку, мин")
+    budget = models.IntegerField(null=True, blank=True, help_text="Бюджет из анкеты")
     city = models.ForeignKey("City", on_delete=models.CASCADE, related_name="routes",null=True, blank=True)
     description = models.TextField(null=True, blank=True, help_text='Текстовый гид или описание маршрута')
     user = models.ForeignKey(
@@ -144,9 +179,7 @@ class Route(models.Model):
         help_text="Пользователь, которому принадлежит маршрут",
         null=True, blank=True
     )
-    point_sequence =models.JSONField(default=list)
-
-    points = models.ManyToManyField("Point")
+    points = models.ManyToManyField("Point", through="RouteStop")
     status = models.CharField(
         max_length=20,
         choices=WalkStatus.choices,
@@ -159,12 +192,38 @@ class Route(models.Model):
         verbose_name_plural = 'Маршруты'
         indexes = [
             models.Index(fields=['user', 'created_at']),
+            # список маршрутов пользователя по курсору; include — для index-only scan в PostgreSQL
+            models.Index(
+                fields=["user", "status", "created_at", "id"],
+                include=["total_duration", "total_cost", "total_distance_km"],
+                name="routes_user_status_created",
+            ),
         ]
 
     def __str__(self):
         return f"Маршрут {self.id[:8]} ({self.total_duration} мин)"
 
 
+class RouteStop(models.Model):
+    """Точка маршрута на своём месте: порядок и плановое время прибытия."""
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name="stops")
+    point = models.ForeignKey("Point", on_delete=models.CASCADE, related_name="stops")
+    position = models.PositiveSmallIntegerField(help_text="Порядковый номер точки в маршруте, с 0")
+    planned_arrival = models.DateTimeField(null=True, blank=True, help_text="Плановое время прибытия")
+
+    class Meta:
+        db_table = "route_stops"
+        verbose_name = "Точка маршрута"
+        verbose_name_plural = "Точки маршрута"
+        ordering = ["route", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["route", "position"], name="route_stop_position_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.route_id} #{self.position}: {self.point_id}"
+
+
 class Feedback(models.Model):
     id = models.CharField(max_length=50, primary_key=True, default=uuid.uuid4)
     route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name="feedbacks")
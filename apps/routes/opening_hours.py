@@ -0,0 +1,189 @@
+"""Компиляция режима работы и сезонности точки в компактный индекс.
+
+working_hours_json разбирается один раз при сохранении точки (Point.save) в битовую карту
+7 дней × 96 слотов по 15 минут = 84 байта (день d — байты 12d..12d+11, бит s — слот s,
+порядок little-endian). Слот считается открытым, только если точка работает все его 15 минут.
+seasonal_months превращаются в 12-битную маску (бит m-1 — месяц m).
+
+Понимаем:
+    строку OSM opening_hours: "Mo-Fr 09:00-18:00; Sa 10:00-16:00; Su off", "24/7";
+    словарь по дням: {"mon": "10:00-22:00", "пн-пт": ["10:00-14:00", "15:00-19:00"],
+                      "sat": {"open": "11:00", "close": "02:00"}, "sun": null};
+    список [{"day": "mon", "open": "10:00", "close": "22:00"}, ...].
+Интервал, у которого закрытие раньше открытия, переходит через полночь на следующий день.
+Что разобрать не удалось — None (режим неизвестен, точку считаем открытой всегда).
+"""
+import re
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+BYTES_PER_DAY = SLOTS_PER_DAY // 8
+ALL_MONTHS = (1 << 12) - 1
+ALWAYS_OPEN = b"\xff" * (7 * BYTES_PER_DAY)
+
+_DAY_NAMES = [
+    ("mo", "mon", "monday", "пн", "пон", "понедельник"),
+    ("tu", "tue", "tuesday", "вт", "вторник"),
+    ("we", "wed", "wednesday", "ср", "среда"),
+    ("th", "thu", "thursday", "чт", "четверг"),
+    ("fr", "fri", "friday", "пт", "пятница"),
+    ("sa", "sat", "saturday", "сб", "суббота"),
+    ("su", "sun", "sunday", "вс", "воскресенье"),
+]
+DAY_ALIASES = {name: day for day, names in enumerate(_DAY_NAMES) for name in names}
+DAY_ALIASES.update({str(day): day for day in range(7)})
+DAY_GROUPS = {
+    "daily": range(7), "everyday": range(7), "ежедневно": range(7), "all": range(7),
+    "weekdays": range(5), "будни": range(5),
+    "weekend": range(5, 7), "выходные": range(5, 7),
+}
+ALWAYS_VALUES = {"24/7", "24x7", "круглосуточно", "00:00-24:00", "0:00-24:00"}
+CLOSED_VALUES = {"", "off", "closed", "выходной", "закрыто", "-"}
+
+_TIME_RE = re.compile(r"^(\d{1,2})(?::(\d{2}))?$")
+_INTERVAL_RE = re.compile(r"(\d{1,2}(?::\d{2})?)\s*[-–—]\s*(\d{1,2}(?::\d{2})?)")
+_OSM_RULE_RE = re.compile(r"^\s*([A-Za-zА-Яа-я,\-\s]+?)\s+(.+)$")
+
+
+class HoursFormatError(ValueError):
+    pass
+
+
+def _minutes(value: str) -> int:
+    match = _TIME_RE.match(value.strip())
+    if not match:
+        raise HoursFormatError(value)
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    if hours > 24 or minutes > 59 or (hours == 24 and minutes):
+        raise HoursFormatError(value)
+    return hours * 60 + minutes
+
+
+def _days(spec: str) -> list[int]:
+    """"mo-fr,sa" / "пн-пт" / "weekdays" -> номера дней (0 — понедельник)."""
+    days = []
+    for part in str(spec).lower().replace(" ", "").split(","):
+        if part in DAY_GROUPS:
+            days.extend(DAY_GROUPS[part])
+        elif "-" in part:
+            first, last = (DAY_ALIASES.get(x) for x in part.split("-", 1))
+            if first is None or last is None:
+                raise HoursFormatError(spec)
+            days.extend((first + i) % 7 for i in range((last - first) % 7 + 1))
+        elif part in DAY_ALIASES:
+            days.append(DAY_ALIASES[part])
+        else:
+            raise HoursFormatError(spec)
+    return days
+
+
+def _intervals(value) -> list[tuple[int, int]]:
+    """Значение для дня -> интервалы (open, close) в минутах от полуночи."""
+    if value is None or value is False:
+        return []
+    if isinstance(value, dict):
+        if value.get("closed") or value.get("is_closed"):
+            return []
+        if "open" in value and "close" in value:
+            return [(_minutes(str(value["open"])), _minutes(str(value["close"])))]
+        raise HoursFormatError(value)
+    if isinstance(value, (list, tuple)):
+        return [interval for item in value for interval in _intervals(item)]
+
+    text = str(value).strip().lower()
+    if text in CLOSED_VALUES:
+        return []
+    if text in ALWAYS_VALUES:
+        return [(0, 24 * 60)]
+    intervals = [(_minutes(a), _minutes(b)) for a, b in _INTERVAL_RE.findall(text)]
+    if not intervals:
+        raise HoursFormatError(value)
+    return intervals
+
+
+def _parse_osm(text: str) -> dict:
+    week = {}
+    for rule in filter(None, (part.strip() for part in text.split(";"))):
+        if rule.lower() in ALWAYS_VALUES:
+            week.update({day: [(0, 24 * 60)] for day in range(7)})
+            continue
+        match = _OSM_RULE_RE.match(rule)
+        if match:
+            days, hours = _days(match.group(1)), match.group(2)
+        else:
+            days, hours = list(range(7)), rule
+        for day in days:
+            week[day] = _intervals(hours)
+    return week
+
+
+def parse_working_hours(value) -> dict | None:
+    """working_hours_json -> {день: [(open, close), ...]}; дни без записи — выходные. None — режим неизвестен."""
+    if value in (None, "", {}, []):
+        return None
+    try:
+        if isinstance(value, str):
+            if value.strip().lower() in ALWAYS_VALUES:
+                return {day: [(0, 24 * 60)] for day in range(7)}
+            return _parse_osm(value)
+        week = {}
+        if isinstance(value, dict):
+            # как правила OSM: следующий ключ заменяет часы предыдущего для своих дней ("daily", затем "sun": null)
+            for key, hours in value.items():
+                intervals = _intervals(hours)
+                week.update({day: list(intervals) for day in _days(key)})
+            return week
+        if isinstance(value, list):
+            for item in value:
+                days = _days(item.get("day") or item.get("days"))
+                for day in days:
+                    week.setdefault(day, []).extend(_intervals(item))
+            return week
+    except (HoursFormatError, AttributeError, TypeError):
+        return None
+    return None
+
+
+def compile_open_slots(value) -> bytes | None:
+    """working_hours_json -> 84 байта битовой карты открытых слотов или None, если режим неизвестен."""
+    week = parse_working_hours(value)
+    if week is None:
+        return None
+    bits = [0] * 7
+    for day, intervals in week.items():
+        for open_at, close_at in intervals:
+            if close_at <= open_at:
+                # через полночь: хвост уходит на следующий день
+                _set_slots(bits, (day + 1) % 7, 0, close_at)
+                close_at = 24 * 60
+            _set_slots(bits, day, open_at, close_at)
+    return b"".join(day_bits.to_bytes(BYTES_PER_DAY, "little") for day_bits in bits)
+
+
+def _set_slots(bits: list, day: int, open_at: int, close_at: int) -> None:
+    first = -(-open_at // SLOT_MINUTES)
+    last = close_at // SLOT_MINUTES
+    if last > first:
+        bits[day] |= ((1 << (last - first)) - 1) << first
+
+
+def compile_month_mask(is_seasonal: bool, months) -> int:
+    if not is_seasonal or not months:
+        return ALL_MONTHS
+    mask = 0
+    for month in months:
+        try:
+            month = int(month)
+        except (TypeError, ValueError):
+            continue
+        if 1 <= month <= 12:
+            mask |= 1 << (month - 1)
+    return mask or ALL_MONTHS
+
+
+def is_open(open_slots: bytes | None, weekday: int, minute: int) -> bool:
+    """Открыта ли точка в слот, содержащий minute от полуночи дня weekday (0 — понедельник)."""
+    if open_slots is None:
+        return True
+    slot = minute // SLOT_MINUTES
+    return bool(open_slots[weekday * BYTES_PER_DAY + slot // 8] >> (slot % 8) & 1)
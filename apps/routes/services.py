@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.users import stats
+from .models import Route, RouteStop
+from .generator.editing import RouteEditError, edit_route
+from .generator.geometry import route_geometry
+from .generator.hours import RouteWindow
+from .generator.snapshot import get_snapshot
+from .generator.travel import get_profile
+
+# Окно часов работы для маршрутов без сохранённой длительности (созданных до того, как её стали хранить)
+LEGACY_WINDOW_MINUTES = 24 * 60
+
+
+def _stops(route_id, points: list[dict]) -> list[RouteStop]:
+    return [
+        RouteStop(
+            route_id=route_id,
+            point_id=point["id"],
+            position=position,
+            planned_arrival=parse_datetime(point["arrival_at"]) if point.get("arrival_at") else None,
+        )
+        for position, point in enumerate(points)
+    ]
+
+
+def _geometry(city_id, points: list[dict], transport=None) -> tuple[float, str]:
+    return route_geometry(
+        city_id,
+        [point["id"] for point in points],
+        [point["coordinates"]["lat"] for point in points],
+        [point["coordinates"]["lng"] for point in points],
+        transport,
+    )
+
+
+def save_generated_route(route_data: dict, city_id, user, duration_minutes=None, budget=None) -> Route:
+    """Сохраняем сгенерированный маршрут за пользователем (id берём из ответа генератора).
+
+    Вместе с маршрутом храним условия анкеты (транспорт, начало, время, бюджет) — по ним
+    проверяются правки. Одна вставка маршрута и одна пачка точек в короткой транзакции;
+    протяжённость и геометрия считаются до неё.
+    """
+    distance_km, polyline = _geometry(city_id, route_data["points"], route_data.get("transport"))
+    route = Route(
+        id=route_data["route_id"],
+        user_id=user.id if user is not None and user.is_authenticated else None,
+        city_id=city_id,
+        total_duration=route_data["total_duration"],
+        total_cost=route_data["total_cost"],
+        total_distance_km=distance_km,
+        polyline=polyline,
+        transport=get_profile(route_data.get("transport")).name,
+        start_at=parse_datetime(route_data["start_at"]) if route_data.get("start_at") else None,
+        duration_minutes=duration_minutes,
+        budget=budget,
+    )
+    stops = _stops(route.id, route_data["points"])
+    with transaction.atomic():
+        route.save(force_insert=True)
+        RouteStop.objects.bulk_create(stops)
+        stats.route_created(route, [stop.point_id for stop in stops])
+    return route
+
+
+def set_route_status(route: Route, new_status: str) -> Route:
+    """Смена статуса прогулки; строку маршрута блокируем, чтобы статистика не считала переход дважды."""
+    with transaction.atomic():
+        old_status = Route.objects.select_for_update().values_list("status", flat=True).get(pk=route.pk)
+        route.status = new_status
+        route.save(update_fields=["status"])
+        stats.route_status_changed(route, old_status)
+    return route
+
+
+def apply_route_edit(route: Route, action: str, point_id=None, new_point_id=None, transport=None) -> dict:
+    """Правка сохранённого маршрута (см. generator/editing.py): пересчитываем порядок, время и стоимость.
+
+    Транспорт — из запроса, иначе тот, с которым маршрут строился; правленый маршрут должен
+    укладываться в условия анкеты, иначе RouteEditError.
+    """
+    from .generator.generator import format_route
+
+    snapshot = get_snapshot(route.city_id)
+    stops = list(route.stops.only("point_id", "planned_arrival"))
+    # точки, удалённые из города после генерации, из маршрута просто выпадают
+    route_rows = [snapshot.index[stop.point_id] for stop in stops if stop.point_id in snapshot.index]
+    row = snapshot.index.get(str(point_id)) if point_id else None
+    new_row = snapshot.index.get(str(new_point_id)) if new_point_id else None
+    if point_id and row is None or new_point_id and new_row is None:
+        raise RouteEditError("Точка не найдена в городе маршрута")
+
+    transport = get_profile(transport or route.transport).name
+    # время отсчитываем от начала прогулки, у старых маршрутов — от прибытия на первую точку
+    start = route.start_at or (stops[0].planned_arrival if stops else None)
+    window = None
+    if start is not None:
+        start = timezone.localtime(start)
+        window = RouteWindow(start, route.duration_minutes or LEGACY_WINDOW_MINUTES)
+    pool, solution = edit_route(
+        snapshot, route_rows, action, row, new_row, transport, route.duration_minutes, route.budget, window
+    )
+    payload = format_route(snapshot, pool, solution, transport, start)
+    new_stops = _stops(route.id, payload["points"])
+    old_totals = (route.total_duration, route.total_cost, route.total_distance_km)
+    with transaction.atomic():
+        route.total_duration = payload["total_duration"]
+        route.total_cost = payload["total_cost"]
+        route.total_distance_km, route.polyline = _geometry(route.city_id, payload["points"], payload["transport"])
+        route.transport = transport
+        route.save(update_fields=["total_duration", "total_cost", "total_distance_km", "polyline", "transport"])
+        route.stops.all().delete()
+        RouteStop.objects.bulk_create(new_stops)
+        stats.route_edited(
+            route, *old_totals, [stop.point_id for stop in stops], [stop.point_id for stop in new_stops]
+        )
+    return {"route_id": route.id, "user_id": route.user_id, **payload}
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .generator.snapshot import bump_version
+from .models import Point
+
+
+@receiver(post_save, sender=Point)
+@receiver(post_delete, sender=Point)
+def point_changed(sender, instance, **kwargs):
+    bump_version(instance.city_id)
+
+
+@receiver(m2m_changed, sender=Point.interests.through)
+@receiver(m2m_changed, sender=Point.moods.through)
+def point_links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        bump_version(instance.city_id)
+        return
+    # Изменение со стороны интереса/настроения — задеты города всех перечисленных точек
+    points = Point.objects.all() if pk_set is None else Point.objects.filter(pk__in=pk_set)
+    for city_id in points.values_list("city_id", flat=True).distinct():
+        bump_version(city_id)
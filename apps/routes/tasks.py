@@ -0,0 +1,27 @@
+"""Фоновая генерация маршрутов (асинхронный режим GenerateRouteView, выполняет run_jobs)."""
+from django.utils.dateparse import parse_datetime
+
+from apps.core.jobs import PermanentJobError, register
+from .generator.generator import RouteGenerationError, generate_route
+
+
+@register("route-generate")
+def route_generate(job):
+    params = job.params
+    start_at = parse_datetime(params["start_at"]) if params.get("start_at") else None
+    try:
+        route = generate_route(
+            params["city_id"],
+            params.get("time_of_day"),
+            params.get("interests", []),
+            params.get("mood", []),
+            params.get("budget"),
+            params.get("transport"),
+            params["duration_minutes"],
+            params.get("description"),
+            job.user,
+            start_at=start_at,
+        )
+    except RouteGenerationError as exc:
+        raise PermanentJobError(str(exc)) from exc
+    return {"route": route}
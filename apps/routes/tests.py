@@ -1,3 +1,771 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.core.embeddings import reset_provider
+from apps.core.jobs import claim_next, run_job
+from apps.core.models import Job
+from apps.core.singleflight import reset_flights
+from apps.routes.models import City, Interest, Mood, Point, Route
+from .generator import roads
+from .generator import generator as generator_module
+from .generator import snapshot as snapshot_module
+from .generator.generator import MAX_OVERLAP, generate_route, route_overlap
+from .generator.geometry import decode_polyline, encode_polyline
+from .generator.hours import RouteWindow, next_start_slots
+from .generator.route_cache import route_cache
+from .generator.scoring import score_points
+from .generator.snapshot import ANY_TIME, build_snapshot, drop_snapshots, get_snapshot
+from .generator.solver import RouteSolution, solve_orienteering
+from .generator.travel import DistanceCache, get_profile, haversine_km
+from .opening_hours import ALL_MONTHS, ALWAYS_OPEN, compile_month_mask, compile_open_slots, is_open
+
+
+class CityPointsMixin:
+    @classmethod
+    def setUpClass(cls):
+        # файлы singleflight и дисковый кеш эмбеддингов — во временном каталоге, а не в BASE_DIR/var
+        cls.var_dir = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.var_dir, ignore_errors=True)
+        var_settings = override_settings(
+            SINGLEFLIGHT_DIR=str(Path(cls.var_dir) / "singleflight"),
+            EMBEDDING_CACHE_PATH=str(Path(cls.var_dir) / "embedding_cache.sqlite3"),
+        )
+        var_settings.enable()
+        cls.addClassCleanup(var_settings.disable)
+        for reset in (reset_flights, reset_provider):
+            reset()
+            cls.addClassCleanup(reset)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="walker", email="walker@example.com")
+        cls.city = City.objects.create(id="moscow", name="Москва", description="")
+        cls.parks = Interest.objects.create(id="parks", label="Парки", description="")
+        cls.food = Interest.objects.create(id="food", label="Еда", description="")
+        cls.relax = Mood.objects.create(id="relax", label="Отдохнуть", description="")
+        for i in range(12):
+            point = Point.objects.create(
+                name=f"Точка {i}",
+                description=f"Описание {i}",
+                city=cls.city,
+                coordinates_lat=55.75 + i * 0.001,
+                coordinates_lng=37.61 + i * 0.001,
+                average_visit_duration=20,
+                average_cost=0,
+            )
+            point.interests.set([cls.parks, cls.food])
+            point.moods.set([cls.relax])
+
+    def setUp(self):
+        # версия точек живёт в БД и откатывается вместе с тестом — снапшоты прошлых тестов не переиспользуем
+        drop_snapshots()
+
+
+def reference_scores(points, interests, moods, time_of_day):
+    """Скор по точке, как до снапшотов: пересечения множеств и попадание во время суток."""
+    interests, moods = set(interests), set(moods)
+    scores = []
+    for point in points:
+        score = 0.1
+        if interests:
+            score += len({i.id for i in point.interests.all()} & interests) / len(interests)
+        if moods:
+            score += 0.5 * len({m.id for m in point.moods.all()} & moods) / len(moods)
+        best = point.best_visit_time
+        best = [best] if isinstance(best, str) else best or []
+        if time_of_day and (time_of_day in best or "any" in best):
+            score += 0.25
+        scores.append(score)
+    return np.array(scores)
+
+
+class SnapshotTests(CityPointsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.museums = Interest.objects.create(id="museums", label="Музеи", description="")
+        cls.active = Mood.objects.create(id="active", label="Подвигаться", description="")
+        points = Point.objects.filter(city=cls.city).order_by("id")
+        for point, best, months in zip(points, (["morning", "evening"], "night", ["any"], []), ([6, 7], [], [12], [])):
+            point.best_visit_time = best
+            point.is_seasonal = bool(months)
+            point.seasonal_months = months
+            point.save()
+        points[0].interests.set([cls.museums])
+        points[1].moods.add(cls.active)
+        points[2].interests.clear()
+
+    def test_masks_encode_point_attributes(self):
+        snapshot = build_snapshot("moscow")
+        self.assertEqual(snapshot.ids, list(Point.objects.filter(city=self.city).order_by("id").values_list("id", flat=True)))
+
+        def decode(bits, row):
+            return {value for value, bit in bits.items() if int(row[bit // 64]) >> (bit % 64) & 1}
+
+        for i, point in enumerate(Point.objects.filter(city=self.city).order_by("id")):
+            self.assertEqual(decode(snapshot.interest_bits, snapshot.interest_mask[i]),
+                             {x.id for x in point.interests.all()})
+            self.assertEqual(decode(snapshot.mood_bits, snapshot.mood_mask[i]), {x.id for x in point.moods.all()})
+        self.assertEqual(snapshot.time_mask[:5].tolist(), [0b0101, 0b1000, ANY_TIME, 0, 0])
+        self.assertEqual(snapshot.month_mask[:3].tolist(), [0b11 << 5, ALL_MONTHS, 1 << 11])
+
+    def test_scores_match_per_point_semantics(self):
+        snapshot = build_snapshot("moscow")
+        points = list(Point.objects.filter(city=self.city).order_by("id").prefetch_related("interests", "moods"))
+        for interests, moods, time_of_day in (
+            (["parks"], ["relax"], "morning"),
+            (["museums", "food", "unknown"], [], "night"),
+            ([], ["active", "relax"], "evening"),
+            ([], [], None),
+        ):
+            np.testing.assert_allclose(
+                score_points(snapshot, interests, moods, time_of_day),
+                reference_scores(points, interests, moods, time_of_day),
+            )
+
+    def test_cached_snapshot_skips_db(self):
+        snapshot = get_snapshot("moscow")
+        with self.assertNumQueries(0):
+            self.assertIs(get_snapshot("moscow"), snapshot)
+
+    def test_point_changes_bump_version_and_rebuild(self):
+        point = Point.objects.filter(city=self.city).order_by("id").first()
+        changes = (
+            lambda: Point.objects.get(pk=point.pk).save(),
+            lambda: point.interests.add(self.museums, self.parks),
+            lambda: point.moods.remove(self.relax),
+            lambda: self.active.point_set.add(point),
+            lambda: self.museums.point_set.clear(),
+            lambda: Point.objects.filter(city=self.city).order_by("-id").first().delete(),
+        )
+        for change in changes:
+            before = get_snapshot("moscow")
+            version = City.objects.get(pk="moscow").points_version
+            change()
+            self.assertEqual(City.objects.get(pk="moscow").points_version, version + 1)
+            self.assertIsNot(get_snapshot("moscow"), before)
+        self.assertEqual(len(get_snapshot("moscow")), 11)
+        self.assertNotIn("museums", get_snapshot("moscow").interest_bits)
+
+
+class RouteCacheTests(CityPointsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        route_cache.clear()
+
+    def generate(self, interests, duration_minutes):
+        return generate_route(
+            "moscow", "day", interests, ["relax"], "0-500", "on_foot", duration_minutes, "", self.user
+        )
+
+    def test_similar_requests_share_route_but_get_own_ids(self):
+        first = self.generate(["parks", "food"], 122)
+        hits = route_cache.hits
+        second = self.generate(["food", "parks"], 125)
+
+        self.assertEqual(route_cache.hits, hits + 1)
+        self.assertNotEqual(first["route_id"], second["route_id"])
+        self.assertEqual([p["id"] for p in first["points"]], [p["id"] for p in second["points"]])
+        self.assertEqual(Route.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Route.objects.get(id=second["route_id"]).points.count(), len(second["points"]))
+
+    def test_route_is_solved_with_exact_limits(self):
+        with mock.patch.object(generator_module, "plan_route", wraps=generator_module.plan_route) as plan:
+            route = generate_route("moscow", "day", ["parks"], ["relax"], 650, "on_foot", 125, "", self.user)
+        self.assertEqual(plan.call_args.args[4:6], (650, 125.0))
+        saved = Route.objects.get(id=route["route_id"])
+        self.assertEqual((saved.budget, saved.duration_minutes), (650, 125.0))
+
+    def test_bucket_entry_is_reused_only_within_exact_limits(self):
+        self.generate(["parks"], 124)
+        [(key, entry)] = route_cache.entries.items()
+        entry[1]["total_duration"] = 124
+        hits, misses = route_cache.hits, route_cache.misses
+        self.generate(["parks"], 124)
+        self.assertEqual((route_cache.hits, route_cache.misses), (hits + 1, misses))
+
+        # та же корзина (120), но маршрут на 124 минуты в 121 не укладывается — строим заново
+        route = self.generate(["parks"], 121)
+        self.assertEqual((route_cache.hits, route_cache.misses), (hits + 1, misses + 1))
+        self.assertLessEqual(route["total_duration"], 121)
+        self.assertEqual(list(route_cache.entries), [key])
+
+    def test_semantic_failures_fall_back_to_no_hits(self):
+        failures = (
+            mock.patch.object(generator_module, "generate_embedding", side_effect=ConnectionError("сеть")),
+            mock.patch.object(generator_module.ann, "search", side_effect=ValueError("размерность")),
+        )
+        for n, failure in enumerate(failures):
+            # своё описание на каждый случай: иначе результат первого отдаст кеш или singleflight
+            with failure, self.assertLogs("apps.routes.generator.generator", "WARNING"):
+                route = generate_route("moscow", "day", ["parks"], ["relax"], None, "on_foot", 90, f"парк {n}", self.user)
+            self.assertTrue(route["points"])
+
+    def test_point_change_invalidates_city(self):
+        self.generate(["parks"], 120)
+        point = Point.objects.filter(city=self.city).first()
+        point.name = "Новое имя"
+        point.save()
+        misses = route_cache.misses
+        self.generate(["parks"], 120)
+        self.assertEqual(route_cache.misses, misses + 1)
+
+    def test_version_bumped_by_another_worker_invalidates_city(self):
+        self.generate(["parks"], 120)
+        version = get_snapshot("moscow").version
+        # другой процесс меняет точки: сигналы этого процесса не срабатывают, видна только БД
+        City.objects.filter(id="moscow").update(points_version=F("points_version") + 1)
+        misses = route_cache.misses
+        self.generate(["parks"], 120)
+        # пока версия в памяти свежая, чужую правку не видно
+        self.assertEqual(route_cache.misses, misses)
+        with mock.patch.object(snapshot_module, "VERSION_CHECK_SECONDS", 0):
+            self.generate(["parks"], 120)
+        self.assertEqual(route_cache.misses, misses + 1)
+        self.assertEqual(get_snapshot("moscow").version, version + 1)
+
+
+@override_settings(ROUTE_JOBS_PER_USER=1)
+class AsyncGenerateRouteTests(CityPointsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, **extra):
+        body = {"city_id": "moscow", "interests": ["parks"], "duration_minutes": 90, "async": True, **extra}
+        return self.client.post("/api/route/generate/", body, format="json")
+
+    def test_job_result_is_polled(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data["data"]["job_id"]
+        self.assertEqual(self.post().status_code, 429)
+
+        run_job(claim_next("test"))
+        data = self.client.get(f"/api/route/generate/{job_id}/?wait=1").data["data"]
+        self.assertEqual(data["job_status"], "done")
+        self.assertTrue(Route.objects.filter(id=data["route"]["route_id"], user=self.user).exists())
+        self.assertEqual(self.post().status_code, 202)
+
+    def test_generation_error_fails_without_retries(self):
+        job_id = self.post(city_id="nowhere").data["data"]["job_id"]
+        job = run_job(claim_next("test"))
+        self.assertEqual((job.status, job.attempts), ("failed", 1))
+        data = self.client.get(f"/api/route/generate/{job_id}/").data["data"]
+        self.assertIn("nowhere", data["error"])
+
+    def test_other_users_job_is_hidden(self):
+        job_id = self.post().data["data"]["job_id"]
+        other = APIClient()
+        other.force_authenticate(User.objects.create(username="other", email="other@example.com"))
+        self.assertEqual(other.get(f"/api/route/generate/{job_id}/").status_code, 404)
+
+    def test_async_alternatives_are_rejected(self):
+        self.assertEqual(self.post(alternatives=2).status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+
+class StreamGenerateRouteTests(CityPointsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        route_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def stream(self, **headers):
+        body = {"city_id": "moscow", "interests": ["parks"], "duration_minutes": 120}
+        response = self.client.post("/api/route/generate/stream/", body, format="json", **headers)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_points_arrive_before_totals(self):
+        events = [json.loads(line) for line in self.stream().splitlines()]
+        self.assertEqual(events[0]["event"], "start")
+        self.assertEqual(events[-1]["event"], "done")
+        route = events[-1]["route"]
+        self.assertEqual([e["point"]["id"] for e in events[:-1]], [p["id"] for p in route["points"]])
+        self.assertTrue(Route.objects.filter(id=route["route_id"], user=self.user).exists())
+
+        # повтор из кеша — те же точки и новый маршрут
+        again = [json.loads(line) for line in self.stream().splitlines()]
+        self.assertEqual([e.get("point") for e in again[:-1]], [e.get("point") for e in events[:-1]])
+        self.assertNotEqual(again[-1]["route"]["route_id"], route["route_id"])
+
+    def test_server_sent_events(self):
+        body = self.stream(HTTP_ACCEPT="text/event-stream")
+        self.assertTrue(body.startswith("event: start\ndata: "))
+        self.assertIn("event: done\n", body)
+
+
+class AlternativeRoutesTests(CityPointsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        route_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_alternatives_share_few_points(self):
+        body = {"city_id": "moscow", "interests": ["parks"], "duration_minutes": 90, "alternatives": 3}
+        response = self.client.post("/api/route/generate/", body, format="json")
+        self.assertEqual(response.status_code, 200)
+        routes = response.data["data"]["routes"]
+        self.assertEqual(len(routes), 3)
+        points = [[p["id"] for p in route["points"]] for route in routes]
+        for i in range(len(points)):
+            for j in range(i + 1, len(points)):
+                self.assertLessEqual(route_overlap(points[i], points[j]), MAX_OVERLAP)
+        self.assertEqual(Route.objects.filter(user=self.user).count(), 3)
+
+    def test_invalid_alternatives(self):
+        body = {"city_id": "moscow", "duration_minutes": 90, "alternatives": 50}
+        self.assertEqual(self.client.post("/api/route/generate/", body, format="json").status_code, 400)
+
+
+class RouteStopsTests(CityPointsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        route_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_stops_are_saved_in_order_and_read_in_one_join(self):
+        route = generate_route("moscow", "day", ["parks"], ["relax"], None, "on_foot", 150, "", self.user)
+        ids = [p["id"] for p in route["points"]]
+
+        # маршрут и его точки с join
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/route/show/{route['route_id']}/")
+        data = response.data["data"]
+        self.assertEqual(data["point_sequence"], ids)
+        self.assertEqual([p["id"] for p in data["points"]], ids)
+        arrivals = [p["planned_arrival"] for p in data["points"]]
+        self.assertTrue(all(arrivals))
+        self.assertEqual(arrivals, sorted(arrivals))
+
+        coordinates = [(p["coordinates"]["lat"], p["coordinates"]["lng"]) for p in data["points"]]
+        self.assertEqual(decode_polyline(data["polyline"]), [(round(a, 5), round(b, 5)) for a, b in coordinates])
+        self.assertGreater(data["total_distance_km"], 0)
+
+    def test_backfill_matches_distance_computed_at_save(self):
+        route = generate_route("moscow", "day", ["parks"], ["relax"], None, "on_foot", 150, "", self.user)
+        saved = Route.objects.values_list("total_distance_km", "polyline").get(id=route["route_id"])
+        Route.objects.update(total_distance_km=0.0, polyline="")
+
+        call_command("backfill_route_distance", stdout=io.StringIO())
+        self.assertEqual(Route.objects.values_list("total_distance_km", "polyline").get(id=route["route_id"]), saved)
+        # пример из описания формата
+        self.assertEqual(
+            encode_polyline([38.5, 40.7, 43.252], [-120.2, -120.95, -126.453]), "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+        )
+
+
+class EditRouteTests(CityPointsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        route_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.route = generate_route("moscow", "day", ["parks"], ["relax"], None, "on_foot", 90, "", self.user)
+        self.ids = [p["id"] for p in self.route["points"]]
+        self.outside = Point.objects.exclude(id__in=self.ids).order_by("id").first()
+
+    def constrain(self, **fields):
+        """Условия анкеты маршрута; без них (duration_minutes=None) правка ограничена только сутками."""
+        Route.objects.filter(id=self.route["route_id"]).update(**{"duration_minutes": None, **fields})
+
+    def edit(self, action, **body):
+        response = self.client.post(
+            "/api/route/edit/", {"route_id": self.route["route_id"], "action": action, **body}, format="json"
+        )
+        return response.status_code, response.data
+
+    def test_remove_insert_and_replace(self):
+        self.constrain()
+        code, data = self.edit("remove", point_id=self.ids[1])
+        self.assertEqual(code, 200)
+        sequence = [p["id"] for p in data["data"]["points"]]
+        self.assertEqual(sorted(sequence), sorted(self.ids[:1] + self.ids[2:]))
+        stops = Route.objects.get(id=self.route["route_id"]).stops.order_by("position")
+        self.assertEqual([stop.point_id for stop in stops], sequence)
+
+        outside = str(self.outside.id)
+        code, data = self.edit("insert", point_id=outside)
+        self.assertIn(outside, [p["id"] for p in data["data"]["points"]])
+
+        code, data = self.edit("replace", point_id=outside)
+        sequence = [p["id"] for p in data["data"]["points"]]
+        self.assertEqual(code, 200)
+        self.assertNotIn(outside, sequence)
+        self.assertEqual(len(sequence), len(self.ids))
+        route = Route.objects.get(id=self.route["route_id"])
+        self.assertEqual(route.total_duration, data["data"]["total_duration"])
+        self.assertEqual(route.points.count(), len(sequence))
+
+    def test_point_outside_route_is_rejected(self):
+        outside = Point.objects.exclude(id__in=self.ids).values_list("id", flat=True).first()
+        self.assertEqual(self.edit("remove", point_id=outside)[0], 400)
+        self.assertEqual(self.edit("teleport", point_id=self.ids[0])[0], 400)
+
+    def test_route_keeps_questionnaire_constraints(self):
+        route = Route.objects.get(id=self.route["route_id"])
+        self.assertEqual(route.transport, "walk")
+        self.assertEqual(route.duration_minutes, 90)
+        self.assertIsNone(route.budget)
+        self.assertEqual(route.start_at, datetime.fromisoformat(self.route["start_at"]))
+
+    def test_edit_keeps_route_transport_unless_given(self):
+        self.constrain(transport="bike")
+        code, data = self.edit("remove", point_id=self.ids[1])
+        self.assertEqual((code, data["data"]["transport"]), (200, "bike"))
+        code, data = self.edit("insert", point_id=self.ids[1], transport="car")
+        self.assertEqual((code, data["data"]["transport"]), (200, "car"))
+        self.assertEqual(Route.objects.get(id=self.route["route_id"]).transport, "car")
+
+    def test_edit_breaking_constraints_is_rejected(self):
+        stops = list(Route.objects.get(id=self.route["route_id"]).stops.values_list("point_id", flat=True))
+        # любая новая точка — ещё 20 минут визита сверх уже набранного времени
+        self.constrain(duration_minutes=self.route["total_duration"])
+        self.assertEqual(self.edit("insert", point_id=self.outside.id)[0], 400)
+
+        self.outside.average_cost = 500
+        self.outside.save()
+        self.constrain(budget=300)
+        self.assertEqual(self.edit("insert", point_id=self.outside.id)[0], 400)
+        self.assertEqual(self.edit("replace", point_id=self.ids[0], new_point_id=self.outside.id)[0], 400)
+
+        self.outside.average_cost = 0
+        self.outside.working_hours_json = "Mo-Su 03:00-04:00"
+        self.outside.save()
+        start_at = timezone.make_aware(datetime(2026, 10, 19, 12, 0))
+        self.constrain(duration_minutes=300, start_at=start_at)
+        self.assertEqual(self.edit("insert", point_id=self.outside.id)[0], 400)
+        route = Route.objects.get(id=self.route["route_id"])
+        self.assertEqual(list(route.stops.values_list("point_id", flat=True)), stops)
+
+        # автоматическая замена обходит закрытую точку
+        code, data = self.edit("replace", point_id=self.ids[0])
+        self.assertEqual(code, 200)
+        self.assertNotIn(str(self.outside.id), [p["id"] for p in data["data"]["points"]])
+
+
+class SolverTests(TestCase):
+    def instance(self, n=40, seed=0):
+        rng = np.random.default_rng(seed)
+        xy = rng.uniform(0, 3, (n, 2))
+        travel = np.linalg.norm(xy[:, None] - xy[None, :], axis=-1) * 12
+        return rng.uniform(0.1, 1, n), rng.integers(10, 60, n).astype(float), rng.integers(0, 800, n), travel
+
+    def test_budgets_are_never_exceeded(self):
+        for seed in range(5):
+            scores, visit, cost, travel = self.instance(seed=seed)
+            for time_budget, cost_budget in ((60, None), (180, 1000), (300, 300)):
+                solution = solve_orienteering(scores, visit, cost, travel, time_budget, cost_budget)
+                self.assertTrue(solution.order)
+                self.assertLessEqual(solution.total_minutes, time_budget + 1e-6)
+                if cost_budget is not None:
+                    self.assertLessEqual(solution.total_cost, cost_budget)
+                self.assertEqual(len(set(solution.order)), len(solution.order))
+
+    def test_tiny_deadline_still_returns_feasible_route(self):
+        scores, visit, cost, travel = self.instance(n=300)
+        solution = solve_orienteering(scores, visit, cost, travel, 240, 2000, deadline_ms=0.01)
+        self.assertTrue(solution.order)
+        self.assertLessEqual(solution.total_minutes, 240 + 1e-6)
+        self.assertLessEqual(solution.total_cost, 2000)
+
+    def test_nothing_allowed_returns_empty_solution(self):
+        scores, visit, cost, travel = self.instance()
+        self.assertEqual(solve_orienteering(scores, visit, cost, travel, 5), RouteSolution())
+        solution = solve_orienteering(scores, visit, cost, travel, 300, exclude=np.arange(len(scores)))
+        self.assertEqual(solution.order, [])
+
+    def test_start_is_respected(self):
+        scores, visit, cost, travel = self.instance()
+        start = int(np.argmin(scores))
+        solution = solve_orienteering(scores, visit, cost, travel, 180, start=start)
+        self.assertEqual(solution.order[0], start)
+        self.assertEqual(solution.arrivals[0], 0.0)
+
+
+class GridSnapshot:
+    """Минимальный снапшот для DistanceCache: город, версия и координаты точек."""
+
+    def __init__(self, n, version=1, seed=0):
+        rng = np.random.default_rng(seed)
+        self.city_id, self.version = "moscow", version
+        self.lat, self.lng = 55.7 + rng.uniform(0, 0.1, n), 37.5 + rng.uniform(0, 0.2, n)
+
+    def __len__(self):
+        return len(self.lat)
+
+
+class DistanceCacheTests(TestCase):
+    def fresh(self, snapshot, rows):
+        return haversine_km(snapshot.lat[rows], snapshot.lng[rows], snapshot.lat[rows], snapshot.lng[rows])
+
+    def test_lru_eviction_keeps_bytes_under_cap(self):
+        snapshot = GridSnapshot(400)
+        sets = [np.arange(start, start + 50) for start in range(0, 200, 50)]
+        entry_bytes = 50 * 50 * 4 + 50 * 8
+        # full_rows=0: кешируется матрица каждого набора, места — на два набора
+        cache = DistanceCache(max_bytes=2 * entry_bytes + 100, full_rows=0)
+        for rows in sets[:3]:
+            cache.distances(snapshot, rows)
+        self.assertEqual(cache.nbytes, 2 * entry_bytes)
+        self.assertLessEqual(cache.nbytes, cache.max_bytes)
+
+        cache.distances(snapshot, sets[1])  # свежее использование
+        cache.distances(snapshot, sets[3])
+        kept = [entry.rows[0] for entry in cache.entries.values()]
+        self.assertEqual(kept, [50, 150])
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+        cache.distances(snapshot, sets[0])
+        self.assertEqual(cache.misses, 5)
+
+    def test_subset_lookup_matches_fresh_computation(self):
+        snapshot = GridSnapshot(400)
+        rng = np.random.default_rng(1)
+        cache = DistanceCache(full_rows=0)
+        candidates = rng.choice(len(snapshot), 120, replace=False)
+        cache.distances(snapshot, candidates)
+
+        subset = rng.permutation(candidates)[:40]
+        np.testing.assert_array_equal(cache.distances(snapshot, subset), self.fresh(snapshot, subset))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(len(cache.entries), 1)
+
+        # строка вне набора — уже не подмножество
+        outside = np.setdiff1d(np.arange(len(snapshot)), candidates)[:1]
+        np.testing.assert_array_equal(
+            cache.distances(snapshot, np.concatenate([subset, outside])),
+            self.fresh(snapshot, np.concatenate([subset, outside])),
+        )
+        self.assertEqual(cache.misses, 2)
+
+    def test_full_matrix_and_version_change(self):
+        snapshot = GridSnapshot(300)
+        cache = DistanceCache()
+        rows = np.array([7, 3, 250, 3])
+        np.testing.assert_array_equal(cache.distances(snapshot, rows), self.fresh(snapshot, rows))
+        cache.distances(snapshot, np.array([1, 2]))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        moved = GridSnapshot(300, version=2, seed=5)
+        np.testing.assert_array_equal(cache.distances(moved, rows), self.fresh(moved, rows))
+        self.assertEqual(len(cache.entries), 1)
+        self.assertEqual(cache.nbytes, 300 * 300 * 4 + 300 * 8)
+
+    def test_transport_profiles(self):
+        km = np.array([0.0, 0.1, 1.0, 3.0])
+        walk = get_profile("on_foot")
+        self.assertIs(walk, get_profile(None))
+        self.assertIs(walk, get_profile("телепорт"))
+        np.testing.assert_allclose(walk.minutes(km), km * 1.3 / 4.5 * 60, rtol=1e-6)
+        np.testing.assert_allclose(walk.minutes(km, road=True), km / 4.5 * 60, rtol=1e-6)
+
+        bike = get_profile("bike")
+        expected = np.minimum(km * 1.25 / 14 * 60 + np.where(km > 0, 2, 0), km * 1.3 / 4.5 * 60)
+        np.testing.assert_allclose(bike.minutes(km), expected, rtol=1e-6)
+        # короткий переход пешком, длинный — на велосипеде
+        self.assertAlmostEqual(float(bike.minutes(km)[1]), float(walk.minutes(km)[1]), places=5)
+        self.assertLess(bike.minutes(km)[3], walk.minutes(km)[3])
+
+        transit, car = get_profile("public_transport"), get_profile("car")
+        self.assertEqual((transit.speed_kmh, transit.detour, transit.overhead_minutes), (20.0, 1.4, 8))
+        self.assertEqual((car.speed_kmh, car.detour, car.overhead_minutes), (25.0, 1.35, 6))
+        self.assertFalse(car.uses_roads)
+        self.assertEqual(car.minutes(km)[0], 0.0)
+
+
+class OpeningHoursTests(TestCase):
+    def test_overnight_range_spills_into_next_day(self):
+        slots = compile_open_slots({"fri": "22:00-02:00"})
+        self.assertTrue(is_open(slots, 4, 23 * 60))
+        self.assertTrue(is_open(slots, 5, 1 * 60 + 45))
+        self.assertFalse(is_open(slots, 5, 2 * 60))
+        self.assertFalse(is_open(slots, 4, 21 * 60 + 45))
+
+    def test_day_ranges_and_lists(self):
+        slots = compile_open_slots("Mo-Fr 09:00-18:00; Sa 10:00-16:00; Su off")
+        self.assertTrue(is_open(slots, 2, 12 * 60))
+        self.assertFalse(is_open(slots, 2, 18 * 60))
+        self.assertTrue(is_open(slots, 5, 10 * 60))
+        self.assertFalse(is_open(slots, 5, 16 * 60))
+
+        slots = compile_open_slots({"пн-пт": ["10:00-14:00", "15:00-19:00"]})
+        self.assertTrue(is_open(slots, 0, 13 * 60 + 45))
+        self.assertFalse(is_open(slots, 0, 14 * 60 + 30))
+        self.assertTrue(is_open(slots, 4, 15 * 60))
+
+        slots = compile_open_slots([{"day": "mon", "open": "10:00", "close": "14:00"},
+                                    {"day": "mon", "open": "15:00", "close": "22:00"}])
+        self.assertTrue(is_open(slots, 0, 21 * 60 + 45))
+        self.assertFalse(is_open(slots, 0, 14 * 60 + 30))
+        self.assertFalse(is_open(slots, 1, 12 * 60))
+
+    def test_closed_days(self):
+        for value in ("Mo-Sa 10:00-20:00; Su off", {"mon-sat": "10:00-20:00", "sun": None},
+                      {"daily": "10:00-20:00", "вс": {"closed": True}}):
+            slots = compile_open_slots(value)
+            self.assertTrue(is_open(slots, 5, 12 * 60), value)
+            self.assertFalse(any(is_open(slots, 6, minute) for minute in range(0, 24 * 60, 15)), value)
+
+    def test_always_open(self):
+        self.assertEqual(compile_open_slots("24/7"), ALWAYS_OPEN)
+        self.assertEqual(compile_open_slots({"daily": "круглосуточно"}), ALWAYS_OPEN)
+
+    def test_malformed_hours_are_unknown(self):
+        for value in ("иногда", "Mo-Fr 25:00-26:00", {"funday": "10:00-12:00"}, [{"open": "10:00"}], None, ""):
+            self.assertIsNone(compile_open_slots(value), value)
+        self.assertTrue(is_open(None, 6, 3 * 60))
+
+    def test_month_mask(self):
+        self.assertEqual(compile_month_mask(True, [6, 7, 8]), 0b111 << 5)
+        self.assertEqual(compile_month_mask(True, ["12", 13, "x"]), 1 << 11)
+        self.assertEqual(compile_month_mask(False, [6]), ALL_MONTHS)
+        self.assertEqual(compile_month_mask(True, [0, 13]), ALL_MONTHS)
+
+    def test_solver_respects_hours_and_counts_wait(self):
+        # понедельник 10:00; точка 1 закрыта весь день, точка 2 открывается в 11:00
+        hours = ["24/7", {"mon": None}, "Mo 11:00-18:00"]
+        snapshot = SimpleNamespace(
+            open_slots=np.frombuffer(b"".join(compile_open_slots(h) for h in hours), dtype=np.uint8).reshape(3, 7, -1),
+            visit=np.full(3, 20.0),
+        )
+        window = RouteWindow(datetime(2026, 10, 19, 10, 0), 180)
+        start_slots = next_start_slots(snapshot, np.arange(3), window)
+        scores, cost, travel = np.array([1.0, 10.0, 5.0]), np.zeros(3), np.zeros((3, 3))
+
+        solution = solve_orienteering(scores, snapshot.visit, cost, travel, 120, start_slots=start_slots)
+        self.assertNotIn(1, solution.order)
+        self.assertEqual(sorted(solution.order), [0, 2])
+        self.assertGreaterEqual(solution.arrivals[solution.order.index(2)], 60)
+        self.assertGreater(solution.wait_minutes, 0)
+        self.assertLessEqual(solution.total_minutes, 120)
+
+        # визиты укладываются в 70 минут, но с ожиданием открытия точка 2 — уже нет
+        solution = solve_orienteering(scores, snapshot.visit, cost, travel, 70, start_slots=start_slots)
+        self.assertEqual(solution.order, [0])
+
+
+ROAD_OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="55.7500" lon="37.6100"/>
+  <node id="2" lat="55.7500" lon="37.6110"/>
+  <node id="3" lat="55.7500" lon="37.6120"/>
+  <node id="4" lat="55.7510" lon="37.6120"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="4"/><tag k="highway" v="footway"/></way>
+</osm>
+"""
+
+
+class RoadGraphTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(ROAD_GRAPH_DIR=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(roads._graphs.clear)
+        osm = Path(self.root) / "city.osm"
+        osm.write_text(ROAD_OSM)
+        roads.save_graph("moscow", roads.parse_osm(osm))
+
+    def test_point_table_build_and_lookup(self):
+        graph = roads.get_graph("moscow")
+        self.assertEqual(len(graph), 4)
+        self.assertIsNone(graph.point_ids)
+
+        # a и b у концов дороги, c дальше SNAP_MAX_METERS от графа
+        ids = ["a", "b", "c"]
+        lat, lng = np.array([55.7500, 55.7510, 55.7600]), np.array([37.6100, 37.6120, 37.6100])
+        with self.assertLogs("apps.routes.generator.roads", "WARNING"):
+            roads.save_point_table("moscow", roads.build_point_table(graph, ids, lat, lng))
+        graph = roads.get_graph("moscow")
+
+        with self.assertLogs("apps.routes.generator.roads", "INFO") as logs:
+            km = graph.road_km(["b", "a", "c", "new"])
+        self.assertIn("1 из 4 точек нет в таблице", logs.output[0])
+        along = haversine_km([55.75, 55.75], [37.61, 37.612], [55.75, 55.751], [37.612, 37.612])
+        self.assertAlmostEqual(float(km[0, 1]), along[0, 0] + along[1, 1], places=3)
+        self.assertEqual(km[0, 1], km[1, 0])
+        self.assertTrue(np.isnan(km[0, 2]) and np.isnan(km[1, 3]))
+
+    def test_point_table_matches_all_pairs_shortest_paths(self):
+        # решётка 6x6 с шагом ~110 м и случайными весами; эталон — Флойд — Уоршелл
+        rng = np.random.default_rng(0)
+        side = 6
+        grid = np.arange(side * side).reshape(side, side)
+        src = np.concatenate([grid[:, :-1].ravel(), grid[:-1, :].ravel()])
+        dst = np.concatenate([grid[:, 1:].ravel(), grid[1:, :].ravel()])
+        length = rng.uniform(100, 300, src.size)
+        indptr, indices, csr_length = roads._csr(side * side, src, dst, length)
+        node_lat = 55.75 + (np.arange(side * side) // side) * 0.001
+        node_lng = 37.61 + (np.arange(side * side) % side) * 0.0018
+        roads.save_graph("moscow", {"lat": node_lat, "lng": node_lng, "indptr": indptr,
+                                    "indices": indices, "length": csr_length})
+        full = np.full((side * side, side * side), np.inf)
+        np.fill_diagonal(full, 0)
+        full[src, dst] = full[dst, src] = length
+        for k in range(side * side):
+            full = np.minimum(full, full[:, [k]] + full[[k], :])
+
+        picks = rng.choice(side * side, 12, replace=False)
+        ids = [f"p{i}" for i in range(12)]
+        limit_km = 0.6
+        backends = [None] + ([roads.dijkstra] if roads.dijkstra is not None else [])
+        for backend in backends:
+            with mock.patch.object(roads, "dijkstra", backend), self.assertNoLogs(level="WARNING"):
+                graph = roads.get_graph("moscow")
+                table = roads.build_point_table(graph, ids, node_lat[picks], node_lng[picks], limit_km)
+            for i in range(12):
+                row = slice(table["point_indptr"][i], table["point_indptr"][i + 1])
+                got = dict(zip(table["point_neighbors"][row].tolist(), table["point_meters"][row].tolist()))
+                straight = haversine_km(node_lat[picks[[i]]], node_lng[picks[[i]]], node_lat[picks], node_lng[picks])[0]
+                expected = {
+                    j: full[picks[i], picks[j]] for j in range(12)
+                    if j != i and straight[j] <= limit_km and full[picks[i], picks[j]] <= limit_km * 1000
+                }
+                self.assertEqual(set(got), set(expected), backend)
+                for j, meters in expected.items():
+                    self.assertAlmostEqual(got[j], meters, delta=0.5)
+
+    def test_versions_switch_as_a_whole(self):
+        graph_version = roads.current_version("moscow")
+        graph = roads.get_graph("moscow")
+        table = roads.build_point_table(graph, ["a"], np.array([55.75]), np.array([37.61]))
+        table_version = roads.save_point_table("moscow", table)
+
+        self.assertNotEqual(table_version, graph_version)
+        self.assertEqual(roads.get_graph("moscow").stamp, table_version)
+        files = {path.stem for path in (Path(self.root) / "moscow" / "versions" / table_version).iterdir()}
+        self.assertEqual(files, set(roads.GRAPH_FILES) | set(roads.TABLE_FILES))
+
+        roads.save_graph("moscow", {name: getattr(graph, name) for name in roads.GRAPH_FILES})
+        self.assertIsNone(roads.get_graph("moscow").point_ids)
+        self.assertEqual(len(list((Path(self.root) / "moscow" / "versions").iterdir())), roads.KEEP_VERSIONS)
+
+    def test_missing_files_fall_back_to_straight_lines(self):
+        # CURRENT остался, а каталога версии нет — как после ручной чистки var/roads
+        shutil.rmtree(Path(self.root) / "moscow" / "versions")
+        roads._graphs.clear()
+        with self.assertLogs("apps.routes.generator.roads", "WARNING"):
+            self.assertIsNone(roads.get_graph("moscow"))
+        self.assertIsNone(roads.get_graph("nowhere"))
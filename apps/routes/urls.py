@@ -6,6 +6,9 @@ urlpatterns = [
     path('form/', FormDataView.as_view(), name='form-data-view'),
     path("area/", CityAreaView.as_view(), name="city-areas"),
     path("generate/", GenerateRouteView.as_view(), name="generate-route"),
+    path("generate/stream/", RouteStreamView.as_view(), name="generate-route-stream"),
+    path("generate/<str:job_id>/", RouteJobView.as_view(), name="generate-route-job"),
+    path("edit/", EditRouteView.as_view(), name="edit-route"),
     path("edit-status/", EditRouteStatusView.as_view(), name="edit-route-status"),
     path("cancel/", CancelRouteView.as_view(), name="cancel-route"),
     path("show/<str:id_route>/", RouteDetailView.as_view(), name="route-detail"),
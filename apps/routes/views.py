@@ -1,13 +1,34 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 
-from .generator.generator import generate_route_stub
-from .models import City, Interest, Mood, CityArea, Route, Feedback
+from apps.core import jobs
+from apps.core.models import Job
+from .generator.generator import (
+    ALTERNATIVES_MAX, generate_alternatives, generate_route, prepare_request, RouteGenerationError,
+)
+from .generator.streaming import stream_route
+from .generator.editing import RouteEditError
+from .models import City, Interest, Mood, CityArea, Route, RouteStop, Feedback
+from .services import apply_route_edit, set_route_status
 from .serializers import CitySerializer, InterestSerializer, MoodSerializer
 
+ROUTE_JOB_KIND = "route-generate"
+# Как часто проверяем статус задачи при long-poll, с
+ROUTE_JOB_POLL_INTERVAL = 0.2
+TRUE_VALUES = {True, 1, "1", "true", "yes", "on"}
+
+
 # Форма ввода
 class FormDataView(APIView):
     def get(self, request):
@@ -62,34 +83,193 @@ class CityAreaView(APIView):
         return Response({"status": "success", "data": data}, status=status.HTTP_200_OK)
 
 
+def parse_route_form(data) -> tuple[dict | None, str | None]:
+    """Поля анкеты генерации из тела запроса: (форма, None) или (None, текст ошибки)."""
+    form = {
+        "city_id": data.get("city_id"),
+        "time_of_day": data.get("time_of_day"),
+        "interests": data.get("interests", []),
+        "mood": data.get("mood", []),
+        "budget": data.get("budget"),
+        "transport": data.get("transport"),
+        "duration_minutes": data.get("duration_minutes"),
+        "description": data.get("description"),
+        "start_at": data.get("start_at") or None,
+    }
+    if not form["city_id"] or not form["duration_minutes"]:
+        return None, "city_id и duration_minutes обязательны"
+
+    if form["start_at"]:
+        try:
+            form["start_at"] = parse_datetime(str(form["start_at"]))
+        except ValueError:
+            form["start_at"] = None
+        if form["start_at"] is None:
+            return None, "start_at должен быть датой и временем в формате ISO 8601"
+    return form, None
+
+
 class GenerateRouteView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
         data = request.data
+        form, error = parse_route_form(data)
+        if error:
+            return Response({"status": "error", "message": error}, status=status.HTTP_400_BAD_REQUEST)
 
-        city_id = data.get("city_id")
-        time_of_day = data.get("time_of_day")
-        interests = data.get("interests", [])
-        mood = data.get("mood", [])
-        budget = data.get("budget")
-        transport = data.get("transport")
-        duration_minutes = data.get("duration_minutes")
-        description = data.get("description")
+        try:
+            alternatives = int(data.get("alternatives") or 1)
+        except (TypeError, ValueError):
+            alternatives = 0
+        if not 1 <= alternatives <= ALTERNATIVES_MAX:
+            return Response(
+                {"status": "error", "message": f"alternatives должно быть числом от 1 до {ALTERNATIVES_MAX}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        if not city_id or not duration_minutes:
+        requested_async = data.get("async", request.query_params.get("async"))
+        if alternatives > 1 and str(requested_async).lower() in TRUE_VALUES:
             return Response(
-                {"status": "error", "message": "city_id и duration_minutes обязательны"},
+                {"status": "error", "message": "async не поддерживается вместе с alternatives > 1"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        is_async = settings.ROUTE_GENERATION_ASYNC if requested_async is None else requested_async
+        if alternatives == 1 and str(is_async).lower() in TRUE_VALUES:
+            start_at = form["start_at"]
+            return self.enqueue(request, {**form, "start_at": start_at.isoformat() if start_at else None})
 
-        # Вызов заглушки вместо ML
-        route_data = generate_route_stub(
-            city_id, time_of_day, interests, mood, budget, transport, duration_minutes, description, request.user
-        )
+        try:
+            if alternatives > 1:
+                # несколько непохожих маршрутов за один проход; ROUTE_GENERATION_ASYNC на них не действует
+                route_data = {"routes": generate_alternatives(**form, user=request.user, alternatives=alternatives)}
+            else:
+                route_data = generate_route(**form, user=request.user)
+        except RouteGenerationError as e:
+            return Response(
+                {"status": "error", "message": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
         return Response({"status": "success", "data": route_data}, status=status.HTTP_200_OK)
 
+    def enqueue(self, request, params):
+        """Асинхронный режим: ставим задачу для run_jobs и сразу отвечаем 202 с job_id."""
+        try:
+            float(params["duration_minutes"])
+        except (TypeError, ValueError):
+            return Response(
+                {"status": "error", "message": "duration_minutes должен быть числом"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        active = Job.objects.filter(kind=ROUTE_JOB_KIND, status__in=[Job.Status.QUEUED, Job.Status.RUNNING])
+        with transaction.atomic():
+            # строка пользователя под FOR UPDATE: его параллельные запросы проверяют лимит и ставят
+            # задачу по очереди, а не считают одно и то же число незавершённых задач
+            list(get_user_model().objects.select_for_update().filter(pk=request.user.id).values_list("pk"))
+            if active.filter(user_id=request.user.id).count() >= settings.ROUTE_JOBS_PER_USER:
+                return Response(
+                    {"status": "error", "message": "Дождитесь уже запущенных генераций маршрута"},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                )
+            # глубина очереди общая, её блокировкой не сериализуем: перебор — не больше числа
+            # одновременных запросов, а лимит защищает от перегрузки, а не считает точно
+            if active.filter(status=Job.Status.QUEUED).count() >= settings.ROUTE_JOBS_MAX_QUEUE:
+                return Response(
+                    {"status": "error", "message": "Сервис перегружен, попробуйте позже"},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={"Retry-After": "5"},
+                )
+            job = jobs.enqueue(ROUTE_JOB_KIND, params, user=request.user)
+        return Response(
+            {"status": "success", "data": {"job_id": job.id, "job_status": job.status}},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class RouteStreamView(APIView):
+    """Потоковая генерация: старт, затем каждая зафиксированная точка, затем итоги маршрута.
+
+    С Accept: text/event-stream — Server-Sent Events, иначе NDJSON (одно событие — одна строка JSON).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # text/event-stream нет среди рендереров DRF — ошибки отдаём обычным JSON вместо 406
+        return super().perform_content_negotiation(request, force=True)
+
+    def post(self, request):
+        form, error = parse_route_form(request.data)
+        if error:
+            return Response({"status": "error", "message": error}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            req = prepare_request(**form)
+        except RouteGenerationError as e:
+            return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        sse = "text/event-stream" in request.headers.get("Accept", "")
+        response = StreamingHttpResponse(
+            self.encode(stream_route(req, request.user), sse),
+            content_type="text/event-stream" if sse else "application/x-ndjson",
+        )
+        response["Cache-Control"] = "no-cache"
+        # nginx не должен копить ответ в буфере
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    @staticmethod
+    def encode(events, sse: bool):
+        try:
+            for event in events:
+                line = json.dumps(event, ensure_ascii=False)
+                yield f"event: {event['event']}\ndata: {line}\n\n" if sse else line + "\n"
+        except RouteGenerationError as e:
+            line = json.dumps({"event": "error", "message": str(e)}, ensure_ascii=False)
+            yield f"event: error\ndata: {line}\n\n" if sse else line + "\n"
+
+
+class RouteJobView(APIView):
+    """Статус асинхронной генерации; ?wait=N — ждать готовности до N секунд (не больше ROUTE_JOB_MAX_WAIT).
+
+    Ожидание держит синхронный воркер, поэтому предел — пара секунд; дольше клиент опрашивает сам.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, job_id):
+        jobs_of_user = Job.objects.filter(kind=ROUTE_JOB_KIND, user_id=request.user.id)
+        try:
+            wait = min(max(float(request.query_params.get("wait", 0)), 0.0), settings.ROUTE_JOB_MAX_WAIT)
+        except ValueError:
+            wait = 0.0
+
+        deadline = time.monotonic() + wait
+        job_status = jobs_of_user.filter(id=job_id).values_list("status", flat=True).first()
+        while job_status in (Job.Status.QUEUED, Job.Status.RUNNING) and time.monotonic() < deadline:
+            time.sleep(ROUTE_JOB_POLL_INTERVAL)
+            job_status = jobs_of_user.filter(id=job_id).values_list("status", flat=True).first()
+        if job_status is None:
+            return Response(
+                {"status": "error", "message": "Задача не найдена или не принадлежит пользователю"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        job = jobs_of_user.get(id=job_id)
+        return Response(
+            {
+                "status": "success",
+                "data": {
+                    "job_id": job.id,
+                    "job_status": job.status,
+                    "route": job.result.get("route"),
+                    "error": job.error if job.status == Job.Status.FAILED else None,
+                    "created_at": job.created_at.isoformat(),
+                    "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+                },
+            },
+            status=status.HTTP_200_OK,
+        )
+
 
 class EditRouteStatusView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -111,15 +291,14 @@ class EditRouteStatusView(APIView):
             )
 
         try:
-            route = Route.objects.get(id=route_id, user=request.user)
+            route = Route.objects.get(id=route_id, user_id=request.user.id)
         except Route.DoesNotExist:
             return Response(
                 {"status": "error", "message": "Маршрут не найден или не принадлежит пользователю"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        route.status = new_status
-        route.save(update_fields=["status"])
+        set_route_status(route, new_status)
 
         return Response(
             {
@@ -135,6 +314,45 @@ class EditRouteStatusView(APIView):
 
 
 
+class EditRouteView(APIView):
+    """Точечная правка маршрута: action = replace | remove | insert.
+
+    replace — point_id заменяется на new_point_id или, без него, на похожую точку рядом;
+    remove — point_id убирается; insert — point_id добавляется в самое удобное место.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        route_id = request.data.get("route_id")
+        action = request.data.get("action")
+        if not route_id or not action:
+            return Response(
+                {"status": "error", "message": "route_id и action обязательны"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            route = Route.objects.get(id=route_id, user_id=request.user.id)
+        except Route.DoesNotExist:
+            return Response(
+                {"status": "error", "message": "Маршрут не найден или не принадлежит пользователю"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            route_data = apply_route_edit(
+                route,
+                action,
+                request.data.get("point_id"),
+                request.data.get("new_point_id"),
+                request.data.get("transport"),
+            )
+        except RouteEditError as e:
+            return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"status": "success", "data": route_data}, status=status.HTTP_200_OK)
+
+
 class CancelRouteView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -149,19 +367,20 @@ class CancelRouteView(APIView):
             )
 
         try:
-            route = Route.objects.get(id=route_id, user=request.user)
+            route = Route.objects.get(id=route_id, user_id=request.user.id)
         except Route.DoesNotExist:
             return Response(
                 {"status": "error", "message": "Маршрут не найден или не принадлежит пользователю"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        route.status = Route.WalkStatus.CANCELLED
-        Feedback.objects.create(
-            route=route,
-            user=request.user,
-            comment=reason
-        )
+        with transaction.atomic():
+            set_route_status(route, Route.WalkStatus.CANCELLED)
+            Feedback.objects.create(
+                route=route,
+                user_id=request.user.id,
+                comment=reason
+            )
 
         return Response(
             {
@@ -183,33 +402,38 @@ class RouteDetailView(APIView):
 
     def get(self, request, id_route):
         try:
-            route = Route.objects.get(id=id_route, user=request.user)
+            route = Route.objects.get(id=id_route, user_id=request.user.id)
         except Route.DoesNotExist:
             return Response(
                 {"status": "error", "message": "Маршрут не найден или не принадлежит пользователю"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        # точки по порядку одним запросом с join на points
+        stops = list(RouteStop.objects.filter(route=route).select_related("point").order_by("position"))
         data = {
             "route_id": route.id,
-            "user_id": route.user.id if route.user else None,
+            "user_id": route.user_id,
             "description": route.description,
             "total_duration": route.total_duration,
             "total_cost": route.total_cost,
+            "total_distance_km": route.total_distance_km,
+            "polyline": route.polyline,
             "status": route.status,
-            "point_sequence": route.point_sequence,
+            "point_sequence": [stop.point_id for stop in stops],
             "points": [
                 {
-                    "id": p.id,
-                    "name": p.name,
-                    "description": p.description,
-                    "image_url": p.image_url,
+                    "id": stop.point.id,
+                    "name": stop.point.name,
+                    "description": stop.point.description,
+                    "image_url": stop.point.image_url,
                     "coordinates": {
-                        "lat": float(p.coordinates_lat),
-                        "lng": float(p.coordinates_lng),
+                        "lat": float(stop.point.coordinates_lat),
+                        "lng": float(stop.point.coordinates_lng),
                     },
+                    "planned_arrival": stop.planned_arrival.isoformat() if stop.planned_arrival else None,
                 }
-                for p in route.points.all()
+                for stop in stops
             ],
             "created_at": route.created_at.isoformat(),
             "updated_at": route.updated_at.isoformat() if hasattr(route, "updated_at") else None,
@@ -233,7 +457,7 @@ class FeedbackView(APIView):
             )
 
         try:
-            route = Route.objects.get(id=route_id, user=request.user)
+            route = Route.objects.get(id=route_id, user_id=request.user.id)
         except Route.DoesNotExist:
             return Response(
                 {"status": "error", "message": "Маршрут не найден или не принадлежит пользователю"},
@@ -248,7 +472,7 @@ class FeedbackView(APIView):
 
         feedback = Feedback.objects.create(
             route=route,
-            user=request.user,
+            user_id=request.user.id,
             rating=rating,
             comment=comment
         )
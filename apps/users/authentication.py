@@ -0,0 +1,111 @@
+"""JWT-аутентификация без загрузки пользователя из БД на каждый запрос.
+
+Пользователь собирается из подписанных claims токена (user_id, is_staff, is_active —
+их кладёт UserRefreshToken; если claim нет, берётся значение из БД). Отзыв проверяется по кешу состояния в памяти процесса:
+раз в JWT_USER_STATE_TTL секунд на пользователя читаем is_active/is_staff из БД. Отключённый
+пользователь теряет доступ не позже чем через TTL, снятый флаг staff — тоже.
+
+request.user — ленивый объект: id, pk, is_staff, is_active отвечают без запроса, а при
+обращении к любым другим полям (email, username, isinstance(..., User)) он один раз
+загружает настоящего пользователя. Поэтому в фильтрах и при создании записей лучше
+передавать user_id=request.user.id, а не сам объект.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.core import metrics
+
+# Сколько пользователей держим в кеше состояния одного процесса
+USER_STATE_MAX_ENTRIES = 100_000
+
+
+class UserRefreshToken(RefreshToken):
+    """Refresh-токен с флагами пользователя; access-токен копирует их из refresh."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token["is_staff"] = user.is_staff
+        token["is_active"] = user.is_active
+        return token
+
+
+class UserStateCache:
+    """user_id -> (is_active, is_staff) из БД с TTL; None — пользователя нет."""
+
+    def __init__(self, ttl: float, max_entries: int = USER_STATE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                metrics.incr("auth.user_state.hits")
+                return entry[1]
+        metrics.incr("auth.user_state.misses")
+        state = (
+            get_user_model().objects.filter(pk=user_id).values_list("is_active", "is_staff").first()
+        )
+        with self.lock:
+            self.entries[user_id] = (now + self.ttl, state)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return state
+
+    def invalidate(self, user_id) -> None:
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+user_state = UserStateCache(settings.JWT_USER_STATE_TTL)
+
+
+class ClaimsUser(SimpleLazyObject):
+    """Пользователь из claims токена; полная модель загружается при первом обращении к другим полям."""
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, is_staff: bool, is_active: bool = True):
+        super().__init__(lambda: get_user_model().objects.get(pk=user_id))
+        # поля в __dict__ читаются без _setup()
+        self.__dict__.update(id=user_id, pk=user_id, is_staff=is_staff, is_active=is_active)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            # в токене id строкой — приводим к типу первичного ключа, как у настоящего пользователя
+            user_id = get_user_model()._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, ValidationError):
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        state = user_state.get(user_id)
+        if state is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        is_active, is_staff = state
+        if not is_active or not validated_token.get("is_active", True):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        # права из токена действуют, пока их не сняли в БД; у токенов, выданных до появления
+        # claim (обычный RefreshToken), флаг берём из строки пользователя в кеше состояния
+        claim = validated_token.get("is_staff")
+        return ClaimsUser(user_id, is_staff=is_staff if claim is None else bool(claim) and is_staff)
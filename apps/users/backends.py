@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.functions import Lower
+
+from .hashing import get_hash_pool
+
+
+class EmailBackend(ModelBackend):
+    """Вход по email без учёта регистра: один запрос по уникальному индексу LOWER(email),
+    пароль проверяется в пуле хеширования (users/hashing.py)."""
+
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if not email or password is None:
+            return None
+        user_model = get_user_model()
+        user = (
+            user_model.objects.annotate(email_lower=Lower("email"))
+            # exclude — условие частичного индекса, без него PostgreSQL индекс не возьмёт
+            .filter(email_lower=email.strip().lower())
+            .exclude(email="")
+            .first()
+        )
+        pool = get_hash_pool()
+        if user is None:
+            # хешируем и для несуществующего email, чтобы время ответа не выдавало, есть ли такой пользователь
+            pool.make_password(password)
+            return None
+        if pool.check_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
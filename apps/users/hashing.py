@@ -0,0 +1,67 @@
+"""Ограниченный пул для хеширования паролей.
+
+PBKDF2 — сотни миллисекунд CPU на проверку пароля. Без ограничения всплеск логинов
+занимает все ядра, и остальные запросы ждут процессор. Пул держит не больше
+PASSWORD_HASH_WORKERS одновременных хеширований (hashlib отпускает GIL, так что
+потоков достаточно) и не больше PASSWORD_HASH_QUEUE ожидающих; сверх этого сразу
+HashPoolBusy — API отвечает 503 с Retry-After. Запросы к БД остаются в потоке запроса.
+
+Лимиты действуют в пределах процесса: при N процессах сервера одновременно хешируется до
+N * PASSWORD_HASH_WORKERS паролей. Поэтому по умолчанию PASSWORD_HASH_WORKERS — ядра,
+делённые на WEB_CONCURRENCY (число процессов сервера).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+
+
+class HashPoolBusy(Exception):
+    """Очередь на хеширование заполнена."""
+
+
+class HashPool:
+    """Пул одного процесса: workers потоков хеширования и queue мест в очереди."""
+
+    def __init__(self, workers: int, queue: int):
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="password-hash") if workers else None
+        self.slots = threading.BoundedSemaphore(workers + queue) if workers else None
+
+    def run(self, func, *args):
+        if self.executor is None:
+            return func(*args)
+        if not self.slots.acquire(blocking=False):
+            raise HashPoolBusy()
+        try:
+            return self.executor.submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+    def make_password(self, raw_password: str) -> str:
+        return self.run(make_password, raw_password)
+
+    def check_password(self, user, raw_password: str) -> bool:
+        """Как User.check_password, но хеш считается в пуле; устаревший хеш пересчитывается и сохраняется."""
+        if not self.run(check_password, raw_password, user.password):
+            return False
+        try:
+            outdated = identify_hasher(user.password).must_update(user.password)
+        except ValueError:
+            outdated = False
+        if outdated:
+            user.password = self.make_password(raw_password)
+            user.save(update_fields=["password"])
+        return True
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hash_pool() -> HashPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HashPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE)
+        return _pool
@@ -0,0 +1,106 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIRequestFactory
+
+from apps.routes.views import FormDataView
+from apps.users import hashing
+from apps.users.views import LoginView
+
+BENCH_PASSWORD = "bench-login-pass"
+
+
+def bench_email(i: int) -> str:
+    return f"bench-login-{i}@example.com"
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк всплеска логинов: пропускная способность входа и задержка соседнего лёгкого "
+        "эндпоинта (api/route/form/) при хешировании в потоке запроса и в ограниченном пуле. "
+        "Создаёт пользователей bench-login-* в текущей БД"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--logins", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=32, help="Одновременных запросов на вход")
+        parser.add_argument(
+            "--workers", type=int, nargs="+", default=[0, 2],
+            help="Размеры пула хеширования для сравнения; 0 — хешировать в потоке запроса",
+        )
+        parser.add_argument("--cleanup", action="store_true", help="Удалить пользователей bench-login-* и выйти")
+
+    def handle(self, *args, **options):
+        if options["cleanup"]:
+            User.objects.filter(username__startswith="bench-login-").delete()
+            self.stdout.write("bench-login-* удалены")
+            return
+        self.ensure_users(options["users"])
+
+        self.stdout.write(
+            f'{"workers":>8} {"logins/s":>9} {"login p50":>10} {"login p95":>10} '
+            f'{"probe p50":>10} {"probe p95":>10} {"503":>5}'
+        )
+        for workers in options["workers"]:
+            # очередь с запасом: в бенчмарке меряем задержки, а не отказы
+            hashing._pool = hashing.HashPool(workers, options["logins"])
+            self.run(workers, options)
+        hashing._pool = None
+
+    def run(self, workers: int, options):
+        factory = APIRequestFactory()
+        login_view, probe_view = LoginView.as_view(), FormDataView.as_view()
+        login_ms, probe_ms, busy = [], [], []
+        done = threading.Event()
+
+        def login(i):
+            request = factory.post(
+                "/api/auth/login", {"email": bench_email(i % options["users"]), "password": BENCH_PASSWORD},
+                format="json",
+            )
+            started = time.perf_counter()
+            try:
+                response = login_view(request)
+            finally:
+                connection.close()
+            login_ms.append((time.perf_counter() - started) * 1000)
+            if response.status_code == 503:
+                busy.append(i)
+
+        def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                probe_view(factory.get("/api/route/form/"))
+                probe_ms.append((time.perf_counter() - started) * 1000)
+                time.sleep(0.01)
+            connection.close()
+
+        prober = threading.Thread(target=probe)
+        prober.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as executor:
+            list(executor.map(login, range(options["logins"])))
+        elapsed = time.perf_counter() - started
+        done.set()
+        prober.join()
+
+        self.stdout.write(
+            f"{workers:>8} {options['logins'] / elapsed:>9.1f} {np.median(login_ms):>10.1f} "
+            f"{np.percentile(login_ms, 95):>10.1f} {np.median(probe_ms):>10.1f} "
+            f"{np.percentile(probe_ms, 95):>10.1f} {len(busy):>5}"
+        )
+
+    def ensure_users(self, count: int) -> None:
+        # один хеш на всех: создание пользователей не должно занимать весь бенчмарк
+        password = make_password(BENCH_PASSWORD)
+        User.objects.bulk_create(
+            [User(username=bench_email(i), email=bench_email(i), password=password) for i in range(count)],
+            ignore_conflicts=True,
+        )
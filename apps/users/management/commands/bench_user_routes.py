@@ -0,0 +1,83 @@
+import time
+import uuid
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.routes.models import Route
+from apps.users.pagination import encode_cursor
+from apps.users.views import UserRoutesListView
+
+BENCH_USERNAME = "bench-routes"
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк списка маршрутов пользователя: страница N через offset против курсора. "
+        "Создаёт пользователя bench-routes с --routes маршрутами (пишет в текущую БД)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--routes", type=int, default=100_000)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000, 4999])
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument("--status", help="Фильтр по статусу, как в ?status=")
+        parser.add_argument("--light", action="store_true", help="fields=light")
+        parser.add_argument("--cleanup", action="store_true", help="Удалить пользователя bench-routes и выйти")
+
+    def handle(self, *args, **options):
+        if options["cleanup"]:
+            User.objects.filter(username=BENCH_USERNAME).delete()
+            self.stdout.write("bench-routes удалён")
+            return
+
+        user = self.ensure_routes(options["routes"])
+        qs = Route.objects.filter(user=user)
+        if options["status"]:
+            qs = qs.filter(status=options["status"])
+        ordered = qs.order_by("-created_at", "-id")
+        total, limit = qs.count(), options["limit"]
+        view = UserRoutesListView.as_view()
+        factory = APIRequestFactory()
+        base = {"limit": limit, **({"status": options["status"]} if options["status"] else {})}
+        if options["light"]:
+            base["fields"] = "light"
+
+        def timed(params) -> float:
+            request = factory.get("/api/user/list/", {**base, **params})
+            force_authenticate(request, user=user)
+            started = time.perf_counter()
+            response = view(request)
+            elapsed = (time.perf_counter() - started) * 1000
+            assert response.status_code == 200, response.data
+            return elapsed
+
+        self.stdout.write(f"{total} маршрутов, limit={limit}")
+        self.stdout.write(f'{"page":>6} {"offset p50":>11} {"cursor p50":>11} {"speedup":>8}')
+        for page in options["pages"]:
+            skip = (page - 1) * limit
+            if skip >= total:
+                continue
+            params = {}
+            if skip:
+                created_at, pk = ordered.values_list("created_at", "id")[skip - 1]
+                params = {"cursor": encode_cursor(created_at, pk)}
+            by_offset = np.median([timed({"offset": skip}) for _ in range(options["runs"])])
+            by_cursor = np.median([timed(params) for _ in range(options["runs"])])
+            self.stdout.write(f"{page:>6} {by_offset:>11.2f} {by_cursor:>11.2f} {by_offset / by_cursor:>7.1f}x")
+
+    def ensure_routes(self, count: int) -> User:
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME, defaults={"email": "bench-routes@example.com"})
+        missing = count - Route.objects.filter(user=user).count()
+        statuses = np.random.default_rng(0).choice(Route.WalkStatus.values, max(missing, 0), p=[0.3, 0.6, 0.1])
+        for start in range(0, max(missing, 0), 5000):
+            Route.objects.bulk_create(
+                Route(id=uuid.uuid4().hex[:12], user=user, total_duration=120, total_cost=500, status=status)
+                for status in statuses[start:start + 5000]
+            )
+        if missing > 0:
+            self.stdout.write(f"Создано {missing} маршрутов для {BENCH_USERNAME}")
+        return user
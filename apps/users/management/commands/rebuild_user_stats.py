@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.users.stats import rebuild_all
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает таблицу статистики пользователей (user_stats) по всем маршрутам"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(
+            f"Статистика пересчитана для {count} пользователей за {time.perf_counter() - started:.1f} s"
+        ))
@@ -0,0 +1,86 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("routes", "0004_routestop"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="route_stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("total_routes", models.PositiveIntegerField(default=0)),
+                ("completed_routes", models.PositiveIntegerField(default=0)),
+                ("active_routes", models.PositiveIntegerField(default=0)),
+                ("cancelled_routes", models.PositiveIntegerField(default=0)),
+                (
+                    "total_duration",
+                    models.BigIntegerField(
+                        default=0, help_text="Суммарное время маршрутов в минутах"
+                    ),
+                ),
+                (
+                    "total_cost",
+                    models.BigIntegerField(
+                        default=0, help_text="Суммарный бюджет маршрутов"
+                    ),
+                ),
+                (
+                    "unique_places",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Сколько разных точек было в маршрутах"
+                    ),
+                ),
+                (
+                    "city_routes",
+                    models.JSONField(
+                        default=dict,
+                        help_text="Число маршрутов по городам: {city_id: n}",
+                    ),
+                ),
+                (
+                    "last_activity",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="Когда создан последний маршрут",
+                        null=True,
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "favourite_city",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="routes.city",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Статистика пользователя",
+                "verbose_name_plural": "Статистика пользователей",
+                "db_table": "user_stats",
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:39
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+
+def fill_stats(apps, schema_editor):
+    """Полный пересчёт user_stats по историческим моделям (копия rebuild_all на момент миграции)."""
+    Route = apps.get_model("routes", "Route")
+    RouteStop = apps.get_model("routes", "RouteStop")
+    UserStats = apps.get_model("users", "UserStats")
+
+    places = dict(
+        RouteStop.objects.filter(route__user__isnull=False)
+        .values("route__user_id")
+        .annotate(n=Count("point_id", distinct=True))
+        .values_list("route__user_id", "n")
+    )
+    cities = {}
+    for user_id, city_id, n in (
+        Route.objects.filter(user__isnull=False, city__isnull=False)
+        .values("user_id", "city_id")
+        .annotate(n=Count("id"))
+        .values_list("user_id", "city_id", "n")
+    ):
+        cities.setdefault(user_id, {})[city_id] = n
+
+    rows = []
+    for row in (
+        Route.objects.filter(user__isnull=False)
+        .values("user_id")
+        .annotate(
+            total_routes=Count("id"),
+            completed_routes=Count("id", filter=Q(status="done")),
+            active_routes=Count("id", filter=Q(status="going")),
+            cancelled_routes=Count("id", filter=Q(status="cancelled")),
+            total_duration=Sum("total_duration"),
+            total_cost=Sum("total_cost"),
+            total_distance_km=Sum("total_distance_km"),
+            last_activity=Max("created_at"),
+        )
+    ):
+        user_id = row.pop("user_id")
+        city_routes = cities.get(user_id, {})
+        favourite = (
+            min(city_routes, key=lambda c: (-city_routes[c], c))
+            if city_routes
+            else None
+        )
+        rows.append(
+            UserStats(
+                user_id=user_id,
+                unique_places=places.get(user_id, 0),
+                city_routes=city_routes,
+                favourite_city_id=favourite,
+                **{
+                    **row,
+                    "total_duration": row["total_duration"] or 0,
+                    "total_cost": row["total_cost"] or 0,
+                    "total_distance_km": row["total_distance_km"] or 0.0,
+                },
+            )
+        )
+    UserStats.objects.all().delete()
+    UserStats.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("routes", "0005_route_polyline_route_total_distance_km"),
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userstats",
+            name="total_distance_km",
+            field=models.FloatField(
+                default=0.0, help_text="Суммарная протяжённость маршрутов, км"
+            ),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:05
+
+from django.db import migrations
+
+
+def check_duplicate_emails(apps, schema_editor):
+    User = apps.get_model("auth", "User")
+    from django.db.models import Count
+    from django.db.models.functions import Lower
+
+    duplicates = list(
+        User.objects.exclude(email="")
+        .annotate(email_lower=Lower("email"))
+        .values("email_lower")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+        .values_list("email_lower", flat=True)[:10]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Перед уникальным индексом email нужно разобраться с дублями: "
+            + ", ".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0002_userstats_total_distance_km"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        # auth_user — таблица contrib.auth, поэтому индекс через SQL; пустые email (админка) не участвуют
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX auth_user_email_lower_uniq ON auth_user (LOWER(email)) WHERE email <> ''",
+            "DROP INDEX auth_user_email_lower_uniq",
+        ),
+    ]
@@ -1,3 +1,32 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class UserStats(models.Model):
+    """Статистика пользователя по маршрутам: обновляется вместе с маршрутами (см. users/stats.py),
+    чтобы профиль читал одну строку вместо агрегатов по всей истории."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="route_stats"
+    )
+    total_routes = models.PositiveIntegerField(default=0)
+    completed_routes = models.PositiveIntegerField(default=0)
+    active_routes = models.PositiveIntegerField(default=0)
+    cancelled_routes = models.PositiveIntegerField(default=0)
+    total_duration = models.BigIntegerField(default=0, help_text="Суммарное время маршрутов в минутах")
+    total_cost = models.BigIntegerField(default=0, help_text="Суммарный бюджет маршрутов")
+    total_distance_km = models.FloatField(default=0.0, help_text="Суммарная протяжённость маршрутов, км")
+    unique_places = models.PositiveIntegerField(default=0, help_text="Сколько разных точек было в маршрутах")
+    city_routes = models.JSONField(default=dict, help_text="Число маршрутов по городам: {city_id: n}")
+    favourite_city = models.ForeignKey(
+        "routes.City", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    last_activity = models.DateTimeField(null=True, blank=True, help_text="Когда создан последний маршрут")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "user_stats"
+        verbose_name = "Статистика пользователя"
+        verbose_name_plural = "Статистика пользователей"
+
+    def __str__(self):
+        return f"Статистика {self.user_id}: {self.total_routes} маршрутов"
@@ -0,0 +1,47 @@
+"""Курсорная (keyset) пагинация по (created_at, id), от новых к старым.
+
+Курсор — непрозрачная строка (base64url от «created_at|id» последней отданной записи);
+следующая страница — записи строго «раньше» неё, поэтому страница N стоит как первая:
+БД идёт по индексу с нужного места, а не пропускает offset строк.
+"""
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk) -> str:
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split("|", 1)
+        created_at = parse_datetime(created_at)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+    if created_at is None or not pk:
+        raise InvalidCursor(cursor)
+    return created_at, pk
+
+
+def keyset_page(qs, cursor: str | None, limit: int):
+    """(записи страницы, курсор следующей страницы или None). qs — без сортировки."""
+    qs = qs.order_by("-created_at", "-id")
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        # created_at <= курсора — граница диапазона для индекса, OR отсекает отданные записи с тем же временем
+        qs = qs.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(id__lt=pk))
+    # лишняя запись показывает, есть ли следующая страница, без отдельного count()
+    rows = list(qs[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].pk)
@@ -1,8 +1,11 @@
 from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
 from rest_framework import serializers
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import UserRefreshToken
+from .hashing import get_hash_pool
 
 User = get_user_model()
 
@@ -21,16 +24,29 @@ class RegisterSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(e.messages)
         return value
 
+    def validate_email(self, value):
+        value = User.objects.normalize_email(value.strip())
+        if User.objects.annotate(email_lower=Lower("email")).filter(email_lower=value.lower()).exists():
+            raise serializers.ValidationError("Пользователь с таким email уже зарегистрирован")
+        return value
+
     def create(self, validated_data):
-        user = User.objects.create_user(
+        user = User(
             username=validated_data["email"],  # используем email как username
             email=validated_data["email"],
-            password=validated_data["password"],
         )
+        # хеш считается в пуле, как и при логине
+        user.password = get_hash_pool().make_password(validated_data["password"])
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError:
+            # параллельная регистрация с тем же email прошла validate_email раньше нас
+            raise serializers.ValidationError({"email": ["Пользователь с таким email уже зарегистрирован"]})
         return user
 
     def to_representation(self, instance):
-        refresh = RefreshToken.for_user(instance)
+        refresh = UserRefreshToken.for_user(instance)
         return {
             "status": "success",
             "data": {
@@ -48,16 +64,12 @@ class LoginSerializer(serializers.Serializer):
         email = attrs.get("email")
         password = attrs.get("password")
 
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            raise serializers.ValidationError("Invalid credentials")
-
-        user = authenticate(username=user.username, password=password)
+        # EmailBackend: один запрос по индексу email, пароль — в пуле хеширования
+        user = authenticate(self.context.get("request"), email=email, password=password)
         if not user:
             raise serializers.ValidationError("Invalid credentials")
 
-        refresh = RefreshToken.for_user(user)
+        refresh = UserRefreshToken.for_user(user)
         return {
             "status": "success",
             "data": {
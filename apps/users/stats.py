@@ -0,0 +1,169 @@
+"""Поддержка UserStats: инкрементальные правки вместе с маршрутами и полный пересчёт.
+
+Правки вызываются внутри транзакции, которая меняет маршрут, и берут строку статистики
+под select_for_update — параллельные маршруты одного пользователя не теряют обновления.
+Всё, что меняет маршруты в обход этих функций (админка, ручные правки в БД), чинит
+rebuild_all (команда rebuild_user_stats).
+"""
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+
+from .models import UserStats
+
+# Поля, которые rebuild_all перезаписывает у существующих строк
+REBUILT_FIELDS = [
+    "total_routes", "completed_routes", "active_routes", "cancelled_routes", "total_duration", "total_cost",
+    "total_distance_km", "unique_places", "city_routes", "favourite_city", "last_activity", "updated_at",
+]
+# Поле-счётчик для каждого статуса маршрута
+STATUS_FIELDS = {
+    "going": "active_routes",
+    "done": "completed_routes",
+    "cancelled": "cancelled_routes",
+}
+
+
+def _locked(user_id) -> UserStats:
+    stats, _ = UserStats.objects.select_for_update().get_or_create(user_id=user_id)
+    return stats
+
+
+def _favourite(city_routes: dict):
+    """Город с наибольшим числом маршрутов; при равенстве — с меньшим id, чтобы выбор был стабильным."""
+    counts = {city_id: n for city_id, n in city_routes.items() if n > 0}
+    if not counts:
+        return None
+    return min(counts, key=lambda city_id: (-counts[city_id], city_id))
+
+
+def _places_delta(user_id, route_id, before: set, after: set) -> int:
+    """На сколько меняется число разных точек пользователя, если у маршрута точки before стали after."""
+    from apps.routes.models import RouteStop
+
+    added, removed = after - before, before - after
+    if not added and not removed:
+        return 0
+    elsewhere = set(
+        RouteStop.objects.filter(route__user_id=user_id, point_id__in=added | removed)
+        .exclude(route_id=route_id)
+        .values_list("point_id", flat=True)
+        .distinct()
+    )
+    return len(added - elsewhere) - len(removed - elsewhere)
+
+
+def route_created(route, point_ids) -> None:
+    """Новый маршрут: счётчики, суммы, город и новые для пользователя точки."""
+    if route.user_id is None:
+        return
+    with transaction.atomic():
+        stats = _locked(route.user_id)
+        stats.total_routes += 1
+        field = STATUS_FIELDS[route.status]
+        setattr(stats, field, getattr(stats, field) + 1)
+        stats.total_duration += route.total_duration or 0
+        stats.total_cost += route.total_cost or 0
+        stats.total_distance_km += route.total_distance_km or 0.0
+        stats.unique_places += _places_delta(route.user_id, route.id, set(), set(point_ids))
+        if route.city_id:
+            stats.city_routes[route.city_id] = stats.city_routes.get(route.city_id, 0) + 1
+            stats.favourite_city_id = _favourite(stats.city_routes)
+        if stats.last_activity is None or route.created_at > stats.last_activity:
+            stats.last_activity = route.created_at
+        stats.save()
+
+
+def route_status_changed(route, old_status: str) -> None:
+    if route.user_id is None or old_status == route.status:
+        return
+    with transaction.atomic():
+        stats = _locked(route.user_id)
+        old_field, new_field = STATUS_FIELDS[old_status], STATUS_FIELDS[route.status]
+        setattr(stats, old_field, max(getattr(stats, old_field) - 1, 0))
+        setattr(stats, new_field, getattr(stats, new_field) + 1)
+        stats.save(update_fields=[old_field, new_field, "updated_at"])
+
+
+def route_edited(
+    route, old_duration: int, old_cost: int | None, old_distance_km: float, old_point_ids, point_ids
+) -> None:
+    """Правка состава маршрута: суммы и уникальные точки."""
+    if route.user_id is None:
+        return
+    with transaction.atomic():
+        stats = _locked(route.user_id)
+        stats.total_duration += (route.total_duration or 0) - (old_duration or 0)
+        stats.total_cost += (route.total_cost or 0) - (old_cost or 0)
+        stats.total_distance_km += (route.total_distance_km or 0.0) - (old_distance_km or 0.0)
+        stats.unique_places += _places_delta(route.user_id, route.id, set(old_point_ids), set(point_ids))
+        stats.save(update_fields=[
+            "total_duration", "total_cost", "total_distance_km", "unique_places", "updated_at",
+        ])
+
+
+def rebuild_all() -> int:
+    """Пересчёт всей таблицы тремя агрегирующими запросами; возвращает число строк.
+
+    Строки статистики берутся под select_for_update до агрегатов, а записываются upsert'ом:
+    параллельная правка (route_created и др.) ждёт блокировку и добавляет свой маршрут уже
+    к пересчитанным значениям, либо её маршрут уже закоммичен и попал в агрегаты.
+    """
+    with transaction.atomic():
+        locked = set(UserStats.objects.select_for_update().values_list("pk", flat=True))
+        return _rebuild_locked(locked)
+
+
+def _rebuild_locked(locked: set) -> int:
+    from apps.routes.models import Route, RouteStop
+
+    totals = (
+        Route.objects.filter(user__isnull=False)
+        .values("user_id")
+        .annotate(
+            total_routes=Count("id"),
+            completed_routes=Count("id", filter=Q(status="done")),
+            active_routes=Count("id", filter=Q(status="going")),
+            cancelled_routes=Count("id", filter=Q(status="cancelled")),
+            last_activity=Max("created_at"),
+            total_duration=Sum("total_duration"),
+            total_cost=Sum("total_cost"),
+            total_distance_km=Sum("total_distance_km"),
+        )
+    )
+    places = dict(
+        RouteStop.objects.filter(route__user__isnull=False)
+        .values("route__user_id")
+        .annotate(n=Count("point_id", distinct=True))
+        .values_list("route__user_id", "n")
+    )
+    cities = {}
+    for user_id, city_id, n in (
+        Route.objects.filter(user__isnull=False, city__isnull=False)
+        .values("user_id", "city_id")
+        .annotate(n=Count("id"))
+        .values_list("user_id", "city_id", "n")
+    ):
+        cities.setdefault(user_id, {})[city_id] = n
+
+    rows = []
+    for row in totals:
+        user_id = row.pop("user_id")
+        city_routes = cities.get(user_id, {})
+        rows.append(UserStats(
+            user_id=user_id,
+            unique_places=places.get(user_id, 0),
+            city_routes=city_routes,
+            favourite_city_id=_favourite(city_routes),
+            **{
+                **row,
+                "total_duration": row["total_duration"] or 0,
+                "total_cost": row["total_cost"] or 0,
+                "total_distance_km": row["total_distance_km"] or 0.0,
+            },
+        ))
+    UserStats.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True, unique_fields=["user"], update_fields=REBUILT_FIELDS,
+    )
+    # удаляем только заблокированные нами строки пользователей, у которых маршрутов не осталось
+    UserStats.objects.filter(pk__in=locked - {row.user_id for row in rows}).delete()
+    return len(rows)
@@ -1,3 +1,216 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.routes.generator.generator import generate_route
+from apps.routes.generator.route_cache import route_cache
+from apps.routes.models import Route
+from apps.routes.tests import CityPointsMixin
+from . import hashing
+from .authentication import ClaimsJWTAuthentication, UserRefreshToken, user_state
+from .models import UserStats
+from .serializers import RegisterSerializer
+from .stats import rebuild_all
+
+STATS_FIELDS = (
+    "total_routes", "completed_routes", "active_routes", "cancelled_routes",
+    "total_duration", "total_cost", "total_distance_km", "unique_places", "city_routes", "favourite_city_id", "last_activity",
+)
+
+
+class UserStatsTests(CityPointsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        route_cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def snapshot(self):
+        return UserStats.objects.filter(user=self.user).values(*STATS_FIELDS).first()
+
+    def test_incremental_stats_match_rebuild(self):
+        first = generate_route("moscow", "day", ["parks"], ["relax"], None, "on_foot", 90, "", self.user)
+        second = generate_route("moscow", "day", ["food"], ["relax"], None, "on_foot", 150, "", self.user)
+        self.client.post("/api/route/edit-status/", {"route_id": first["route_id"], "status": "done"}, format="json")
+        self.client.post("/api/route/cancel/", {"route_id": second["route_id"], "reason": "дождь"}, format="json")
+        self.client.post(
+            "/api/route/edit/", {"route_id": second["route_id"], "action": "remove",
+                                 "point_id": second["points"][0]["id"]}, format="json"
+        )
+
+        incremental = self.snapshot()
+        self.assertEqual(incremental["total_routes"], 2)
+        self.assertEqual(incremental["completed_routes"], 1)
+        self.assertEqual(incremental["cancelled_routes"], 1)
+        self.assertEqual(incremental["active_routes"], 0)
+        self.assertEqual(incremental["favourite_city_id"], "moscow")
+        self.assertGreater(incremental["total_distance_km"], 0)
+
+        rebuild_all()
+        rebuilt = self.snapshot()
+        # сумма по шагам и SUM() в БД складывают float в разном порядке
+        self.assertAlmostEqual(rebuilt.pop("total_distance_km"), incremental.pop("total_distance_km"), places=6)
+        self.assertEqual(rebuilt, incremental)
+
+        with self.assertNumQueries(1):
+            data = self.client.get("/api/user/statistic/").data["data"]
+        self.assertEqual(data["total_routes"], 2)
+        self.assertEqual(data["favourite_city"], self.city.name)
+
+    def test_rebuild_fixes_stale_rows_in_place(self):
+        generate_route("moscow", "day", ["parks"], ["relax"], None, "on_foot", 90, "", self.user)
+        idle = User.objects.create_user("idle", "idle@example.com", "pass12345")
+        UserStats.objects.create(user=idle, total_routes=3)
+        UserStats.objects.filter(user=self.user).update(total_routes=7, total_cost=1)
+
+        self.assertEqual(rebuild_all(), 1)
+        self.assertEqual(self.snapshot()["total_routes"], 1)
+        self.assertEqual(self.snapshot()["total_cost"], Route.objects.get(user=self.user).total_cost)
+        self.assertFalse(UserStats.objects.filter(user=idle).exists())
+
+    def test_user_without_routes_gets_zeros(self):
+        other = User.objects.create_user("idle", "idle@example.com", "pass12345")
+        self.client.force_authenticate(other)
+        data = self.client.get("/api/user/statistic/").data["data"]
+        self.assertEqual(data["total_routes"], 0)
+        self.assertIsNone(data["favourite_city"])
+
+
+class UserRoutesListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("lister", "lister@example.com", "pass12345")
+        Route.objects.bulk_create(
+            Route(id=f"r{i:03d}", user=cls.user, total_duration=60, status="done" if i % 3 else "going")
+            for i in range(45)
+        )
+        # половина маршрутов с одинаковым временем — порядок внутри решает id
+        now = timezone.now()
+        for i in range(0, 45, 2):
+            Route.objects.filter(id=f"r{i:03d}").update(created_at=now - timedelta(minutes=i))
+        Route.objects.filter(id__in=[f"r{i:03d}" for i in range(1, 45, 2)]).update(
+            created_at=now - timedelta(hours=1)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def pages(self, **params):
+        ids, cursor = [], None
+        while True:
+            query = {**params, **({"cursor": cursor} if cursor else {})}
+            body = self.client.get("/api/user/list/", query).data
+            ids.extend(r["route_id"] for r in body["data"])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                return ids
+
+    def test_cursor_walks_all_routes_once_in_order(self):
+        expected = list(
+            Route.objects.filter(user=self.user).order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(self.pages(limit=20), expected)
+        self.assertEqual(self.pages(limit=7, status="going"), [i for i in expected if int(i[1:]) % 3 == 0])
+
+    def test_light_fields_and_validation(self):
+        row = self.client.get("/api/user/list/", {"fields": "light", "limit": 1}).data["data"][0]
+        self.assertNotIn("description", row)
+        for params in ({"limit": "x"}, {"limit": 0}, {"cursor": "!!"}, {"status": "lost"}):
+            self.assertEqual(self.client.get("/api/user/list/", params).status_code, 400)
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        user_state.clear()
+        self.user = User.objects.create_user("claims", "claims@example.com", "pass12345", is_staff=True)
+        self.access = str(UserRefreshToken.for_user(self.user).access_token)
+
+    def authenticate(self):
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_user_from_claims_without_queries(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            self.assertEqual((user.id, user.is_staff, user.is_authenticated), (self.user.id, True, True))
+        # остальные поля — одним запросом при первом обращении
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "claims@example.com")
+            self.assertIsInstance(user, User)
+
+    def test_token_without_staff_claim_uses_user_row(self):
+        self.access = str(RefreshToken.for_user(self.user).access_token)
+        self.assertTrue(self.authenticate().is_staff)
+        User.objects.filter(pk=self.user.pk).update(is_staff=False)
+        user_state.clear()
+        self.assertFalse(self.authenticate().is_staff)
+
+    def test_revocation_through_user_state(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        self.assertEqual(client.get("/api/system/metrics/").status_code, 200)
+        self.assertEqual(client.get("/api/user").data["data"]["email"], "claims@example.com")
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=False)
+        user_state.clear()
+        self.assertEqual(client.get("/api/system/metrics/").status_code, 403)
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+class EmailLoginTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        response = self.client.post(
+            "/api/auth/register", {"email": "Walker@Example.com", "password": "long-pass-123"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def login(self, email, password="long-pass-123"):
+        return self.client.post("/api/auth/login", {"email": email, "password": password}, format="json")
+
+    def test_login_by_email_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.login("walker@example.COM")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.data["data"])
+        self.assertEqual(self.login("walker@example.com", "wrong-pass").status_code, 400)
+        self.assertEqual(self.login("nobody@example.com").status_code, 400)
+
+    def test_duplicate_email_is_rejected(self):
+        response = self.client.post(
+            "/api/auth/register", {"email": "walker@example.com", "password": "long-pass-123"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_concurrent_registration_with_same_email_is_rejected(self):
+        serializer = RegisterSerializer(data={"email": "racer@example.com", "password": "long-pass-123"})
+        self.assertTrue(serializer.is_valid())
+        # другой запрос успел зарегистрировать тот же email после нашей проверки
+        User.objects.create_user("racer", "Racer@Example.com", "long-pass-123")
+        with self.assertRaises(serializers.ValidationError) as raised:
+            serializer.save()
+        self.assertIn("email", raised.exception.detail)
+        self.assertEqual(User.objects.filter(email__iexact="racer@example.com").count(), 1)
 
-# Create your tests here.
+    def test_full_hash_pool_answers_503(self):
+        busy = hashing.HashPool(1, 0)
+        busy.slots.acquire()
+        saved, hashing._pool = hashing._pool, busy
+        try:
+            response = self.login("walker@example.com")
+        finally:
+            hashing._pool = saved
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
@@ -1,12 +1,30 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework import status, permissions
+from rest_framework import serializers, status, permissions
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
 from .serializers import RegisterSerializer, LoginSerializer, UserSerializer
-from ..routes.models import Route,Point
-from django.db.models import Sum, Count, Max
+from ..routes.models import Route
+from .models import UserStats
+from .hashing import HashPoolBusy
+from .pagination import InvalidCursor, keyset_page
+
+# Размер страницы списка маршрутов по умолчанию и максимальный
+ROUTES_PAGE_DEFAULT = 20
+ROUTES_PAGE_MAX = 100
+# Поля облегчённого списка (fields=light) — все есть в индексе routes_user_status_created
+LIGHT_FIELDS = ("id", "status", "created_at", "total_duration", "total_cost", "total_distance_km")
+# Через сколько секунд повторить вход, если пул хеширования паролей занят
+HASH_POOL_RETRY_AFTER = 1
+
+def hash_pool_busy() -> Response:
+    return Response(
+        {"status": "error", "message": "Сервис входа перегружен, повторите попытку"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(HASH_POOL_RETRY_AFTER)},
+    )
+
 
 class RegisterView(APIView):
     permission_classes = [AllowAny]
@@ -14,7 +32,12 @@ class RegisterView(APIView):
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
+            try:
+                user = serializer.save()
+            except HashPoolBusy:
+                return hash_pool_busy()
+            except serializers.ValidationError as e:
+                return Response({"status": "error", "errors": e.detail}, status=status.HTTP_400_BAD_REQUEST)
             return Response(serializer.to_representation(user), status=status.HTTP_200_OK)
         return Response({"status": "error", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -23,8 +46,12 @@ class LoginView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
-        serializer = LoginSerializer(data=request.data)
-        if serializer.is_valid():
+        serializer = LoginSerializer(data=request.data, context={"request": request})
+        try:
+            valid = serializer.is_valid()
+        except HashPoolBusy:
+            return hash_pool_busy()
+        if valid:
             return Response(serializer.validated_data, status=status.HTTP_200_OK)
         return Response(
             {"status": "error", "errors": serializer.errors},
@@ -68,26 +95,68 @@ class UserView(APIView):
 
 
 class UserRoutesListView(APIView):
+    """Маршруты пользователя от новых к старым, по курсору: ?cursor=<next_cursor из прошлого ответа>.
+
+    fields=light — только поля из индекса (route_id, status, created_at и итоги), без описания.
+    offset оставлен для старых клиентов: глубокие страницы через него медленные.
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         status_filter = request.query_params.get("status")
-        limit = int(request.query_params.get("limit", 20))
-        offset = int(request.query_params.get("offset", 0))
-
-        qs = Route.objects.filter(user=request.user).order_by("-created_at")
+        cursor = request.query_params.get("cursor")
+        light = request.query_params.get("fields") == "light"
+        try:
+            limit = int(request.query_params.get("limit", ROUTES_PAGE_DEFAULT))
+            offset = int(request.query_params.get("offset", 0))
+        except ValueError:
+            return Response(
+                {"status": "error", "message": "limit и offset должны быть целыми числами"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 1 <= limit <= ROUTES_PAGE_MAX or offset < 0:
+            return Response(
+                {"status": "error", "message": f"limit — от 1 до {ROUTES_PAGE_MAX}, offset — не меньше 0"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if status_filter and status_filter not in Route.WalkStatus.values:
+            return Response(
+                {"status": "error", "message": f"Недопустимый статус: {status_filter}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
+        qs = Route.objects.filter(user_id=request.user.id)
         if status_filter:
             qs = qs.filter(status=status_filter)
-
-        routes = qs[offset:offset+limit]
+        if light:
+            qs = qs.only(*LIGHT_FIELDS)
+
+        if offset and not cursor:
+            routes = list(qs.order_by("-created_at", "-id")[offset:offset + limit])
+            next_cursor = None
+        else:
+            try:
+                routes, next_cursor = keyset_page(qs, cursor, limit)
+            except InvalidCursor:
+                return Response(
+                    {"status": "error", "message": "Некорректный cursor"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
         data = [
             {
+                "route_id": r.id,
+                "total_duration": r.total_duration,
+                "total_cost": r.total_cost,
+                "total_distance_km": r.total_distance_km,
+                "status": r.status,
+                "created_at": r.created_at.isoformat(),
+            } if light else {
                 "route_id": r.id,
                 "description": r.description,
                 "total_duration": r.total_duration,
                 "total_cost": r.total_cost,
+                "total_distance_km": r.total_distance_km,
                 "status": r.status,
                 "created_at": r.created_at.isoformat(),
                 "updated_at": r.updated_at.isoformat() if hasattr(r, "updated_at") else None,
@@ -95,49 +164,31 @@ class UserRoutesListView(APIView):
             for r in routes
         ]
 
-        return Response({"status": "success", "data": data}, status=status.HTTP_200_OK)
+        return Response(
+            {"status": "success", "data": data, "next_cursor": next_cursor}, status=status.HTTP_200_OK
+        )
 
 
 class UserStatisticsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        qs = Route.objects.filter(user=request.user)
-
-        total_routes = qs.count()
-        completed_routes = qs.filter(status="done").count()
-        active_routes = qs.filter(status="going").count()
-
-        total_duration = qs.aggregate(Sum("total_duration"))["total_duration__sum"] or 0
-        total_cost = qs.aggregate(Sum("total_cost"))["total_cost__sum"] or 0
-        last_activity = qs.aggregate(Max("created_at"))["created_at__max"]
-
-        # Уникальные места (по id точек)
-        unique_places = Point.objects.filter(route__user=request.user).values("id").distinct().count()
-
-        # Протяжённость маршрутов (если в модели Point есть координаты lat/lng)
-        # Здесь можно вставить функцию расчёта расстояния по координатам
-        total_distance_km = 0.0  # пока заглушка
-
-        # Любимый город (где больше всего маршрутов)
-        favourite_city = (
-            qs.values("city__name")
-              .annotate(cnt=Count("id"))
-              .order_by("-cnt")
-              .first()
+        # одна строка по первичному ключу; поддерживается в users/stats.py вместе с маршрутами
+        stats = (
+            UserStats.objects.select_related("favourite_city").filter(user_id=request.user.id).first()
+            or UserStats(user_id=request.user.id)
         )
-        favourite_city_name = favourite_city["city__name"] if favourite_city else None
 
         data = {
-            "total_routes": total_routes,
-            "completed_routes": completed_routes,
-            "active_routes": active_routes,
-            "total_duration_minutes": total_duration,
-            "total_distance_km": total_distance_km,
-            "total_cost": total_cost,
-            "unique_places": unique_places,
-            "favourite_city": favourite_city_name,
-            "last_activity": last_activity.isoformat() if last_activity else None,
+            "total_routes": stats.total_routes,
+            "completed_routes": stats.completed_routes,
+            "active_routes": stats.active_routes,
+            "total_duration_minutes": stats.total_duration,
+            "total_distance_km": round(stats.total_distance_km, 2),
+            "total_cost": stats.total_cost,
+            "unique_places": stats.unique_places,
+            "favourite_city": stats.favourite_city.name if stats.favourite_city else None,
+            "last_activity": stats.last_activity.isoformat() if stats.last_activity else None,
         }
 
-        return Response({"status": "success", "data": data}, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response({"status": "success", "data": data}, status=status.HTTP_200_OK)
@@ -36,7 +36,47 @@ CACHES = {
     }
 }
 GEOAPIFY_API_KEY=config('GEOAPIFY_API_KEY')
-OPENAI_API_KEY=config('OPENAI_API_KEY')
+OPENAI_API_KEY=config('OPENAI_API_KEY', default='')
+
+# Индексы ближайших соседей по эмбеддингам точек (apps/core/ann.py)
+ANN_INDEX_DIR = config('ANN_INDEX_DIR', default=str(BASE_DIR / 'var' / 'ann'))
+# Загружать индексы всех городов при старте процесса (CoreConfig.ready), а не при первом поиске
+ANN_PRELOAD = config('ANN_PRELOAD', default=False, cast=bool)
+# mmap-хранилище float32-матрицы эмбеддингов (apps/core/embedding_store.py)
+EMBEDDING_STORE_DIR = config('EMBEDDING_STORE_DIR', default=str(BASE_DIR / 'var' / 'embeddings'))
+# Как хранить вектора в ANN-индексах: float32 | float16 | int8 | pca (apps/core/quantization.py)
+EMBEDDING_COMPACT_MODE = config('EMBEDDING_COMPACT_MODE', default='float32')
+# Пешеходные графы городов и таблицы расстояний между точками (apps/routes/generator/roads.py)
+ROAD_GRAPH_DIR = config('ROAD_GRAPH_DIR', default=str(BASE_DIR / 'var' / 'roads'))
+# Провайдер эмбеддингов: openai | hashing (локальная модель без сети) | fake (apps/core/embeddings.py)
+EMBEDDING_PROVIDER = config('EMBEDDING_PROVIDER', default='openai')
+EMBEDDING_MODEL = config('EMBEDDING_MODEL', default='text-embedding-3-small')
+EMBEDDING_DIM = config('EMBEDDING_DIM', default=1536, cast=int)
+# Постоянный кеш эмбеддингов по sha256(model + text); пустой путь — только кеш в памяти
+EMBEDDING_CACHE_PATH = config('EMBEDDING_CACHE_PATH', default=str(BASE_DIR / 'var' / 'embedding_cache.sqlite3'))
+EMBEDDING_CACHE_MAX_MB = config('EMBEDDING_CACHE_MAX_MB', default=512, cast=int)
+EMBEDDING_MEMORY_CACHE_SIZE = config('EMBEDDING_MEMORY_CACHE_SIZE', default=10000, cast=int)
+# Файлы блокировок для схлопывания одинаковых вычислений между воркерами (apps/core/singleflight.py);
+# пустой путь — только внутри процесса
+SINGLEFLIGHT_DIR = config('SINGLEFLIGHT_DIR', default=str(BASE_DIR / 'var' / 'singleflight'))
+# Асинхронная генерация маршрутов (задачи route-generate для run_jobs): режим по умолчанию,
+# сколько незавершённых генераций у одного пользователя, предел очереди, максимум long-poll, с
+# (long-poll занимает синхронный воркер — держим его коротким)
+ROUTE_GENERATION_ASYNC = config('ROUTE_GENERATION_ASYNC', default=False, cast=bool)
+ROUTE_JOBS_PER_USER = config('ROUTE_JOBS_PER_USER', default=2, cast=int)
+ROUTE_JOBS_MAX_QUEUE = config('ROUTE_JOBS_MAX_QUEUE', default=500, cast=int)
+ROUTE_JOB_MAX_WAIT = config('ROUTE_JOB_MAX_WAIT', default=2, cast=float)
+
+# Как долго (с) процесс доверяет закешированным is_active/is_staff пользователя при проверке JWT
+JWT_USER_STATE_TTL = config('JWT_USER_STATE_TTL', default=60, cast=float)
+
+# Пул хеширования паролей при логине/регистрации: потоков (0 — хешировать в потоке запроса) и мест в очереди.
+# Пул свой в каждом процессе, поэтому по умолчанию ядра делятся между WEB_CONCURRENCY процессами сервера
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+PASSWORD_HASH_WORKERS = config(
+    'PASSWORD_HASH_WORKERS', default=max((os.cpu_count() or 1) // max(WEB_CONCURRENCY, 1), 1), cast=int
+)
+PASSWORD_HASH_QUEUE = config('PASSWORD_HASH_QUEUE', default=64, cast=int)
 # Application definition
 
 DJANGO_APPS = [
@@ -107,6 +147,12 @@ DATABASES = {
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
+# Вход по email (API) и по username (админка)
+AUTHENTICATION_BACKENDS = [
+    "apps.users.backends.EmailBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.MinimumLengthValidator",
@@ -140,6 +186,9 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Покрывающие индексы (Index.include) работают в PostgreSQL; в SQLite include просто игнорируется
+SILENCED_SYSTEM_CHECKS = ["models.W040"]
+
 CORS_ALLOWED_ORIGINS = config(
     'CORS_ALLOWED_ORIGINS',
     default='http://localhost:3000,http://127.0.0.1:3000',
@@ -147,6 +196,6 @@ CORS_ALLOWED_ORIGINS = config(
 )
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "apps.users.authentication.ClaimsJWTAuthentication",
     ),
 }